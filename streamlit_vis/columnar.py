@@ -0,0 +1,457 @@
+"""
+Columnar, array-backed storage for hierarchical metadata.
+
+Instead of one python dict per leaf and root, every field is stored as one numpy array
+(numbers, booleans) or as an arrow-style string column (one utf-8 buffer plus offsets).
+The hierarchy is stored as a leaf->root index array and CSR-style root->leaf offsets.
+
+The mapping classes ColumnarLeafMeta and ColumnarRootMeta expose the data with the same
+interface as the dict-of-dicts metadata: {leaf_id: {"root_id": root_id, key1: value1, ...}}
+and {root_id: {"leaf_ids": [...], key1: value1, ...}}. Items are created on access and
+should be treated as read-only.
+"""
+import json
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class StringColumn(Sequence):
+    """Arrow-style column of strings: a single utf-8 buffer and an offsets array."""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_values(cls, values: Iterable[str]):
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(data, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._get(i) for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError(f"Index {item} out of range for column of length {len(self)}")
+        return self._get(item)
+
+    def _get(self, num: int) -> str:
+        return self.data[self.offsets[num]:self.offsets[num + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        data = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield data[start:end].decode("utf-8")
+
+    def take(self, nums: np.ndarray):
+        """Create a new column with the entries at positions nums."""
+        starts = self.offsets[nums]
+        lengths = self.offsets[nums + 1] - starts
+        new_offsets = np.zeros(len(nums) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_offsets[1:])
+        gather = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+        return StringColumn(self.data[gather], new_offsets)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes
+
+
+def create_column(values: List):
+    """Pick the most compact column type that can represent all values."""
+    if all(isinstance(value, str) for value in values):
+        return StringColumn.from_values(values)
+    if all(isinstance(value, bool) for value in values):
+        return np.array(values, dtype=bool)
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            pass
+    elif all(isinstance(value, (int, float)) and not isinstance(value, bool)
+             for value in values):
+        return np.array(values, dtype=np.float64)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _get_value(column, num: int):
+    value = column[num]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _take_column(column, nums: np.ndarray):
+    if isinstance(column, StringColumn):
+        return column.take(nums)
+    return column[nums]
+
+
+def group_by_root(leaf_root: np.ndarray):
+    """
+    Args:
+        leaf_root: root position for each selected leaf
+
+    Returns:
+        root_nums: unique root positions, in the order of their first leaf
+        new_leaf_root: for each selected leaf, the index of its root in root_nums
+    """
+    unique_root_nums, first_index = np.unique(leaf_root, return_index=True)
+    order = np.argsort(first_index, kind="stable")
+    root_nums = unique_root_nums[order]
+    new_root_num = np.empty_like(order)
+    new_root_num[order] = np.arange(len(order))
+    new_leaf_root = new_root_num[np.searchsorted(unique_root_nums, leaf_root)]
+    return root_nums, new_leaf_root
+
+
+class ColumnTable:
+    """
+    Columns of one level of the hierarchy. Fields that are missing for some items are stored
+    with a presence mask, so the items are reconstructed without those keys.
+    """
+
+    def __init__(self, columns: Dict, masks: Dict[str, np.ndarray]):
+        self.columns = columns
+        self.masks = masks
+
+    @classmethod
+    def from_items(cls, items: List[Dict], skip_keys=()):
+        fields = {}
+        for item in items:
+            for key in item.keys():
+                if key not in skip_keys:
+                    fields[key] = None
+        columns, masks = {}, {}
+        for field in fields:
+            mask = np.array([field in item for item in items], dtype=bool)
+            if mask.all():
+                columns[field] = create_column([item[field] for item in items])
+                continue
+            # store a placeholder of the right type where the field is missing
+            values = [item[field] for item in items if field in item]
+            filler = "" if all(isinstance(value, str) for value in values) else None
+            columns[field] = create_column([item.get(field, filler) for item in items])
+            masks[field] = mask
+        return cls(columns, masks)
+
+    def get_item(self, num: int) -> Dict:
+        item = {}
+        for field, column in self.columns.items():
+            mask = self.masks.get(field)
+            if mask is not None and not mask[num]:
+                continue
+            item[field] = _get_value(column, num)
+        return item
+
+    def take(self, nums: np.ndarray):
+        columns = {field: _take_column(column, nums) for field, column in self.columns.items()}
+        masks = {field: mask[nums] for field, mask in self.masks.items()}
+        return ColumnTable(columns, masks)
+
+    @property
+    def nbytes(self):
+        # for object columns only the pointers are counted, not the referenced objects
+        return (sum(column.nbytes for column in self.columns.values())
+                + sum(mask.nbytes for mask in self.masks.values()))
+
+
+_MISSING = object()
+
+
+class ColumnTableBuilder:
+    """Builds a ColumnTable item by item, without keeping the item dicts in memory.
+    The result is the same as ColumnTable.from_items."""
+
+    def __init__(self, skip_keys=()):
+        self.skip_keys = skip_keys
+        self.values: Dict[str, List] = {}
+        self.n_items = 0
+
+    def append(self, item: Dict):
+        values = self.values
+        for key, value in item.items():
+            if key in self.skip_keys:
+                continue
+            column_values = values.get(key)
+            if column_values is None:
+                column_values = values[key] = [_MISSING] * self.n_items
+            column_values.append(value)
+        self.n_items += 1
+        if len(item) < len(values):
+            for column_values in values.values():
+                if len(column_values) < self.n_items:
+                    column_values.append(_MISSING)
+
+    def build(self) -> ColumnTable:
+        columns, masks = {}, {}
+        for field in list(self.values.keys()):
+            # free the value lists one by one while the columns are created
+            values = self.values.pop(field)
+            mask = np.array([value is not _MISSING for value in values], dtype=bool)
+            if mask.all():
+                columns[field] = create_column(values)
+                continue
+            present = [value for value in values if value is not _MISSING]
+            filler = "" if all(isinstance(value, str) for value in present) else None
+            columns[field] = create_column(
+                    [filler if value is _MISSING else value for value in values])
+            masks[field] = mask
+        return ColumnTable(columns, masks)
+
+
+class ColumnarMeta:
+    """
+    Columnar version of leaf_meta and root_meta.
+
+    Attributes:
+        leaf_ids, root_ids: string columns with the ids in their original order
+        leaf_table, root_table: the remaining fields of each level
+        leaf_root: for each leaf position, the position of its root
+        root_offsets, root_leaf_nums: CSR-style mapping from root position to leaf positions,
+            the leafs of root r are root_leaf_nums[root_offsets[r]:root_offsets[r + 1]]
+            in the order of leaf_meta.
+    """
+
+    def __init__(self, leaf_ids: StringColumn, leaf_table: ColumnTable, leaf_root: np.ndarray,
+                 root_ids: StringColumn, root_table: ColumnTable):
+        self.leaf_ids = leaf_ids
+        self.leaf_table = leaf_table
+        self.leaf_root = leaf_root
+        self.root_ids = root_ids
+        self.root_table = root_table
+        self.root_leaf_nums = np.argsort(leaf_root, kind="stable")
+        self.root_offsets = np.zeros(len(root_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(leaf_root, minlength=len(root_ids)), out=self.root_offsets[1:])
+        self._leaf_key2num: Optional[Dict[str, int]] = None
+        self._root_key2num: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_dicts(cls, leaf_meta, root_meta):
+        """
+        Args:
+            leaf_meta: {leaf_id: {"root_id": root_id, key1: value1, ...}}
+            root_meta: {root_id: {key1: value1, ...}}, the "leaf_ids" field is recomputed
+                from the leaf_meta
+        """
+        root_ids = StringColumn.from_values(str(root_id) for root_id in root_meta.keys())
+        root_key2num = {root_id: num for num, root_id in enumerate(root_ids)}
+        leaf_items = list(leaf_meta.values())
+        leaf_root = np.array([root_key2num[str(item["root_id"])] for item in leaf_items],
+                             dtype=np.int64)
+        leaf_ids = StringColumn.from_values(str(leaf_id) for leaf_id in leaf_meta.keys())
+        leaf_table = ColumnTable.from_items(leaf_items, skip_keys=("root_id",))
+        root_table = ColumnTable.from_items(list(root_meta.values()), skip_keys=("leaf_ids",))
+        columnar = cls(leaf_ids, leaf_table, leaf_root, root_ids, root_table)
+        columnar._root_key2num = root_key2num
+        return columnar
+
+    @classmethod
+    def from_items(cls, leaf_items: Iterable[Tuple[str, Dict]],
+                   root_items: Iterable[Tuple[str, Dict]]):
+        """
+        Same as from_dicts, but consumes (id, item) pairs one by one, e.g. from a streaming
+        json parser, so the dict-of-dicts metadata is never built. The roots are consumed first.
+        """
+        root_ids_list, root_builder = [], ColumnTableBuilder(skip_keys=("leaf_ids",))
+        for root_id, root_item in root_items:
+            root_ids_list.append(str(root_id))
+            root_builder.append(root_item)
+        root_ids = StringColumn.from_values(root_ids_list)
+        root_key2num = {root_id: num for num, root_id in enumerate(root_ids_list)}
+        del root_ids_list
+
+        leaf_ids_list, leaf_root_list = [], []
+        leaf_builder = ColumnTableBuilder(skip_keys=("root_id",))
+        for leaf_id, leaf_item in leaf_items:
+            leaf_ids_list.append(str(leaf_id))
+            leaf_root_list.append(root_key2num[str(leaf_item["root_id"])])
+            leaf_builder.append(leaf_item)
+        leaf_ids = StringColumn.from_values(leaf_ids_list)
+        del leaf_ids_list
+        leaf_root = np.array(leaf_root_list, dtype=np.int64)
+        del leaf_root_list
+
+        columnar = cls(leaf_ids, leaf_builder.build(), leaf_root, root_ids, root_builder.build())
+        columnar._root_key2num = root_key2num
+        return columnar
+
+    @property
+    def leaf_key2num(self) -> Dict[str, int]:
+        if self._leaf_key2num is None:
+            self._leaf_key2num = {leaf_id: num for num, leaf_id in enumerate(self.leaf_ids)}
+        return self._leaf_key2num
+
+    @property
+    def root_key2num(self) -> Dict[str, int]:
+        if self._root_key2num is None:
+            self._root_key2num = {root_id: num for num, root_id in enumerate(self.root_ids)}
+        return self._root_key2num
+
+    @property
+    def leaf_meta(self):
+        return ColumnarLeafMeta(self)
+
+    @property
+    def root_meta(self):
+        return ColumnarRootMeta(self)
+
+    def get_leaf_nums(self, leaf_ids: Iterable[str]) -> np.ndarray:
+        """Sorted, unique leaf positions of the given ids. Unknown ids are ignored."""
+        key2num = self.leaf_key2num
+        nums = [key2num[leaf_id] for leaf_id in map(str, leaf_ids) if leaf_id in key2num]
+        return np.unique(np.array(nums, dtype=np.int64))
+
+    def get_root_leaf_nums(self, root_num: int) -> np.ndarray:
+        return self.root_leaf_nums[self.root_offsets[root_num]:self.root_offsets[root_num + 1]]
+
+    def get_leaf_column(self, field: str):
+        if field == "root_id":
+            return [self.root_ids[num] for num in self.leaf_root]
+        return self.leaf_table.columns[field]
+
+    def get_leaf_item(self, num: int) -> Dict:
+        item = self.leaf_table.get_item(num)
+        item["root_id"] = self.root_ids[self.leaf_root[num]]
+        return item
+
+    def get_root_item(self, num: int) -> Dict:
+        item = self.root_table.get_item(num)
+        item["leaf_ids"] = [self.leaf_ids[leaf_num] for leaf_num in self.get_root_leaf_nums(num)]
+        return item
+
+    def take(self, leaf_nums: np.ndarray):
+        """
+        Create the metadata for a subset of leafs, given their sorted positions.
+        Roots are kept if they have at least one selected leaf, ordered by their first leaf.
+        """
+        leaf_nums = np.asarray(leaf_nums, dtype=np.int64)
+        root_nums, new_leaf_root = group_by_root(self.leaf_root[leaf_nums])
+        return ColumnarMeta(
+                self.leaf_ids.take(leaf_nums), self.leaf_table.take(leaf_nums), new_leaf_root,
+                self.root_ids.take(root_nums), self.root_table.take(root_nums))
+
+    @property
+    def nbytes(self):
+        return (self.leaf_ids.nbytes + self.leaf_table.nbytes + self.leaf_root.nbytes
+                + self.root_ids.nbytes + self.root_table.nbytes
+                + self.root_leaf_nums.nbytes + self.root_offsets.nbytes)
+
+    def __getstate__(self):
+        # the id lookup dicts are large and cheap to rebuild, do not pickle them
+        state = self.__dict__.copy()
+        state["_leaf_key2num"], state["_root_key2num"] = None, None
+        return state
+
+
+class ColumnarLeafMeta(Mapping):
+    """Read-only mapping {leaf_id: {"root_id": root_id, key1: value1, ...}}"""
+
+    def __init__(self, columnar: ColumnarMeta):
+        self.columnar = columnar
+
+    def __getitem__(self, leaf_id):
+        return self.columnar.get_leaf_item(self.columnar.leaf_key2num[leaf_id])
+
+    def __contains__(self, leaf_id):
+        return leaf_id in self.columnar.leaf_key2num
+
+    def __iter__(self):
+        return iter(self.columnar.leaf_ids)
+
+    def __len__(self):
+        return len(self.columnar.leaf_ids)
+
+
+class ColumnarRootMeta(Mapping):
+    """Read-only mapping {root_id: {"leaf_ids": [leaf_id, ...], key1: value1, ...}}"""
+
+    def __init__(self, columnar: ColumnarMeta):
+        self.columnar = columnar
+
+    def __getitem__(self, root_id):
+        return self.columnar.get_root_item(self.columnar.root_key2num[root_id])
+
+    def __contains__(self, root_id):
+        return root_id in self.columnar.root_key2num
+
+    def __iter__(self):
+        return iter(self.columnar.root_ids)
+
+    def __len__(self):
+        return len(self.columnar.root_ids)
+
+
+def _get_label_key(label: Any) -> Hashable:
+    """Key of a label in LabelColumn. Distinguishes labels that compare equal but have different
+    types, e.g. 1 and True. Unhashable labels, e.g. lists of accepted answers, are keyed by their
+    canonical json."""
+    try:
+        hash(label)
+    except TypeError:
+        return type(label), json.dumps(label, sort_keys=True, default=repr)
+    return type(label), label
+
+
+class LabelColumn(Mapping):
+    """
+    Read-only {id: label} stored as integer codes aligned with the positions given by key2num,
+    plus the list of distinct labels. Compact for labels like predictions that repeat often.
+    """
+
+    def __init__(self, codes: np.ndarray, labels: List, key2num: Dict[str, int]):
+        self.codes = codes
+        self.labels = labels
+        self.key2num = key2num
+        self._label2code = {_get_label_key(label): code for code, label in enumerate(labels)}
+
+    @classmethod
+    def empty(cls, key2num: Dict[str, int]):
+        return cls(np.full(len(key2num), -1, dtype=np.int32), [], key2num)
+
+    def set(self, num: int, label: Any):
+        label_key = _get_label_key(label)
+        code = self._label2code.get(label_key)
+        if code is None:
+            code = self._label2code[label_key] = len(self.labels)
+            self.labels.append(label)
+        self.codes[num] = code
+
+    def __getitem__(self, key):
+        code = self.codes[self.key2num[key]]
+        if code < 0:
+            raise KeyError(key)
+        return self.labels[code]
+
+    def get(self, key, default=None):
+        num = self.key2num.get(key)
+        if num is None or self.codes[num] < 0:
+            return default
+        return self.labels[self.codes[num]]
+
+    def __contains__(self, key):
+        num = self.key2num.get(key)
+        return num is not None and self.codes[num] >= 0
+
+    def __iter__(self):
+        codes = self.codes
+        return (key for key, num in self.key2num.items() if codes[num] >= 0)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.codes >= 0))
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
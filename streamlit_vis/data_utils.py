@@ -1,9 +1,18 @@
 from collections import defaultdict
+from collections.abc import Mapping, Sequence
 from copy import deepcopy
+import hashlib
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
 
+import joblib
+import numpy as np
+
+from streamlit_vis.columnar import ColumnarLeafMeta, group_by_root
 from streamlit_vis.joblib_ext import get_joblib_memory
 
-mem = get_joblib_memory(verbose=0)
+# cached arrays are memory-mapped read-only, so they are shared between processes
+mem = get_joblib_memory(verbose=0, mmap_mode="r")
 
 
 def filter_data_given_leaf_ids(
@@ -15,8 +24,14 @@ def filter_data_given_leaf_ids(
         root_meta: {root_id: {key1: value1, ...}}
 
     Returns:
-        updated metadata with only the entries that are related to leaf_ids
+        updated metadata with only the entries that are related to leaf_ids, as copies.
+        Use MetaView to filter without copying.
     """
+    if isinstance(leaf_meta, ColumnarLeafMeta):
+        columnar = leaf_meta.columnar
+        new_columnar = columnar.take(columnar.get_leaf_nums(leaf_ids))
+        return new_columnar.leaf_meta, new_columnar.root_meta
+
     new_leaf_ids = set(leaf_ids)
     new_meta_leaf = {}
     tree = defaultdict(list)
@@ -39,7 +54,346 @@ def filter_data_given_leaf_ids(
     return new_meta_leaf, new_meta_root
 
 
+class MetaIndex:
+    """
+    Positional index over the full metadata. Shared by all MetaView objects of a dataset.
+
+    Attributes:
+        leaf_keys, root_keys: sequences of ids
+        leaf_key2num, root_key2num: {id: position in the sequence}
+        leaf_root: for each leaf position, the position of its root
+    """
+
+    def __init__(self, leaf_meta, root_meta):
+        self.leaf_meta, self.root_meta = leaf_meta, root_meta
+        (self.leaf_keys, self.root_keys, self.leaf_key2num, self.root_key2num
+         ) = get_keys_for_metadata(leaf_meta, root_meta)
+        if isinstance(leaf_meta, ColumnarLeafMeta):
+            self.leaf_root = leaf_meta.columnar.leaf_root
+        else:
+            root_key2num = self.root_key2num
+            self.leaf_root = np.array([root_key2num[str(leaf_item["root_id"])]
+                                       for leaf_item in leaf_meta.values()], dtype=np.int64)
+        self.navigation_index: Optional[NavigationIndex] = None
+
+    def get_navigation_index(self) -> "NavigationIndex":
+        if self.navigation_index is None:
+            # the first leaf of each root is the one with the lowest position
+            leaf_order = np.argsort(self.leaf_root, kind="stable")
+            root_offsets = np.zeros(len(self.root_keys) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.leaf_root, minlength=len(self.root_keys)),
+                      out=root_offsets[1:])
+            self.navigation_index = NavigationIndex(
+                    self.leaf_keys, self.root_keys, self.leaf_key2num, self.leaf_root,
+                    leaf_order[root_offsets[:-1]])
+        return self.navigation_index
+
+    def get_leaf_nums(self, leaf_ids: Iterable[str]) -> np.ndarray:
+        """Sorted, unique leaf positions of the given ids. Unknown ids are ignored."""
+        key2num = self.leaf_key2num
+        nums = [key2num[leaf_id] for leaf_id in map(str, leaf_ids) if leaf_id in key2num]
+        return np.unique(np.array(nums, dtype=np.int64))
+
+    def get_root_nums(self, leaf_nums: np.ndarray) -> np.ndarray:
+        return self.leaf_root[leaf_nums]
+
+    def iter_leaf_field(self, field, leaf_nums: Optional[np.ndarray] = None):
+        """
+        Returns:
+            iterator over (leaf_num, leaf_meta[leaf_id][field]) for all leafs or the given ones
+        """
+        if isinstance(self.leaf_meta, ColumnarLeafMeta):
+            column = self.leaf_meta.columnar.get_leaf_column(field)
+            if leaf_nums is None:
+                return enumerate(column)
+            return ((num, column[num]) for num in leaf_nums.tolist())
+        if leaf_nums is None:
+            return ((num, leaf_item[field])
+                    for num, leaf_item in enumerate(self.leaf_meta.values()))
+        leaf_meta, leaf_keys = self.leaf_meta, self.leaf_keys
+        return ((num, leaf_meta[leaf_keys[num]][field]) for num in leaf_nums.tolist())
+
+
+class MetaView:
+    """
+    Subset of the metadata given by leaf positions, without copying any items.
+    The view stores only index arrays, so creating it costs O(selected) integers.
+
+    Roots are kept if they have at least one selected leaf, ordered by their first leaf,
+    the same as in filter_data_given_leaf_ids.
+
+    leaf_roots can be given if the root positions of the selected leafs are already known,
+    e.g. from the same database query, otherwise they are looked up in the meta_index.
+    """
+
+    def __init__(self, meta_index: MetaIndex, leaf_nums: np.ndarray,
+                 leaf_roots: Optional[np.ndarray] = None):
+        self.meta_index = meta_index
+        self.leaf_nums = np.asarray(leaf_nums, dtype=np.int64)
+        if leaf_roots is None:
+            leaf_roots = meta_index.get_root_nums(self.leaf_nums)
+        # for each leaf in the view, the position of its root in the view
+        self.root_nums, self.view_leaf_root = group_by_root(
+                np.asarray(leaf_roots, dtype=np.int64))
+        # CSR-style mapping from root position in the view to positions in self.leaf_nums
+        self.root_leaf_pos = np.argsort(self.view_leaf_root, kind="stable")
+        self.root_offsets = np.zeros(len(self.root_nums) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.view_leaf_root, minlength=len(self.root_nums)),
+                  out=self.root_offsets[1:])
+        # sorted root positions for lookups by id
+        self.root_nums_order = np.argsort(self.root_nums, kind="stable")
+        self.root_nums_sorted = self.root_nums[self.root_nums_order]
+        self.navigation_index: Optional[NavigationIndex] = None
+
+    @property
+    def leaf_meta(self):
+        return LeafMetaView(self)
+
+    @property
+    def root_meta(self):
+        return RootMetaView(self)
+
+    @property
+    def leaf_keys(self):
+        return ViewKeys(self.meta_index.leaf_keys, self.leaf_nums)
+
+    @property
+    def root_keys(self):
+        return ViewKeys(self.meta_index.root_keys, self.root_nums)
+
+    @property
+    def leaf_key2num(self):
+        return ViewKey2Num(self.leaf_keys, self.meta_index.leaf_key2num, self.leaf_nums)
+
+    @property
+    def root_key2num(self):
+        return ViewKey2Num(self.root_keys, self.meta_index.root_key2num, self.root_nums_sorted,
+                           self.root_nums_order)
+
+    def get_root_leaf_nums(self, root_pos: int) -> np.ndarray:
+        """Leaf positions in the full metadata for the root at position root_pos in the view"""
+        return self.leaf_nums[
+            self.root_leaf_pos[self.root_offsets[root_pos]:self.root_offsets[root_pos + 1]]]
+
+    def iter_leaf_field(self, field):
+        return self.meta_index.iter_leaf_field(field, self.leaf_nums)
+
+    def get_navigation_index(self) -> "NavigationIndex":
+        if self.navigation_index is None:
+            # leafs of a root are in view order, the first one has the lowest position
+            self.navigation_index = NavigationIndex(
+                    self.leaf_keys, self.root_keys, self.leaf_key2num, self.view_leaf_root,
+                    self.root_leaf_pos[self.root_offsets[:-1]])
+        return self.navigation_index
+
+
+class NavigationIndex:
+    """
+    Positions for the First/Prev/Next/Last navigation over the leafs and roots of the metadata
+    or of a view. Built once per view, each navigation step is a few lookups.
+
+    Attributes:
+        leaf_keys, root_keys: ids in the order of the metadata or view
+        leaf_key2num: {leaf_id: position in leaf_keys}
+        leaf_root: for each leaf position, the position of its root in root_keys
+        root_first_leaf: for each root position, the position of its first leaf in leaf_keys
+    """
+
+    def __init__(self, leaf_keys, root_keys, leaf_key2num, leaf_root, root_first_leaf):
+        self.leaf_keys, self.root_keys = leaf_keys, root_keys
+        self.leaf_key2num = leaf_key2num
+        self.leaf_root = leaf_root
+        self.root_first_leaf = root_first_leaf
+
+    def get_leaf_num(self, leaf_id: str) -> Optional[int]:
+        """Position of the leaf, None if it is not in the metadata or view."""
+        try:
+            return self.leaf_key2num[leaf_id]
+        except KeyError:
+            return None
+
+    def get_root_num(self, leaf_num: int) -> int:
+        return int(self.leaf_root[leaf_num])
+
+    def get_leaf_targets(self, leaf_num: int) -> Tuple[Optional[str], ...]:
+        """
+        Returns:
+            ids of the first, previous, next and last leaf, None if there is no such leaf
+            other than the given one
+        """
+        last_num = len(self.leaf_keys) - 1
+        return (self.leaf_keys[0] if leaf_num > 0 else None,
+                self.leaf_keys[leaf_num - 1] if leaf_num > 0 else None,
+                self.leaf_keys[leaf_num + 1] if leaf_num < last_num else None,
+                self.leaf_keys[last_num] if leaf_num < last_num else None)
+
+    def get_root_targets(self, root_num: int) -> Tuple[Optional[str], ...]:
+        """
+        Returns:
+            ids of the first leaf of the first, previous, next and last root, None if there is
+            no such root other than the given one
+        """
+        last_num = len(self.root_keys) - 1
+        return (self._get_first_leaf(0) if root_num > 0 else None,
+                self._get_first_leaf(root_num - 1) if root_num > 0 else None,
+                self._get_first_leaf(root_num + 1) if root_num < last_num else None,
+                self._get_first_leaf(last_num) if root_num < last_num else None)
+
+    def _get_first_leaf(self, root_num: int) -> str:
+        return self.leaf_keys[int(self.root_first_leaf[root_num])]
+
+
+class ViewKeys(Sequence):
+    """Sequence of ids of a MetaView."""
+
+    def __init__(self, all_keys, nums: np.ndarray):
+        self.all_keys = all_keys
+        self.nums = nums
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.all_keys[num] for num in self.nums[item].tolist()]
+        return self.all_keys[int(self.nums[item])]
+
+    def __len__(self):
+        return len(self.nums)
+
+    def __iter__(self):
+        all_keys = self.all_keys
+        return (all_keys[num] for num in self.nums.tolist())
+
+
+class ViewKey2Num(Mapping):
+    """
+    Mapping {id: position in the view}. Lookup is a binary search in the sorted positions
+    in the full metadata. If the view is not sorted, order maps sorted index to view position.
+    """
+
+    def __init__(self, keys: ViewKeys, key2num, nums_sorted: np.ndarray,
+                 order: Optional[np.ndarray] = None):
+        self.view_keys = keys
+        self.key2num = key2num
+        self.nums_sorted = nums_sorted
+        self.order = order
+
+    def __getitem__(self, key):
+        num = self.key2num[key]
+        index = int(np.searchsorted(self.nums_sorted, num))
+        if index == len(self.nums_sorted) or self.nums_sorted[index] != num:
+            raise KeyError(key)
+        if self.order is None:
+            return index
+        return int(self.order[index])
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.view_keys)
+
+    def __len__(self):
+        return len(self.nums_sorted)
+
+
+class LeafMetaView(Mapping):
+    """Read-only mapping {leaf_id: {"root_id": root_id, key1: value1, ...}} of a MetaView"""
+
+    def __init__(self, view: MetaView):
+        self.view = view
+        self.key2num = view.leaf_key2num
+
+    def __getitem__(self, leaf_id):
+        if leaf_id not in self.key2num:
+            raise KeyError(leaf_id)
+        return self.view.meta_index.leaf_meta[leaf_id]
+
+    def __contains__(self, leaf_id):
+        return leaf_id in self.key2num
+
+    def __iter__(self):
+        return iter(self.view.leaf_keys)
+
+    def __len__(self):
+        return len(self.view.leaf_nums)
+
+
+class RootMetaView(Mapping):
+    """
+    Read-only mapping {root_id: {"leaf_ids": [leaf_id, ...], key1: value1, ...}} of a MetaView.
+    The items are shallow copies with "leaf_ids" restricted to the leafs in the view.
+    """
+
+    def __init__(self, view: MetaView):
+        self.view = view
+        self.key2num = view.root_key2num
+
+    def __getitem__(self, root_id):
+        view = self.view
+        root_pos = self.key2num[root_id]
+        root_item = dict(view.meta_index.root_meta[root_id])
+        leaf_keys = view.meta_index.leaf_keys
+        root_item["leaf_ids"] = [leaf_keys[num] for num in view.get_root_leaf_nums(root_pos)]
+        return root_item
+
+    def __contains__(self, root_id):
+        return root_id in self.key2num
+
+    def __iter__(self):
+        return iter(self.view.root_keys)
+
+    def __len__(self):
+        return len(self.view.root_nums)
+
+
+def get_keys_for_metadata(leaf_meta, root_meta):
+    """
+    Returns:
+        leaf_keys, root_keys: sequences of ids
+        leaf_key2num, root_key2num: {id: position in the sequence}
+    """
+    if isinstance(leaf_meta, LeafMetaView):
+        view = leaf_meta.view
+        return view.leaf_keys, view.root_keys, view.leaf_key2num, view.root_key2num
+    if isinstance(leaf_meta, ColumnarLeafMeta):
+        columnar = leaf_meta.columnar
+        return (columnar.leaf_ids, columnar.root_ids,
+                columnar.leaf_key2num, columnar.root_key2num)
+    leaf_keys, root_keys = list(leaf_meta.keys()), list(root_meta.keys())
+    leaf_key2num = {k: i for i, k in enumerate(leaf_keys)}
+    root_key2num = {k: i for i, k in enumerate(root_keys)}
+    return leaf_keys, root_keys, leaf_key2num, root_key2num
+
+
+def get_files_fingerprint(files: Iterable[Path]) -> str:
+    """Cheap fingerprint of files given their names, sizes and modification times."""
+    file_infos = []
+    for file in sorted(Path(file) for file in files):
+        stat = file.stat()
+        file_infos.append((file.as_posix(), stat.st_size, stat.st_mtime_ns))
+    return joblib.hash(file_infos)
+
+
+def get_file_hash(file: Path, chunk_size: int = 1024 ** 2) -> str:
+    """Hash of the file content, e.g. to key cached results computed from the file."""
+    hasher = hashlib.sha1()
+    with Path(file).open("rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
 @mem.cache(ignore=["*", "**"])
 def filter_data_given_leaf_ids_cached(
         _cache_key: str, *args, **kwargs):
     return filter_data_given_leaf_ids(*args, **kwargs)
+
+
+@mem.cache(ignore=["leaf_ids", "meta_index"])
+def get_leaf_nums_cached(_cache_key: str, leaf_ids, meta_index: MetaIndex):
+    """Only the positions are written to the cache, not the metadata. leaf_ids and meta_index are
+    not hashed, the cache key must cover them."""
+    return meta_index.get_leaf_nums(leaf_ids)
@@ -1,39 +1,120 @@
+import pickle
+import threading
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 import joblib
+import numpy as np
 
-from streamlit_vis.data_utils import filter_data_given_leaf_ids_cached
-from streamlit_vis.st_utils import logger, PathType, create_thumbnail
+from streamlit_vis.columnar import ColumnarMeta
+from streamlit_vis.data_utils import (
+    MetaIndex, MetaView, NavigationIndex, get_files_fingerprint, get_leaf_nums_cached)
+from streamlit_vis.image_pyramid import (
+    INFO_FILE, ImagePyramid, create_pyramid, get_image_size)
+from streamlit_vis.metrics import SubsetIndex
+from streamlit_vis.registry import LoadProgress
+from streamlit_vis.search_index import TrigramIndex, SearchMemo
+from streamlit_vis.st_utils import (
+    logger, PathType, create_thumbnail, is_file_up_to_date, transcode_image)
+from streamlit_vis.thumbnail_pack import PackedThumbnailStore
+from streamlit_vis.timing import timed
 
 
 @dataclass
 class VisionDatasetComponent(metaclass=ABCMeta):
     """
     Component for a hierarchical vision dataset.
+
+    If columnar is True, the metadata is stored in a ColumnarMeta after loading, and leaf_meta
+    and root_meta are read-only mappings on top of it.
+
+    If transcode_min_bytes is set, png images larger than this are displayed as a cached jpeg
+    version with the given transcode_quality.
+
+    If pyramid_tile_size is set, images larger than display_size are shown from a cached
+    multi-resolution pyramid (see streamlit_vis.image_pyramid) stored next to the thumbnails.
+
+    The views of the max_cached_views most recently used filters are kept, together with their
+    navigation indexes.
     """
     name: str
     split: str
     dataroot_dir: PathType
     thumbnail_size: int
+    columnar: bool = False
+    transcode_min_bytes: Optional[int] = None
+    transcode_quality: int = 90
+    pyramid_tile_size: Optional[int] = None
+    display_size: int = 1024
+    max_cached_views: int = 32
 
     def __post_init__(self):
         logger.info(f"Reload dataset {self}")
         self.dataroot_dir = Path(self.dataroot_dir)
         self.dataset_dir = self.dataroot_dir / self.name
         self.leaf_meta, self.root_meta, self.subsets = None, None, None
+        self.meta_index: Optional[MetaIndex] = None
+        self.search_indexes: Dict[str, TrigramIndex] = {}
         self.thumbnail_dir = self.dataroot_dir / self.name / "thumbnails"
+        self.index_dir = self.dataroot_dir / self.name / "indexes"
+        self.transcode_dir = self.dataroot_dir / self.name / "transcoded"
+        # {thumb_size: (signature of the pack files, store or None if not usable)}
+        self.thumbnail_packs: Dict[int, Tuple[Optional[tuple], Optional[PackedThumbnailStore]]] = {}
+        self.metadata_fingerprint: Optional[str] = None
+        self._views: OrderedDict = OrderedDict()
+        self._views_lock = threading.Lock()
+        # set before loading to report the progress of reading the files
+        self.load_progress: Optional[LoadProgress] = None
 
-    def preload_everything(self):
-        """Use in case we do not want to lazy load, but load everything at once"""
+    def preload_everything(self, warm_up: bool = False, num_workers: Optional[int] = None):
+        """Use in case we do not want to lazy load, but load everything at once.
+        If warm_up is True, also compute the filters of all subsets, see warm_up_subsets."""
         self.get_metadata()
         self.get_subsets()
+        if warm_up:
+            self.warm_up_subsets(num_workers)
+
+    def warm_up_subsets(self, num_workers: Optional[int] = None):
+        """Compute the filters of all subsets in parallel, so the first visit of each subset
+        is served from the cache."""
+        names = [(group_name, subset_name) for group_name, group_info in self.get_subsets().items()
+                 for subset_name in group_info["subsets"].keys()]
+        with ThreadPoolExecutor(max_workers=num_workers,
+                                thread_name_prefix="streamlit_vis_warm_up") as executor:
+            list(executor.map(lambda name: self.get_view_for_subset(*name), names))
+        logger.info(f"{self.name}/{self.split}: Warmed up {len(names)} subsets.")
+
+    def get_metadata_fingerprint(self) -> str:
+        """Fingerprint of the metadata files, part of the cache keys of everything computed
+        from the metadata, so cached results are not reused after the data changed."""
+        if self.metadata_fingerprint is None:
+            self.metadata_fingerprint = get_files_fingerprint(self.get_metadata_files())
+        return self.metadata_fingerprint
+
+    def get_progress_fn(self, file: Path) -> Optional[Callable[[int, int, int], None]]:
+        """progress_fn for reading the file with streamlit_vis.json_stream,
+        None if no progress is reported."""
+        if self.load_progress is None:
+            return None
+        return self.load_progress.get_file_progress_fn(file.name, file.stat().st_size)
 
     def get_metadata(self):
         if self.leaf_meta is None or self.root_meta is None:
-            self.leaf_meta, self.root_meta = self._load_metadata()
+            metadata_items = self._iter_metadata() if self.columnar else None
+            if metadata_items is not None:
+                # stream the items into the columns without building the dicts
+                columnar_meta = ColumnarMeta.from_items(*metadata_items)
+                leaf_meta, root_meta = columnar_meta.leaf_meta, columnar_meta.root_meta
+            else:
+                leaf_meta, root_meta = self._load_metadata()
+                if self.columnar:
+                    columnar_meta = ColumnarMeta.from_dicts(leaf_meta, root_meta)
+                    leaf_meta, root_meta = columnar_meta.leaf_meta, columnar_meta.root_meta
+            self.leaf_meta, self.root_meta = leaf_meta, root_meta
             self._update_keys()
         return self.leaf_meta, self.root_meta
 
@@ -42,18 +123,127 @@ class VisionDatasetComponent(metaclass=ABCMeta):
             self.subsets = self._load_subsets()
         return self.subsets
 
-    def get_metadata_for_subset(self, group_name, subset_name):
+    def get_leaf_nums_for_subset(self, group_name, subset_name) -> np.ndarray:
         leaf_ids = self.subsets[group_name]["subsets"][subset_name]
-        cache_key = joblib.hash((self.name, self.split, group_name, subset_name))
-        new_leaf_meta, new_root_meta = filter_data_given_leaf_ids_cached(
-                cache_key, leaf_ids, self.leaf_meta, self.root_meta)
-        return new_leaf_meta, new_root_meta
+        # the subsets are not part of the metadata fingerprint, so the key covers the leaf ids
+        cache_key = joblib.hash((self.name, self.split, self.get_metadata_fingerprint(),
+                                 group_name, subset_name, joblib.hash(leaf_ids)))
+        return get_leaf_nums_cached(cache_key, leaf_ids, self.meta_index)
+
+    def get_view_for_subset(self, group_name, subset_name) -> MetaView:
+        return self._get_cached_view(
+                ("subset", group_name, subset_name), lambda: MetaView(
+                        self.meta_index, self.get_leaf_nums_for_subset(group_name, subset_name)))
+
+    def _get_cached_view(self, key, create_fn: Callable[[], MetaView]) -> MetaView:
+        with self._views_lock:
+            view = self._views.get(key)
+            if view is not None:
+                self._views.move_to_end(key)
+                return view
+        view = create_fn()
+        with self._views_lock:
+            self._views[key] = view
+            while len(self._views) > self.max_cached_views:
+                self._views.popitem(last=False)
+        return view
+
+    def get_view_for_search(self, group_name, subset_name, search_field: str, search_value: str,
+                            search_memo: Optional[SearchMemo] = None) -> MetaView:
+        """View of the leafs of the subset (all leafs for group_name "") whose search_field
+        contains the lowercased search_value."""
+
+        def _create_view():
+            search_index = self.get_search_index(search_field)
+            subset_leaf_nums = None if group_name == "" else self.get_view_for_subset(
+                    group_name, subset_name).leaf_nums
+            if search_memo is None:
+                leaf_nums = search_index.search(search_value, subset_leaf_nums)
+            else:
+                leaf_nums = search_memo.search(
+                        (self.name, self.split, self.get_metadata_fingerprint(),
+                         group_name, subset_name, search_field),
+                        search_value,
+                        lambda query: search_index.search(query, subset_leaf_nums),
+                        search_index.verify)
+            return MetaView(self.meta_index, leaf_nums)
+
+        return self._get_cached_view(
+                ("search", group_name, subset_name, search_field, search_value), _create_view)
+
+    def get_view_for_page(
+            self, group_name="", subset_name="", search_leaf: Optional[Dict[str, str]] = None,
+            search_memo: Optional[SearchMemo] = None) -> Optional[MetaView]:
+        """View of the page with the arguments of load_metadata_for_page,
+        None if nothing is filtered."""
+        view = None if group_name == "" else self.get_view_for_subset(group_name, subset_name)
+        if search_leaf is not None:
+            assert len(search_leaf) == 1, "Only one search field supported"
+            search_field, search_value = list(search_leaf.items())[0]
+            search_value = search_value.lower().strip()
+            if search_value != "":
+                view = self.get_view_for_search(
+                        group_name, subset_name, search_field, search_value, search_memo)
+        return view
+
+    def get_navigation_index(
+            self, group_name="", subset_name="", search_leaf: Optional[Dict[str, str]] = None,
+            search_memo: Optional[SearchMemo] = None) -> NavigationIndex:
+        """Navigation over the leafs and roots of the page with the arguments of
+        load_metadata_for_page, built once per view."""
+        self.get_metadata()
+        view = self.get_view_for_page(group_name, subset_name, search_leaf, search_memo)
+        if view is None:
+            return self.meta_index.get_navigation_index()
+        return view.get_navigation_index()
+
+    def get_subset_index(self) -> SubsetIndex:
+        """Leaf positions of all subsets, to aggregate metrics (see streamlit_vis.metrics)."""
+        return SubsetIndex.from_leaf_nums({
+                group_name: {subset_name: self.get_leaf_nums_for_subset(group_name, subset_name)
+                             for subset_name in group_info["subsets"].keys()}
+                for group_name, group_info in self.get_subsets().items()})
+
+    def get_metadata_for_subset(self, group_name, subset_name):
+        view = self.get_view_for_subset(group_name, subset_name)
+        return view.leaf_meta, view.root_meta
+
+    def get_metadata_files(self) -> List[Path]:
+        """Files the metadata is loaded from. Used to check whether saved indexes are up to date.
+        By default, all files directly inside the dataset directory."""
+        return [file for file in self.dataset_dir.iterdir() if file.is_file()]
+
+    def get_search_index_file(self, field: str) -> Path:
+        return self.index_dir / f"search_{self.split}_{field}.pkl"
+
+    def get_search_index(self, field: str) -> TrigramIndex:
+        """Load or build the search index for a leaf field once per dataset and split.
+        Indexes saved by save_search_index are used if they are up to date."""
+        if field not in self.search_indexes:
+            self.get_metadata()
+            index_file = self.get_search_index_file(field)
+            if is_file_up_to_date(index_file, self.get_metadata_files()):
+                with index_file.open("rb") as fh:
+                    self.search_indexes[field] = pickle.load(fh)
+            else:
+                self.search_indexes[field] = TrigramIndex(
+                        value for _leaf_num, value in self.meta_index.iter_leaf_field(field))
+        return self.search_indexes[field]
+
+    def save_search_index(self, field: str):
+        search_index = self.get_search_index(field)
+        index_file = self.get_search_index_file(field)
+        index_file.parent.mkdir(parents=True, exist_ok=True)
+        with index_file.open("wb") as fh:
+            pickle.dump(search_index, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        return index_file
 
     def _update_keys(self):
-        """Set the metadata keys given the metadata"""
-        self.leaf_keys, self.root_keys = list(self.leaf_meta.keys()), list(self.root_meta.keys())
-        self.leaf_key2num = {k: i for i, k in enumerate(self.leaf_keys)}
-        self.root_key2num = {k: i for i, k in enumerate(self.root_keys)}
+        """Set the metadata keys and the positional index given the metadata"""
+        self.meta_index = MetaIndex(self.leaf_meta, self.root_meta)
+        index = self.meta_index
+        self.leaf_keys, self.root_keys = index.leaf_keys, index.root_keys
+        self.leaf_key2num, self.root_key2num = index.leaf_key2num, index.root_key2num
 
     @abstractmethod
     def _load_metadata(self):
@@ -62,6 +252,12 @@ class VisionDatasetComponent(metaclass=ABCMeta):
         root_meta: {root_id: {key1: value1, ...}}
         """
 
+    def _iter_metadata(self):
+        """Optional, used instead of _load_metadata for columnar storage, to avoid building
+        the dicts. Returns None or iterators (leaf_items, root_items) over (id, item) pairs,
+        see ColumnarMeta.from_items."""
+        return None
+
     @abstractmethod
     def _load_subsets(self):
         """Set self.subsets given metadata.
@@ -72,30 +268,107 @@ class VisionDatasetComponent(metaclass=ABCMeta):
     def get_image_file(self, image_id):
         return self.dataroot_dir / self.root_meta[str(image_id)]["image_file"]
 
-    def get_thumbnail_file(self, image_id):
-        thumb_size = self.thumbnail_size
-        thumbnail_file = self.thumbnail_dir / f"{image_id}_{thumb_size}.jpg"
+    def get_display_image_file(self, image_id) -> Path:
+        """Image file to show in the browser, the transcoded version for large png files."""
+        image_file = self.get_image_file(image_id)
+        if (self.transcode_min_bytes is None or image_file.suffix.lower() != ".png"
+                or image_file.stat().st_size < self.transcode_min_bytes):
+            return image_file
+        transcoded_file = self.transcode_dir / f"{image_id}.jpg"
+        if not is_file_up_to_date(transcoded_file, [image_file]):
+            transcode_image(image_file, transcoded_file, quality=self.transcode_quality)
+        return transcoded_file
+
+    def get_pyramid_dir(self, image_id) -> Path:
+        return self.thumbnail_dir / "pyramids" / str(image_id)
+
+    def is_pyramid_up_to_date(self, image_id) -> bool:
+        return is_file_up_to_date(self.get_pyramid_dir(image_id) / INFO_FILE,
+                                  [self.get_image_file(image_id)])
+
+    def needs_pyramid(self, image_id) -> bool:
+        if self.pyramid_tile_size is None:
+            return False
+        return max(get_image_size(self.get_image_file(image_id))) > self.display_size
+
+    def create_pyramid(self, image_id) -> ImagePyramid:
+        return create_pyramid(self.get_image_file(image_id), self.get_pyramid_dir(image_id),
+                              tile_size=self.pyramid_tile_size, display_size=self.display_size,
+                              quality=self.transcode_quality)
+
+    def get_image_pyramid(self, image_id) -> Optional[ImagePyramid]:
+        """Returns the pyramid of the image, created if missing or older than the image.
+        Returns None if pyramids are disabled or the image fits the display size."""
+        if self.pyramid_tile_size is None:
+            return None
+        if self.is_pyramid_up_to_date(image_id):
+            return ImagePyramid.load(self.get_pyramid_dir(image_id))
+        if not self.needs_pyramid(image_id):
+            return None
+        return self.create_pyramid(image_id)
+
+    def get_thumbnail_path(self, image_id, thumb_size: Optional[int] = None) -> Path:
+        thumb_size = self.thumbnail_size if thumb_size is None else thumb_size
+        return self.thumbnail_dir / f"{image_id}_{thumb_size}.jpg"
+
+    @timed("get_thumbnail_file")
+    def get_thumbnail_file(self, image_id, thumb_size: Optional[int] = None):
+        """Create the thumbnail if it does not exist yet. To update existing thumbnails after the
+        images changed, run the offline preprocessing (streamlit_vis.preprocessing)."""
+        thumb_size = self.thumbnail_size if thumb_size is None else thumb_size
+        thumbnail_file = self.get_thumbnail_path(image_id, thumb_size)
         if not thumbnail_file.is_file():
             image_file = self.get_image_file(image_id)
             create_thumbnail(image_file, thumbnail_file, longer_side=thumb_size)
         return thumbnail_file
 
+    def get_thumbnail_pack_store(self, thumb_size: Optional[int] = None) -> PackedThumbnailStore:
+        thumb_size = self.thumbnail_size if thumb_size is None else thumb_size
+        return PackedThumbnailStore(self.thumbnail_dir / f"pack_{self.split}_{thumb_size}.bin",
+                                    self.thumbnail_dir / f"pack_{self.split}_{thumb_size}.npy")
+
+    def get_thumbnail_pack(self, thumb_size: Optional[int] = None
+                           ) -> Optional[PackedThumbnailStore]:
+        """Returns the packed thumbnails if they exist and match the current metadata.
+        The store is opened again when the pack files change, e.g. when the pack is rebuilt."""
+        thumb_size = self.thumbnail_size if thumb_size is None else thumb_size
+        store = self.get_thumbnail_pack_store(thumb_size)
+        signature = store.get_signature()
+        cached = self.thumbnail_packs.get(thumb_size)
+        if cached is None or cached[0] != signature:
+            if signature is None or not is_file_up_to_date(
+                    store.index_file, self.get_metadata_files()):
+                store = None
+            cached = self.thumbnail_packs[thumb_size] = (signature, store)
+        return cached[1]
+
+    @timed("get_thumbnail_data")
+    def get_thumbnail_data(self, image_id, thumb_size: Optional[int] = None):
+        """Encoded jpeg thumbnail, read from the packed thumbnails if possible,
+        otherwise from the thumbnail file."""
+        store = self.get_thumbnail_pack(thumb_size)
+        if store is not None:
+            data = store.get(self.root_key2num[str(image_id)])
+            if data is not None:
+                return data
+        return self.get_thumbnail_file(image_id, thumb_size).read_bytes()
+
     def load_metadata_for_page(
-            self, group_name="", subset_name="", search_leaf: Optional[Dict[str, str]] = None):
+            self, group_name="", subset_name="", search_leaf: Optional[Dict[str, str]] = None,
+            search_memo: Optional[SearchMemo] = None):
         root_keys = self.root_keys
         root_meta = self.root_meta
         leaf_meta = self.leaf_meta
         leaf_keys = self.leaf_keys
         leaf_key2num = self.leaf_key2num
         root_key2num = self.root_key2num
-        name = self.name
         split = self.split
         subsets = self.subsets
 
         output_text = []
+        view: Optional[MetaView] = None
         if group_name == "":
             output_text.append(f"Showing all questions for split *{split}*.")
-            recompute_keys = False
         else:
             group_info = subsets[group_name]
             group_desc = group_info["description"]
@@ -104,8 +377,8 @@ class VisionDatasetComponent(metaclass=ABCMeta):
                     f"Filter split **{split}** group **{group_title}** "
                     f"subset **{subset_name}**. "
                     f"Group description: {group_desc}")
-            leaf_meta, root_meta = self.get_metadata_for_subset(group_name, subset_name)
-            recompute_keys = True
+            view = self.get_view_for_subset(group_name, subset_name)
+            leaf_meta, root_meta = view.leaf_meta, view.root_meta
         output_text.append(f"Total {len(root_meta)} images, {len(leaf_meta)} questions.")
 
         if search_leaf is not None:
@@ -113,25 +386,16 @@ class VisionDatasetComponent(metaclass=ABCMeta):
             search_field, search_value = list(search_leaf.items())[0]
             search_value = search_value.lower().strip()
             if search_value != "":
-                leaf_ids = []
-                for leaf_id, leaf_item in leaf_meta.items():
-                    compare_value = leaf_item[search_field]
-                    if search_value in compare_value.lower():
-                        leaf_ids.append(leaf_id)
-
-                cache_key = joblib.hash((
-                        name, split, group_name, subset_name, search_field, search_value))
-                new_meta, new_meta_hl = filter_data_given_leaf_ids_cached(
-                        cache_key, leaf_ids, leaf_meta, root_meta)
-                leaf_meta, root_meta = new_meta, new_meta_hl
+                view = self.get_view_for_search(
+                        group_name, subset_name, search_field, search_value, search_memo)
+                leaf_meta, root_meta = view.leaf_meta, view.root_meta
                 output_text.append(
                         f"Search for {search_field}={search_value} found {len(leaf_meta)} items.")
-                recompute_keys = True
 
-        if recompute_keys:
-            leaf_keys, root_keys = list(leaf_meta.keys()), list(root_meta.keys())
-            leaf_key2num = {k: i for i, k in enumerate(leaf_keys)}
-            root_key2num = {k: i for i, k in enumerate(root_keys)}
+        if view is not None:
+            leaf_keys, root_keys = view.leaf_keys, view.root_keys
+            leaf_key2num, root_key2num = view.leaf_key2num, view.root_key2num
 
         info_text = " ".join(output_text)
         return (leaf_meta, root_meta, leaf_keys, root_keys, leaf_key2num, root_key2num), info_text
+
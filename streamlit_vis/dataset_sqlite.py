@@ -0,0 +1,680 @@
+"""
+Dataset component that keeps the metadata, the subsets and the predictions in a local SQLite
+database, for datasets that do not fit into memory. Only integer positions of the selected leafs
+are held in memory, items are read from the database when a page shows them.
+
+The database is created once from the json layout with import_json_dataset and opened read-only.
+
+Tables:
+    roots(num, id, data): root items without "leaf_ids", num is the position of the root
+    leaves(num, id, root_num, data): leaf items, indexed by id and by (root_num, num)
+    subset_groups, subsets(subset_num, group_name, subset_name, ...),
+    subset_members(subset_num, leaf_num): leaf positions of each subset
+    models, predictions(model_num, leaf_num, prediction)
+    leaf_search: FTS5 trigram index of the lowercased search field, rowid is the leaf position
+    info(key, value): e.g. the search field and the hash of the imported predictions
+
+Requires SQLite 3.38 or newer (json -> operator, FTS5 trigram tokenizer).
+"""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from streamlit_vis.columnar import LabelColumn
+from streamlit_vis.data_utils import MetaView, NavigationIndex, get_file_hash
+from streamlit_vis.dataset_base import VisionDatasetComponent
+from streamlit_vis.json_stream import iter_json_items
+from streamlit_vis.search_index import SearchMemo
+from streamlit_vis.st_utils import logger, PathType
+
+SCHEMA = """
+CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE roots (num INTEGER PRIMARY KEY, id TEXT NOT NULL, data TEXT NOT NULL);
+CREATE TABLE leaves (num INTEGER PRIMARY KEY, id TEXT NOT NULL, root_num INTEGER NOT NULL,
+                     data TEXT NOT NULL);
+CREATE TABLE subset_groups (group_num INTEGER PRIMARY KEY, group_name TEXT NOT NULL UNIQUE,
+                            title TEXT, description TEXT);
+CREATE TABLE subsets (subset_num INTEGER PRIMARY KEY, group_name TEXT NOT NULL,
+                      subset_name TEXT NOT NULL, n_leaves INTEGER NOT NULL DEFAULT 0,
+                      UNIQUE (group_name, subset_name));
+CREATE TABLE subset_members (subset_num INTEGER NOT NULL, leaf_num INTEGER NOT NULL,
+                             PRIMARY KEY (subset_num, leaf_num)) WITHOUT ROWID;
+CREATE TABLE models (model_num INTEGER PRIMARY KEY, model_name TEXT NOT NULL UNIQUE);
+CREATE TABLE predictions (model_num INTEGER NOT NULL, leaf_num INTEGER NOT NULL,
+                          prediction TEXT NOT NULL,
+                          PRIMARY KEY (model_num, leaf_num)) WITHOUT ROWID;
+CREATE VIRTUAL TABLE leaf_search USING fts5(text, tokenize = 'trigram');
+"""
+
+# created after the bulk insert, which is faster than updating them for every row
+INDEXES = """
+CREATE UNIQUE INDEX roots_id ON roots (id);
+CREATE UNIQUE INDEX leaves_id ON leaves (id);
+CREATE INDEX leaves_root ON leaves (root_num, num);
+"""
+
+# maximum number of parameters per query, the default limit of older SQLite versions is 999
+MAX_PARAMS = 900
+
+# get_leaf_subsets(leaf_id, leaf_item) -> [(group_name, subset_name), ...]
+LeafSubsetsFn = Callable[[str, Dict[str, Any]], Iterable[Tuple[str, str]]]
+
+
+def _dump(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _iter_batches(iterable: Iterable, batch_size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+def import_json_dataset(
+        db_file: PathType, leaf_file: PathType, root_file: PathType, search_field: str,
+        subset_groups: Optional[Dict[str, Dict[str, Any]]] = None,
+        get_leaf_subsets: Optional[LeafSubsetsFn] = None,
+        predictions_file: Optional[PathType] = None, batch_size: int = 10000) -> Path:
+    """
+    Create the database from the json layout. The files are streamed, so the import needs
+    memory only for the root ids. The database is written to a temporary file first and
+    replaces db_file when it is complete.
+
+    Args:
+        db_file: output database
+        leaf_file: {leaf_id: {"root_id": root_id, key1: value1, ...}}
+        root_file: {root_id: {"leaf_ids": [...], key1: value1, ...}}, the leaf_ids are
+            recreated from the leafs
+        search_field: leaf field for the full text search
+        subset_groups: {group_name: {"title": x, "description": y, "subsets": [subset_name]}}
+            the declared order of groups and subsets is kept, undeclared subsets are appended
+        get_leaf_subsets: returns the (group_name, subset_name) pairs a leaf belongs to
+        predictions_file: optional {model_name: {leaf_id: prediction}}
+        batch_size: number of rows per insert
+
+    Returns:
+        db_file
+    """
+    db_file = Path(db_file)
+    db_file.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = db_file.with_name(f".{db_file.stem}_{uuid.uuid4().hex}{db_file.suffix}")
+    conn = sqlite3.connect(temp_file)
+    try:
+        # the temporary file is discarded on errors, so the journal is not needed
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(SCHEMA)
+        with conn:
+            importer = _JsonImporter(conn, subset_groups or {}, get_leaf_subsets, batch_size)
+            importer.import_roots(root_file)
+            importer.import_leaves(leaf_file, search_field)
+            importer.write_subsets()
+            predictions_hash = ""
+            if predictions_file is not None:
+                importer.import_predictions(predictions_file)
+                predictions_hash = get_file_hash(predictions_file)
+            conn.executemany("INSERT INTO info VALUES (?, ?)", [
+                    ("search_field", search_field), ("predictions_hash", predictions_hash),
+                    ("n_leaves", str(importer.n_leaves)), ("n_roots", str(importer.n_roots))])
+        conn.executescript(INDEXES)
+        conn.execute("ANALYZE")
+        conn.close()
+        os.replace(temp_file, db_file)
+    except BaseException:
+        conn.close()
+        temp_file.unlink(missing_ok=True)
+        raise
+    logger.info(f"Imported {importer.n_leaves} leafs and {importer.n_roots} roots to {db_file}")
+    return db_file
+
+
+class _JsonImporter:
+    def __init__(self, conn: sqlite3.Connection, subset_groups: Dict[str, Dict[str, Any]],
+                 get_leaf_subsets: Optional[LeafSubsetsFn], batch_size: int):
+        self.conn = conn
+        self.get_leaf_subsets = get_leaf_subsets
+        self.batch_size = batch_size
+        self.root_key2num: Dict[str, int] = {}
+        self.leaf_key2num: Dict[str, int] = {}
+        self.n_leaves, self.n_roots = 0, 0
+        self.groups: Dict[str, Dict[str, Any]] = {}
+        self.subset_nums: Dict[Tuple[str, str], int] = {}
+        self.subset_sizes: List[int] = []
+        for group_name, group_info in subset_groups.items():
+            self._add_group(group_name, group_info.get("title", group_name),
+                            group_info.get("description", ""))
+            for subset_name in group_info.get("subsets", []):
+                self._get_subset_num(group_name, subset_name)
+
+    def _add_group(self, group_name: str, title: str, description: str):
+        self.groups[group_name] = {"title": title, "description": description}
+
+    def _get_subset_num(self, group_name: str, subset_name: str) -> int:
+        key = (group_name, subset_name)
+        subset_num = self.subset_nums.get(key)
+        if subset_num is None:
+            if group_name not in self.groups:
+                self._add_group(group_name, group_name, "")
+            subset_num = self.subset_nums[key] = len(self.subset_nums)
+            self.subset_sizes.append(0)
+        return subset_num
+
+    def import_roots(self, root_file: PathType):
+        def _iter_rows():
+            for (root_id, ), root_item in iter_json_items(root_file):
+                root_item = {key: value for key, value in root_item.items() if key != "leaf_ids"}
+                num = self.root_key2num[root_id] = len(self.root_key2num)
+                yield num, root_id, _dump(root_item)
+
+        for batch in _iter_batches(_iter_rows(), self.batch_size):
+            self.conn.executemany("INSERT INTO roots VALUES (?, ?, ?)", batch)
+        self.n_roots = len(self.root_key2num)
+
+    def import_leaves(self, leaf_file: PathType, search_field: str):
+        members = []
+
+        def _iter_rows():
+            for (leaf_id, ), leaf_item in iter_json_items(leaf_file):
+                root_id = str(leaf_item["root_id"])
+                if root_id not in self.root_key2num:
+                    raise KeyError(f"Leaf {leaf_id} has unknown root_id {root_id}")
+                num = self.leaf_key2num[leaf_id] = len(self.leaf_key2num)
+                if self.get_leaf_subsets is not None:
+                    for group_name, subset_name in self.get_leaf_subsets(leaf_id, leaf_item):
+                        subset_num = self._get_subset_num(group_name, subset_name)
+                        self.subset_sizes[subset_num] += 1
+                        members.append((subset_num, num))
+                yield (num, leaf_id, self.root_key2num[root_id], _dump(leaf_item),
+                       str(leaf_item[search_field]).lower())
+
+        for batch in _iter_batches(_iter_rows(), self.batch_size):
+            self.conn.executemany("INSERT INTO leaves VALUES (?, ?, ?, ?)",
+                                  [row[:4] for row in batch])
+            self.conn.executemany("INSERT INTO leaf_search (rowid, text) VALUES (?, ?)",
+                                  [(row[0], row[4]) for row in batch])
+            self.conn.executemany("INSERT INTO subset_members VALUES (?, ?)", members)
+            members.clear()
+        self.n_leaves = len(self.leaf_key2num)
+
+    def write_subsets(self):
+        self.conn.executemany("INSERT INTO subset_groups VALUES (?, ?, ?, ?)", [
+                (group_num, group_name, group_info["title"], group_info["description"])
+                for group_num, group_name in enumerate(self.groups.keys())
+                for group_info in [self.groups[group_name]]])
+        self.conn.executemany("INSERT INTO subsets VALUES (?, ?, ?, ?)", [
+                (subset_num, group_name, subset_name, self.subset_sizes[subset_num])
+                for (group_name, subset_name), subset_num in self.subset_nums.items()])
+
+    def import_predictions(self, predictions_file: PathType):
+        model_nums: Dict[str, int] = {}
+
+        def _iter_rows():
+            for (model_name, leaf_id), prediction in iter_json_items(predictions_file, 2):
+                model_num = model_nums.get(model_name)
+                if model_num is None:
+                    model_num = model_nums[model_name] = len(model_nums)
+                    self.conn.execute("INSERT INTO models VALUES (?, ?)", (model_num, model_name))
+                # same as load_json_labels, predictions of unknown leafs are ignored
+                leaf_num = self.leaf_key2num.get(leaf_id)
+                if leaf_num is not None:
+                    yield model_num, leaf_num, _dump(prediction)
+
+        for batch in _iter_batches(_iter_rows(), self.batch_size):
+            self.conn.executemany("INSERT INTO predictions VALUES (?, ?, ?)", batch)
+
+
+class SqliteStore:
+    """Read-only access to the database with one connection per thread."""
+
+    def __init__(self, db_file: PathType):
+        self.db_file = Path(db_file)
+        if not self.db_file.is_file():
+            raise FileNotFoundError(
+                    f"Database {self.db_file} not found, create it with import_json_dataset.")
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            conn = sqlite3.connect(f"{self.db_file.resolve().as_uri()}?mode=ro", uri=True)
+            self._local.connection = conn
+        return conn
+
+    def execute(self, sql: str, params: Iterable = ()) -> sqlite3.Cursor:
+        return self.connection.execute(sql, tuple(params))
+
+    def query_one(self, sql: str, params: Iterable = ()):
+        """First column of the first row, None if there is no row."""
+        row = self.execute(sql, params).fetchone()
+        return None if row is None else row[0]
+
+    def query_nums(self, sql: str, params: Iterable = ()) -> np.ndarray:
+        """Integer rows as array of shape (n_rows, n_columns)."""
+        cursor = self.execute(sql, params)
+        rows = cursor.fetchall()
+        return np.array(rows, dtype=np.int64).reshape(len(rows), len(cursor.description))
+
+    def get_info(self, key: str) -> Optional[str]:
+        return self.query_one("SELECT value FROM info WHERE key = ?", (key,))
+
+    def __getstate__(self):
+        # connections can not be pickled
+        return {"db_file": self.db_file}
+
+    def __setstate__(self, state):
+        self.db_file = state["db_file"]
+        self._local = threading.local()
+
+
+class SqliteKeys(Sequence):
+    """Sequence of the ids of a table, ordered by position."""
+
+    def __init__(self, store: SqliteStore, table: str):
+        self.store = store
+        self.table = table
+        self._len = store.query_one(f"SELECT COUNT(*) FROM {table}")
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self._len)
+            if step != 1:
+                return [self[num] for num in range(start, stop, step)]
+            return [row[0] for row in self.store.execute(
+                    f"SELECT id FROM {self.table} WHERE num >= ? AND num < ? ORDER BY num",
+                    (start, stop))]
+        num = int(item)
+        if num < 0:
+            num += self._len
+        if not 0 <= num < self._len:
+            raise IndexError(item)
+        return self.store.query_one(f"SELECT id FROM {self.table} WHERE num = ?", (num,))
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return (row[0] for row in self.store.execute(
+                f"SELECT id FROM {self.table} ORDER BY num"))
+
+
+class SqliteKey2Num(Mapping):
+    """Mapping {id: position} of a table, lookups use the unique index on id."""
+
+    def __init__(self, keys: SqliteKeys):
+        self.keys_seq = keys
+        self.store = keys.store
+        self.table = keys.table
+
+    def __getitem__(self, key):
+        num = self.store.query_one(f"SELECT num FROM {self.table} WHERE id = ?", (str(key),))
+        if num is None:
+            raise KeyError(key)
+        return num
+
+    def __iter__(self):
+        return iter(self.keys_seq)
+
+    def __len__(self):
+        return len(self.keys_seq)
+
+
+class SqliteLeafMeta(Mapping):
+    """Read-only mapping {leaf_id: {"root_id": root_id, key1: value1, ...}}"""
+
+    def __init__(self, leaf_keys: SqliteKeys):
+        self.leaf_keys = leaf_keys
+        self.store = leaf_keys.store
+
+    def __getitem__(self, leaf_id):
+        data = self.store.query_one("SELECT data FROM leaves WHERE id = ?", (str(leaf_id),))
+        if data is None:
+            raise KeyError(leaf_id)
+        return json.loads(data)
+
+    def __iter__(self):
+        return iter(self.leaf_keys)
+
+    def __len__(self):
+        return len(self.leaf_keys)
+
+
+class SqliteRootMeta(Mapping):
+    """Read-only mapping {root_id: {"leaf_ids": [leaf_id, ...], key1: value1, ...}}"""
+
+    def __init__(self, root_keys: SqliteKeys):
+        self.root_keys = root_keys
+        self.store = root_keys.store
+
+    def __getitem__(self, root_id):
+        row = self.store.execute(
+                "SELECT num, data FROM roots WHERE id = ?", (str(root_id),)).fetchone()
+        if row is None:
+            raise KeyError(root_id)
+        root_num, data = row
+        root_item = json.loads(data)
+        root_item["leaf_ids"] = [leaf_row[0] for leaf_row in self.store.execute(
+                "SELECT id FROM leaves WHERE root_num = ? ORDER BY num", (root_num,))]
+        return root_item
+
+    def __iter__(self):
+        return iter(self.root_keys)
+
+    def __len__(self):
+        return len(self.root_keys)
+
+
+class SqliteNumLookup:
+    """Read-only [num] -> number given by a query with one parameter."""
+
+    def __init__(self, store: SqliteStore, sql: str):
+        self.store = store
+        self.sql = sql
+
+    def __getitem__(self, num):
+        value = self.store.query_one(self.sql, (int(num),))
+        if value is None:
+            raise IndexError(num)
+        return value
+
+
+class SqliteMetaIndex:
+    """
+    Same interface as MetaIndex, backed by the database instead of arrays in memory.
+    Shared by all MetaView objects of the dataset.
+    """
+
+    def __init__(self, store: SqliteStore):
+        self.store = store
+        self.leaf_keys, self.root_keys = SqliteKeys(store, "leaves"), SqliteKeys(store, "roots")
+        self.leaf_key2num = SqliteKey2Num(self.leaf_keys)
+        self.root_key2num = SqliteKey2Num(self.root_keys)
+        self.leaf_meta = SqliteLeafMeta(self.leaf_keys)
+        self.root_meta = SqliteRootMeta(self.root_keys)
+        # indexed lookups per navigation step, instead of arrays over all leafs
+        self.navigation_index = NavigationIndex(
+                self.leaf_keys, self.root_keys, self.leaf_key2num,
+                SqliteNumLookup(store, "SELECT root_num FROM leaves WHERE num = ?"),
+                SqliteNumLookup(store, "SELECT MIN(num) FROM leaves WHERE root_num = ?"))
+
+    def get_navigation_index(self) -> NavigationIndex:
+        return self.navigation_index
+
+    def _iter_chunks(self, nums: np.ndarray) -> Iterator[Tuple[List[int], str]]:
+        nums = np.asarray(nums, dtype=np.int64).tolist()
+        for start in range(0, len(nums), MAX_PARAMS):
+            chunk = nums[start:start + MAX_PARAMS]
+            yield chunk, ",".join("?" * len(chunk))
+
+    def get_leaf_nums(self, leaf_ids: Iterable[str]) -> np.ndarray:
+        """Sorted, unique leaf positions of the given ids. Unknown ids are ignored."""
+        leaf_ids = list(map(str, leaf_ids))
+        nums = []
+        for start in range(0, len(leaf_ids), MAX_PARAMS):
+            chunk = leaf_ids[start:start + MAX_PARAMS]
+            nums.extend(row[0] for row in self.store.execute(
+                    f"SELECT num FROM leaves WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+        return np.unique(np.array(nums, dtype=np.int64))
+
+    def get_root_nums(self, leaf_nums: np.ndarray) -> np.ndarray:
+        leaf_root = {}
+        for chunk, placeholders in self._iter_chunks(leaf_nums):
+            leaf_root.update(self.store.execute(
+                    f"SELECT num, root_num FROM leaves WHERE num IN ({placeholders})", chunk))
+        return np.array([leaf_root[num] for num in np.asarray(leaf_nums).tolist()],
+                        dtype=np.int64)
+
+    def iter_leaf_field(self, field, leaf_nums: Optional[np.ndarray] = None):
+        """
+        Returns:
+            iterator over (leaf_num, leaf_meta[leaf_id][field]) for all leafs or the given ones
+        """
+        path = f"$.{json.dumps(field)}"
+
+        def _iter_rows(rows):
+            for num, value in rows:
+                if value is None:
+                    raise KeyError(field)
+                yield num, json.loads(value)
+
+        if leaf_nums is None:
+            return _iter_rows(self.store.execute(
+                    "SELECT num, data -> ? FROM leaves ORDER BY num", (path,)))
+
+        def _iter_selected():
+            for chunk, placeholders in self._iter_chunks(leaf_nums):
+                values = dict(self.store.execute(
+                        f"SELECT num, data -> ? FROM leaves WHERE num IN ({placeholders})",
+                        [path] + chunk))
+                yield from _iter_rows((num, values.get(num)) for num in chunk)
+
+        return _iter_selected()
+
+
+class SqliteSubsetIds(Sequence):
+    """Sequence of the leaf ids of a subset, ordered by leaf position."""
+
+    def __init__(self, store: SqliteStore, subset_num: int, n_leaves: int):
+        self.store = store
+        self.subset_num = subset_num
+        self.n_leaves = n_leaves
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return list(islice(iter(self), *item.indices(self.n_leaves)))
+        index = int(item)
+        if index < 0:
+            index += self.n_leaves
+        if not 0 <= index < self.n_leaves:
+            raise IndexError(item)
+        return self.store.query_one(
+                "SELECT l.id FROM subset_members m JOIN leaves l ON l.num = m.leaf_num "
+                "WHERE m.subset_num = ? ORDER BY m.leaf_num LIMIT 1 OFFSET ?",
+                (self.subset_num, index))
+
+    def __len__(self):
+        return self.n_leaves
+
+    def __iter__(self):
+        return (row[0] for row in self.store.execute(
+                "SELECT l.id FROM subset_members m JOIN leaves l ON l.num = m.leaf_num "
+                "WHERE m.subset_num = ? ORDER BY m.leaf_num", (self.subset_num,)))
+
+
+@dataclass
+class SqliteDatasetComponent(VisionDatasetComponent):
+    """
+    Dataset component backed by a database created with import_json_dataset, by default
+    {dataset_dir}/meta_{split}.sqlite.
+
+    Subsets and the search are answered by indexed queries that return only the leaf and root
+    positions of the page's view, the items are read when they are displayed. The search uses
+    the FTS5 index of the database instead of a TrigramIndex and gives the same results, as
+    case-insensitive substring search on the search field given at import time.
+
+    The columnar option is ignored, the metadata is never loaded into memory.
+    """
+    db_file: Optional[PathType] = None
+
+    def __post_init__(self):
+        super().__post_init__()
+        if self.db_file is None:
+            self.db_file = self.dataset_dir / f"meta_{self.split}.sqlite"
+        self.db_file = Path(self.db_file)
+        self.store: Optional[SqliteStore] = None
+        self.subset_nums: Dict[Tuple[str, str], int] = {}
+
+    def get_store(self) -> SqliteStore:
+        if self.store is None:
+            self.store = SqliteStore(self.db_file)
+        return self.store
+
+    def get_metadata(self):
+        if self.leaf_meta is None or self.root_meta is None:
+            self.leaf_meta, self.root_meta = self._load_metadata()
+            self._update_keys()
+        return self.leaf_meta, self.root_meta
+
+    def _load_metadata(self):
+        self.meta_index = SqliteMetaIndex(self.get_store())
+        return self.meta_index.leaf_meta, self.meta_index.root_meta
+
+    def _update_keys(self):
+        index = self.meta_index
+        self.leaf_keys, self.root_keys = index.leaf_keys, index.root_keys
+        self.leaf_key2num, self.root_key2num = index.leaf_key2num, index.root_key2num
+
+    def _load_subsets(self):
+        store = self.get_store()
+        subsets = {}
+        for group_name, title, description in store.execute(
+                "SELECT group_name, title, description FROM subset_groups ORDER BY group_num"):
+            subsets[group_name] = {"title": title, "description": description, "subsets": {}}
+        for subset_num, group_name, subset_name, n_leaves in store.execute(
+                "SELECT subset_num, group_name, subset_name, n_leaves FROM subsets "
+                "ORDER BY subset_num"):
+            self.subset_nums[(group_name, subset_name)] = subset_num
+            subsets[group_name]["subsets"][subset_name] = SqliteSubsetIds(
+                    store, subset_num, n_leaves)
+        return subsets
+
+    def get_metadata_files(self) -> List[Path]:
+        return [self.db_file]
+
+    def get_leaf_nums_for_subset(self, group_name, subset_name) -> np.ndarray:
+        self.get_subsets()
+        return self.get_store().query_nums(
+                "SELECT leaf_num FROM subset_members WHERE subset_num = ? ORDER BY leaf_num",
+                (self.subset_nums[(group_name, subset_name)],))[:, 0]
+
+    def get_view_for_subset(self, group_name, subset_name) -> MetaView:
+        return self._get_view(group_name, subset_name, "")
+
+    def get_search_field(self) -> str:
+        return self.get_store().get_info("search_field")
+
+    def save_search_index(self, field: str):
+        """The search index is created by the import, only check that it matches."""
+        self._check_search_field(field)
+        return self.db_file
+
+    def _check_search_field(self, field: str):
+        search_field = self.get_search_field()
+        if field != search_field:
+            raise ValueError(f"Database {self.db_file} has a search index for field "
+                             f"{search_field}, not for {field}")
+
+    def _get_view(self, group_name: str, subset_name: str, search_value: str) -> MetaView:
+        """View of a subset (all leafs for group_name "") filtered by the lowercased
+        search_value (no filter for ""). Recent views are cached."""
+        return self._get_cached_view(
+                (group_name, subset_name, search_value),
+                lambda: self._query_view(group_name, subset_name, search_value))
+
+    def _query_view(self, group_name: str, subset_name: str, search_value: str) -> MetaView:
+        self.get_metadata()
+        sql, params = ["SELECT l.num, l.root_num FROM leaves l"], []
+        if group_name != "":
+            self.get_subsets()
+            sql.append("JOIN subset_members m ON m.leaf_num = l.num AND m.subset_num = ?")
+            params.append(self.subset_nums[(group_name, subset_name)])
+        if search_value != "":
+            if len(search_value) >= 3:
+                # a quoted phrase matches as substring with the trigram tokenizer
+                phrase = search_value.replace("\"", "\"\"")
+                sql.append("WHERE l.num IN (SELECT rowid FROM leaf_search "
+                           "WHERE leaf_search MATCH ?)")
+                params.append(f"\"{phrase}\"")
+            else:
+                # too short for the trigram index, scan the stored texts
+                sql.append("WHERE l.num IN (SELECT rowid FROM leaf_search "
+                           "WHERE instr(text, ?) > 0)")
+                params.append(search_value)
+        sql.append("ORDER BY l.num")
+        rows = self.get_store().query_nums(" ".join(sql), params)
+        return MetaView(self.meta_index, rows[:, 0], rows[:, 1])
+
+    def get_view_for_search(self, group_name, subset_name, search_field: str, search_value: str,
+                            search_memo: Optional[SearchMemo] = None) -> MetaView:
+        self._check_search_field(search_field)
+        return self._get_view(group_name, subset_name, search_value)
+
+    def load_metadata_for_page(
+            self, group_name="", subset_name="", search_leaf: Optional[Dict[str, str]] = None,
+            search_memo: Optional[SearchMemo] = None):
+        """Same as VisionDatasetComponent.load_metadata_for_page, with the filters as one
+        indexed query. search_memo is not needed, the views are cached by the component."""
+        self.get_metadata()
+        subsets = self.get_subsets()
+        leaf_meta, root_meta = self.leaf_meta, self.root_meta
+
+        output_text = []
+        view: Optional[MetaView] = None
+        if group_name == "":
+            output_text.append(f"Showing all questions for split *{self.split}*.")
+        else:
+            group_info = subsets[group_name]
+            output_text.append(
+                    f"Filter split **{self.split}** group **{group_info['title']}** "
+                    f"subset **{subset_name}**. "
+                    f"Group description: {group_info['description']}")
+            view = self.get_view_for_subset(group_name, subset_name)
+            leaf_meta, root_meta = view.leaf_meta, view.root_meta
+        output_text.append(f"Total {len(root_meta)} images, {len(leaf_meta)} questions.")
+
+        if search_leaf is not None:
+            assert len(search_leaf) == 1, "Only one search field supported"
+            search_field, search_value = list(search_leaf.items())[0]
+            search_value = search_value.lower().strip()
+            if search_value != "":
+                view = self.get_view_for_search(group_name, subset_name, search_field, search_value)
+                leaf_meta, root_meta = view.leaf_meta, view.root_meta
+                output_text.append(
+                        f"Search for {search_field}={search_value} found {len(leaf_meta)} items.")
+
+        if view is None:
+            leaf_keys, root_keys = self.leaf_keys, self.root_keys
+            leaf_key2num, root_key2num = self.leaf_key2num, self.root_key2num
+        else:
+            leaf_keys, root_keys = view.leaf_keys, view.root_keys
+            leaf_key2num, root_key2num = view.leaf_key2num, view.root_key2num
+
+        info_text = " ".join(output_text)
+        return (leaf_meta, root_meta, leaf_keys, root_keys, leaf_key2num, root_key2num), info_text
+
+    def get_model_names(self) -> List[str]:
+        return [row[0] for row in self.get_store().execute(
+                "SELECT model_name FROM models ORDER BY model_num")]
+
+    def get_predictions_hash(self, _db_file: Optional[PathType] = None) -> str:
+        """Hash of the imported predictions file, to key cached metrics without hashing
+        the whole database."""
+        return self.get_store().get_info("predictions_hash")
+
+    def load_predictions(self, _db_file: Optional[PathType] = None) -> Dict[str, LabelColumn]:
+        """
+        Returns:
+            {model_name: LabelColumn} aligned with the leaf positions, same as
+            streamlit_vis.json_stream.load_json_labels for the imported predictions file
+        """
+        self.get_metadata()
+        key2num = self.meta_index.leaf_key2num
+        columns = {model_name: LabelColumn.empty(key2num)
+                   for model_name in self.get_model_names()}
+        model_columns = list(columns.values())
+        for model_num, leaf_num, prediction in self.get_store().execute(
+                "SELECT model_num, leaf_num, prediction FROM predictions"):
+            model_columns[model_num].set(leaf_num, json.loads(prediction))
+        return columns
@@ -2,19 +2,23 @@ import streamlit as st
 import streamlit_permalink as stp
 
 from streamlit_vis.example_website.config import ExampleWebsiteConfig as conf
-from streamlit_vis.example_website.page_details import render_details_page
-from streamlit_vis.example_website.page_overview import render_overview_page
-from streamlit_vis.example_website.page_results import render_results_page
 from streamlit_vis.example_website.website import ExampleWebsite
-from streamlit_vis.st_utils import logger
+from streamlit_vis.st_utils import import_object, logger, render_timing_panel
+from streamlit_vis.timing import span, start_json_lines_export, start_metrics_server, start_run
 
 
 def app():
     logger.info("---------- App restart")
+    run_timings = start_run()
+    if conf.TIMING_METRICS_PORT is not None:
+        start_metrics_server(conf.TIMING_METRICS_PORT)
+    if conf.TIMING_JSONL_FILE is not None:
+        start_json_lines_export(conf.TIMING_JSONL_FILE, conf.TIMING_EXPORT_INTERVAL)
+    # the page modules are imported when the page is first shown
     pages = {
-            conf.PAGES[0]: render_overview_page,
-            conf.PAGES[1]: render_details_page,
-            conf.PAGES[2]: render_results_page,
+            conf.PAGES[0]: "streamlit_vis.example_website.page_overview:render_overview_page",
+            conf.PAGES[1]: "streamlit_vis.example_website.page_details:render_details_page",
+            conf.PAGES[2]: "streamlit_vis.example_website.page_results:render_results_page",
     }
 
     with st.sidebar:
@@ -26,22 +30,25 @@ def app():
                 "Split", splits, index=0, url_key=conf.G_SPLIT)
         _search = stp.text_input("Search for question", "", url_key=conf.G_SEARCH)
 
+    # the session only stores the navigation state, the data is shared between sessions
     ds_state_key = f"dataloader_{dataset_name}_{dataset_split}"
     website_component = st.session_state.get(ds_state_key, None)
     if website_component is None:
         # first time setup
         website_component = ExampleWebsite(conf())
-        website_component.on_reload()
-        website_component.setup_dataset(dataset_name, dataset_split)
-        website_component.setup_results()
-        logger.info("Initialization complete")
         st.session_state[ds_state_key] = website_component
-    else:
-        website_component.on_reload()
+    website_component.on_reload()
+    website_component.setup_shared(dataset_name, dataset_split)
+    try:
+        with st.sidebar:
+            if st.button("Reset page"):
+                website_component.reset_page()
 
-    with st.sidebar:
-        if st.button("Reset page"):
-            website_component.reset_page()
-
-    pages[page](website_component)
+        with span(f"page.{page}"):
+            import_object(pages[page])(website_component)
+    finally:
+        # also on errors and stopped runs, so the session does not keep evicted data alive
+        website_component.release_shared()
+    if conf.TIMING_PANEL:
+        render_timing_panel(run_timings)
     website_component.on_complete()
@@ -8,6 +8,10 @@ class ExampleWebsiteConfig(WebsiteConfig):
     # overwrite old constants
     PERPAGE = 5
     # set new ones
+    # models shown from the predictions file, in this order. The models are known before the
+    # file is parsed, so that it is only parsed when a page needs the predictions. Configured
+    # models missing in the file raise a KeyError. With SQLITE_METADATA, the imported models
+    # are shown instead
     MODEL_NAMES = ["random", "sayyes", "oracle"]
     METRIC_NAME = "acc"
     METRIC_FORMAT = {"acc": "{:.0%}"}
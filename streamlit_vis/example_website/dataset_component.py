@@ -5,43 +5,76 @@ Simple hierarchical data:
 - Leaf level: Few questions about the image (e.g. "How many gaussians are there?")
 
 """
-import json
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
 from streamlit_vis.dataset_base import VisionDatasetComponent
+from streamlit_vis.json_stream import iter_json_items, load_json_dict
+
+# subset groups and their subsets in display order, see get_leaf_subsets
+SUBSET_GROUPS = {
+    "all": {
+        "title": "All",
+        "description": "All questions",
+        "subsets": ["all"]},
+    "question_type": {
+        "title": "question type",
+        "description": "Group data by start of question.",
+        "subsets": ["number", "yesno"]}}
+
+
+def get_leaf_subsets(_leaf_id, leaf_data):
+    """Returns the (group_name, subset_name) pairs of a leaf.
+    Here, classify the questions with a simple heuristic."""
+    if leaf_data["question"].lower().startswith("how many"):
+        question_type = "number"
+    else:
+        question_type = "yesno"
+    return [("all", "all"), ("question_type", question_type)]
 
 
 @dataclass
 class GaussDatasetComponent(VisionDatasetComponent):
+    def get_metadata_files(self):
+        return [self.dataset_dir / f"meta_{self.split}_leaf.json",
+                self.dataset_dir / f"meta_{self.split}_root.json"]
+
     def _load_metadata(self):
         dataset_path = self.dataset_dir
         assert dataset_path.is_dir(), f"Path {dataset_path} not found."
 
-        meta_leaf = json.load((dataset_path / f"meta_{self.split}_leaf.json").open(
-                encoding="utf-8"))
-        meta_root = json.load((dataset_path / f"meta_{self.split}_root.json").open(
-                encoding="utf-8"))
+        leaf_file = dataset_path / f"meta_{self.split}_leaf.json"
+        root_file = dataset_path / f"meta_{self.split}_root.json"
+        # read both files at the same time
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            leaf_future = executor.submit(
+                    load_json_dict, leaf_file, progress_fn=self.get_progress_fn(leaf_file))
+            meta_root = load_json_dict(root_file, progress_fn=self.get_progress_fn(root_file))
+            meta_leaf = leaf_future.result()
         return meta_leaf, meta_root
 
+    def _iter_metadata(self):
+        dataset_path = self.dataset_dir
+        assert dataset_path.is_dir(), f"Path {dataset_path} not found."
+
+        leaf_file = dataset_path / f"meta_{self.split}_leaf.json"
+        root_file = dataset_path / f"meta_{self.split}_root.json"
+        leaf_items = ((keys[0], item) for keys, item in iter_json_items(
+                leaf_file, progress_fn=self.get_progress_fn(leaf_file)))
+        root_items = ((keys[0], item) for keys, item in iter_json_items(
+                root_file, progress_fn=self.get_progress_fn(root_file)))
+        return leaf_items, root_items
+
     def _load_subsets(self):
         meta_leaf, _meta_root = self.get_metadata()
 
-        # sort data into groups for analysis
-        # here, classify the questions with a simple heuristic
-        group_questions = {"number": [], "yesno": []}
-        for leaf_id, leaf_data in meta_leaf.items():
-            if leaf_data["question"].lower().startswith("how many"):
-                group_questions["number"].append(leaf_id)
-            else:
-                group_questions["yesno"].append(leaf_id)
-
         # format {group_name: {"title": x, "description": y, "subsets": { subset_name:  [ids] } } }
-        subsets = {"all": {
-                "title": "All",
-                "description": "All questions",
-                "subsets": {"all": list(meta_leaf.keys())}},
-                "question_type": {
-                        "title": "question type",
-                        "description": "Group data by start of question.",
-                        "subsets": group_questions}}
+        subsets = {group_name: {
+                "title": group_info["title"],
+                "description": group_info["description"],
+                "subsets": {subset_name: [] for subset_name in group_info["subsets"]}}
+                for group_name, group_info in SUBSET_GROUPS.items()}
+        for leaf_id, leaf_data in meta_leaf.items():
+            for group_name, subset_name in get_leaf_subsets(leaf_id, leaf_data):
+                subsets[group_name]["subsets"][subset_name].append(leaf_id)
         return subsets
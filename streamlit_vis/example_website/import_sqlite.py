@@ -0,0 +1,39 @@
+"""
+Import the example datasets into SQLite databases, used if SQLITE_METADATA is set in the config.
+
+Usage:
+    python -m streamlit_vis.example_website.import_sqlite
+"""
+import argparse
+
+from streamlit_vis.dataset_sqlite import SqliteDatasetComponent, import_json_dataset
+from streamlit_vis.example_website.config import ExampleWebsiteConfig as conf
+from streamlit_vis.example_website.dataset_component import SUBSET_GROUPS, get_leaf_subsets
+from streamlit_vis.st_utils import is_file_up_to_date
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--datasets", nargs="+", default=list(conf.DATASETS.keys()),
+                        help="Datasets to import, default all.")
+    parser.add_argument("--force", action="store_true",
+                        help="Import again even if the database is up to date.")
+    args = parser.parse_args()
+
+    for dataset_name in args.datasets:
+        for dataset_split in conf.DATASETS[dataset_name]:
+            dataset = SqliteDatasetComponent(
+                    dataset_name, dataset_split, conf.DATA_PATH, conf.THUMBNAIL_SIZE)
+            dataset_dir = dataset.dataset_dir
+            json_files = [dataset_dir / f"meta_{dataset_split}_leaf.json",
+                          dataset_dir / f"meta_{dataset_split}_root.json",
+                          dataset_dir / f"preds_{dataset_split}.json"]
+            if not args.force and is_file_up_to_date(dataset.db_file, json_files):
+                continue
+            import_json_dataset(
+                    dataset.db_file, json_files[0], json_files[1], conf.SEARCH_FIELD,
+                    SUBSET_GROUPS, get_leaf_subsets, predictions_file=json_files[2])
+
+
+if __name__ == "__main__":
+    main()
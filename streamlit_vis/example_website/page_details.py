@@ -1,12 +1,17 @@
+import math
+from typing import TYPE_CHECKING
+
 import pandas as pd
 import streamlit as st
-from matplotlib import colors as mpl_colors
-from pandas.io.formats.style import Styler
 
 from streamlit_vis.example_website.website import ExampleWebsite
-from streamlit_vis.st_utils import modify_css, read_image_for_streamlit
+from streamlit_vis.image_pyramid import ImagePyramid
+from streamlit_vis.st_utils import modify_css, render_image_data
 from streamlit_vis.website_dataset import StopRunning
 
+if TYPE_CHECKING:
+    from pandas.io.formats.style import Styler
+
 
 def render_details_page(website: ExampleWebsite):
     c = website.conf
@@ -21,11 +26,16 @@ def render_details_page(website: ExampleWebsite):
         return
 
     leaf_meta, _root_meta, _leaf_ids, _root_ids, _leaf_id2num, _root_id2num = metadata_object
+    website.prefetch_next_leaf(metadata_object, current_leaf_id)
 
     # render image and qa
     leaf_item = leaf_meta[current_leaf_id]
-    image_file = website.dataset.get_image_file(current_root_id)
-    st.image(read_image_for_streamlit(image_file), use_column_width=False)
+    pyramid = website.dataset.get_image_pyramid(current_root_id)
+    if pyramid is None:
+        image_file = website.dataset.get_display_image_file(current_root_id)
+        website.render_image_file(image_file)
+    else:
+        render_zoomable_image(website, pyramid, c.DISPLAY_SIZE)
     st.markdown(f"*Question:* {leaf_item['question']}")
     st.markdown(f"*Answer:* {leaf_item['answer']}")
 
@@ -40,13 +50,36 @@ def render_details_page(website: ExampleWebsite):
         acc = metrics_per_datapoint[model_name][c.METRIC_NAME][current_leaf_id]
         data_dict["acc%"].append(acc * 100)
 
+    # matplotlib is only needed here, import it on the first render of this table
+    from matplotlib import colors as mpl_colors  # pylint: disable=import-outside-toplevel
+
     df = pd.DataFrame(data_dict)
     ccmap = mpl_colors.LinearSegmentedColormap.from_list('rg', [[0.5, 0, 0], [0, 0.3, 0]])
 
-    def apply_style(df_styler: Styler):
+    def apply_style(df_styler: "Styler"):
         df_styler.background_gradient(cmap=ccmap, axis=1, vmin=0, vmax=100)
         df_styler.format({"acc%": "{:.0f}%"})
         return df_styler
 
     styler = df.style.pipe(apply_style)
     st.dataframe(styler)
+
+
+def render_zoomable_image(website: ExampleWebsite, pyramid: ImagePyramid, display_size: int):
+    """Show the display sized image, and only the tiles of the selected region when zooming in."""
+    width, height = pyramid.size
+    max_zoom_exp = max(1, math.ceil(math.log2(max(width, height) / display_size)))
+    zoom = st.select_slider("Zoom", [2 ** exp for exp in range(max_zoom_exp + 1)], value=1,
+                            format_func=lambda zoom_value: f"{zoom_value}x", key="zoom")
+    if zoom == 1:
+        website.render_image_file(pyramid.display_file)
+        return
+
+    col_x, col_y = st.columns(2)
+    center_x = col_x.slider("Horizontal position %", 0, 100, 50, key="zoom_x") / 100
+    center_y = col_y.slider("Vertical position %", 0, 100, 50, key="zoom_y") / 100
+    region_w, region_h = width / zoom, height / zoom
+    left = min(max(0., center_x * width - region_w / 2), width - region_w)
+    top = min(max(0., center_y * height - region_h / 2), height - region_h)
+    data = pyramid.get_region_bytes((left, top, left + region_w, top + region_h), display_size)
+    render_image_data(data, "JPEG", use_column_width=False)
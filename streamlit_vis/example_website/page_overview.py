@@ -1,7 +1,9 @@
 import streamlit as st
 
 from streamlit_vis.example_website.website import ExampleWebsite
-from streamlit_vis.st_utils import read_image_for_streamlit, modify_css
+from streamlit_vis.overview_grid import get_image_src, render_overview_grid
+from streamlit_vis.st_utils import modify_css
+from streamlit_vis.timing import span
 from streamlit_vis.website_dataset import StopRunning
 
 
@@ -21,18 +23,34 @@ def render_overview_page(website: ExampleWebsite):
     leaf_meta, root_meta, _leaf_ids, _root_ids, _leaf_id2num, _root_id2num = metadata_object
 
     # render images
-    thumbnails = {root_id: website.dataset.get_thumbnail_file(root_id) for root_id in
-                  current_root_ids}
-    cont = st.tabs(["Images and questions"])[0]
-    cols = cont.columns(len(current_root_ids), gap="small")
-    for i, root_id in enumerate(current_root_ids):
-        col = cols[i]
-        col.image(read_image_for_streamlit(thumbnails[root_id]),
-                  use_column_width=False)
-        leaf_ids_for_root = root_meta[root_id]["leaf_ids"]
-        for leaf_id in leaf_ids_for_root:
-            leaf_data = leaf_meta[leaf_id]
-            website.render_nav_button(
-                    leaf_data['question'], True, {c.G_LEAF_ID: leaf_id, c.G_PAGE: "details"},
-                    parent=col, key=f"qbutton_{leaf_id}")
-            col.markdown(f"Label: **{leaf_data['answer']}**")
+    thumbnails = website.load_thumbnails(current_root_ids)
+    website.prefetch_overview_pages(metadata_object, current_root_ids)
+    if c.OVERVIEW_GRID:
+        # one element for the whole page instead of one per image and question
+        items = []
+        for root_id in current_root_ids:
+            thumbnail = thumbnails[root_id]
+            image_src = website.get_thumbnail_url(thumbnail) or get_image_src(thumbnail)
+            items.append((root_id, image_src, [
+                    (leaf_id, leaf_meta[leaf_id]["question"], str(leaf_meta[leaf_id]["answer"]))
+                    for leaf_id in root_meta[root_id]["leaf_ids"]]))
+        with span("widgets.overview_grid"):
+            clicked_leaf_id = render_overview_grid(
+                    items, c.THUMBNAIL_SIZE, height=c.OVERVIEW_GRID_HEIGHT)
+        if clicked_leaf_id is not None:
+            website.set_params(**{c.G_LEAF_ID: clicked_leaf_id, c.G_PAGE: "details"})
+        return
+
+    with span("widgets.overview_images"):
+        cont = st.tabs(["Images and questions"])[0]
+        cols = cont.columns(len(current_root_ids), gap="small")
+        for i, root_id in enumerate(current_root_ids):
+            col = cols[i]
+            website.render_thumbnail(thumbnails[root_id], parent=col)
+            leaf_ids_for_root = root_meta[root_id]["leaf_ids"]
+            for leaf_id in leaf_ids_for_root:
+                leaf_data = leaf_meta[leaf_id]
+                website.render_nav_button(
+                        leaf_data['question'], True, {c.G_LEAF_ID: leaf_id, c.G_PAGE: "details"},
+                        parent=col, key=f"qbutton_{leaf_id}")
+                col.markdown(f"Label: **{leaf_data['answer']}**")
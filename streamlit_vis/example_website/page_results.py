@@ -1,7 +1,7 @@
 import streamlit as st
 import streamlit_permalink as stp
 
-from streamlit_vis.st_utils import modify_css, ColumnGridGenerator
+from streamlit_vis.st_utils import get_fragment_cache, modify_css, ColumnGridGenerator
 from streamlit_vis.example_website.website import ExampleWebsite
 
 
@@ -9,35 +9,20 @@ def str_to_html_anchor(in_str):
     return in_str.replace(" ", "_").replace("/", "_").replace("(", "").replace(")", "")
 
 
-def render_results_page(website: ExampleWebsite):
-    c = website.conf
-    modify_css(c)
-
-    st.markdown("# Results")
-
-    subsets = website.get_subsets()
+def render_results_html(subsets, subset_results, model_names, metric_formatters, show_abs,
+                        show_rel):
+    """
+    Returns:
+        markdown of the table of contents, {group_name: html table of the results}
+    """
+    metric_names = list(metric_formatters.keys())
     subset_size_reference = len(subsets["all"]["subsets"]["all"])
-    metric_names = [c.METRIC_NAME]
-    metric_formatters = {metric_name: c.METRIC_FORMAT[metric_name] for metric_name in metric_names}
-
-    _predictions, _metrics_per_datapoint, subset_results = website.get_results()
-    model_names = list(subset_results.keys())
-
-    st.markdown(f"Show results for models **{', '.join(model_names)}** "
-                f"on groups **{', '.join(subsets.keys())}**")
-    website.render_nav_menu("results")
-
-    cols = st.container().columns([3, 3], gap="small")
-    with cols[0]:
-        show_abs = stp.checkbox("Show absolute score", key="chk_show_abs", value=True)
-    with cols[1]:
-        show_rel = stp.checkbox("Show score relative to the 'all' set", key="chk_show_rel", value=True)
 
     # table of contents
     content_lines = ["**Table of Contents**"]
     for group_name, group_info in subsets.items():
         content_lines.append(f"[{group_info['title']}](#{str_to_html_anchor(group_name)})")
-    st.markdown("\n* ".join(content_lines), unsafe_allow_html=True)
+    toc_markdown = "\n* ".join(content_lines)
 
     # collect reference metrics (group_name=all subset_name=all)
     collected_metrics_ref = {}
@@ -47,15 +32,12 @@ def render_results_page(website: ExampleWebsite):
             collected_metrics_ref[model_name][metric_name] = subset_results[
                 model_name][metric_name]["all"]["all"]
 
+    tables_html = {}
     for group_name, group_info in subsets.items():
         show_abs_here = show_abs or group_name == "all" or not show_rel
         group_data = group_info["subsets"]
 
         # write the table
-        group_desc = group_info["description"]
-        group_title = group_info["title"]
-        st.header(f"{group_title}", anchor=str_to_html_anchor(group_name))
-        st.markdown(group_desc)
         table_html = ["<table>"]
         header_style = f" style='color: #777;'"
 
@@ -109,7 +91,49 @@ def render_results_page(website: ExampleWebsite):
 
                     table_html.append("</td>")
             table_html.append("</tr>")
-        st.markdown("".join(table_html), unsafe_allow_html=True)
+        tables_html[group_name] = "".join(table_html)
+    return toc_markdown, tables_html
+
+
+def render_results_page(website: ExampleWebsite):
+    c = website.conf
+    modify_css(c)
+
+    st.markdown("# Results")
+
+    subsets = website.get_subsets()
+    metric_names = [c.METRIC_NAME]
+    metric_formatters = {metric_name: c.METRIC_FORMAT[metric_name] for metric_name in metric_names}
+
+    _predictions, _metrics_per_datapoint, subset_results = website.get_results()
+    model_names = list(subset_results.keys())
+
+    st.markdown(f"Show results for models **{', '.join(model_names)}** "
+                f"on groups **{', '.join(subsets.keys())}**")
+    website.render_nav_menu("results")
+
+    cols = st.container().columns([3, 3], gap="small")
+    with cols[0]:
+        show_abs = stp.checkbox("Show absolute score", key="chk_show_abs", value=True)
+    with cols[1]:
+        show_rel = stp.checkbox("Show score relative to the 'all' set", key="chk_show_rel", value=True)
+
+    # the tables only change with the data, the checkboxes and the config,
+    # reruns that change nothing of these reuse the markup of any session
+    fragment_key = (
+            "results", website.dataset.name, website.dataset.split,
+            website.dataset.get_metadata_fingerprint(), website.data_fingerprint, show_abs,
+            show_rel, tuple(model_names), tuple(metric_formatters.items()))
+    toc_markdown, tables_html = get_fragment_cache(c.FRAGMENT_CACHE_ENTRIES).get_or_render(
+            fragment_key, lambda: render_results_html(
+                    subsets, subset_results, model_names, metric_formatters, show_abs, show_rel))
+    st.markdown(toc_markdown, unsafe_allow_html=True)
+
+    for group_name, group_info in subsets.items():
+        group_data = group_info["subsets"]
+        st.header(f"{group_info['title']}", anchor=str_to_html_anchor(group_name))
+        st.markdown(group_info["description"])
+        st.markdown(tables_html[group_name], unsafe_allow_html=True)
         st.write("<br />Display overview for subsets:", unsafe_allow_html=True)
 
         # create a grid of buttons to filter for this subset, with max 6 buttons per column
@@ -0,0 +1,40 @@
+"""
+Create thumbnails and indexes for the example datasets before starting the server.
+
+Usage:
+    python -m streamlit_vis.example_website.preprocess_data --workers 8
+"""
+import argparse
+
+from streamlit_vis.example_website.config import ExampleWebsiteConfig as conf
+from streamlit_vis.example_website.website import ExampleWebsite
+from streamlit_vis.preprocessing import preprocess_dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--datasets", nargs="+", default=list(conf.DATASETS.keys()),
+                        help="Datasets to preprocess, default all.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[conf.THUMBNAIL_SIZE],
+                        help="Thumbnail sizes (longer side in pixels).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of processes, default is the number of cpus.")
+    parser.add_argument("--force", action="store_true",
+                        help="Recreate thumbnails even if they are up to date.")
+    parser.add_argument("--packed", action="store_true",
+                        help="Store thumbnails in one packed file per split and size.")
+    parser.add_argument("--pyramids", action="store_true",
+                        help="Also create the image pyramids for zooming on the details page.")
+    args = parser.parse_args()
+
+    for dataset_name in args.datasets:
+        for dataset_split in conf.DATASETS[dataset_name]:
+            website = ExampleWebsite(conf())
+            website.setup_dataset(dataset_name, dataset_split)
+            preprocess_dataset(website.dataset, args.sizes, [conf.SEARCH_FIELD],
+                               num_workers=args.workers, force=args.force, packed=args.packed,
+                               pyramids=args.pyramids)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
-import json
 from dataclasses import dataclass
 
-import numpy as np
-
+from streamlit_vis.dataset_base import VisionDatasetComponent
 from streamlit_vis.example_website.config import ExampleWebsiteConfig
 from streamlit_vis.example_website.dataset_component import GaussDatasetComponent
+from streamlit_vis.json_stream import load_json_labels
+from streamlit_vis.metrics import exact_match
+from streamlit_vis.results import LazyResults
+from streamlit_vis.st_utils import import_object
 from streamlit_vis.website_dataset import DatasetWebsite
 
 
@@ -19,43 +21,50 @@ class ExampleWebsite(DatasetWebsite):
         self.conf: ExampleWebsiteConfig = self.conf
 
     def setup_dataset(self, dataset_name: str = "example_dataset", dataset_split: str = "train"):
-        self.dataset: GaussDatasetComponent = GaussDatasetComponent(
-                dataset_name, dataset_split, self.data_dir_base, self.conf.THUMBNAIL_SIZE)
-        self.dataset.preload_everything()
+        # the database is created by streamlit_vis.example_website.import_sqlite,
+        # sqlite is only imported if it is used
+        dataset_class = import_object("streamlit_vis.dataset_sqlite:SqliteDatasetComponent") \
+            if self.conf.SQLITE_METADATA else GaussDatasetComponent
+        self.dataset: VisionDatasetComponent = dataset_class(
+                dataset_name, dataset_split, self.data_dir_base, self.conf.THUMBNAIL_SIZE,
+                columnar=self.conf.COLUMNAR_METADATA,
+                transcode_min_bytes=self.conf.TRANSCODE_MIN_BYTES,
+                transcode_quality=self.conf.TRANSCODE_QUALITY,
+                pyramid_tile_size=self.conf.PYRAMID_TILE_SIZE,
+                display_size=self.conf.DISPLAY_SIZE)
+        self.dataset.load_progress = self.load_progress
+        self.dataset.preload_everything(
+                warm_up=self.conf.WARM_UP_SUBSETS, num_workers=self.conf.WARM_UP_WORKERS)
+        if not self.conf.SQLITE_METADATA:
+            self.dataset.get_search_index(self.conf.SEARCH_FIELD)
 
     def setup_results(self):
         c = self.conf
         dataset_dir = self.dataset.dataset_dir
         split = self.dataset.split
-        leaf_meta, _root_meta = self.dataset.get_metadata()
-        subsets = self.dataset.get_subsets()
-
-        # load predictions
-        predictions = json.load(open(dataset_dir / f"preds_{split}.json", encoding="utf8"))
-
-        # compute metrics per individual prediction
-        metrics_per_datapoint = {}
-        for model_name, model_preds in predictions.items():
-            metrics_per_datapoint[model_name] = {c.METRIC_NAME: {}}
-            for leaf_id, leaf_data in leaf_meta.items():
-                gt_answer = leaf_data["answer"]
-                model_answer = model_preds[leaf_id]
-                acc = float(gt_answer == model_answer)
-                metrics_per_datapoint[model_name][c.METRIC_NAME][leaf_id] = acc
-
-        # compute average metrics per subset
+
+        # predictions are loaded and metrics are computed per model when a page first needs them
         # note group_name "all" subset_name "all" will give the average over the whole dataset
-        subset_results = {}
-        for model_name, model_preds in predictions.items():
-            subset_results[model_name] = {c.METRIC_NAME: {}}
-            for group_name, group_info in subsets.items():
-                group_results = {}
-                for subset_name, subset_ll_ids in group_info["subsets"].items():
-                    subset_acc = float(np.mean([
-                            metrics_per_datapoint[model_name][c.METRIC_NAME][qid]
-                            for qid in subset_ll_ids]))
-                    group_results[subset_name] = subset_acc
-                subset_results[model_name][c.METRIC_NAME][group_name] = group_results
+        if self.conf.SQLITE_METADATA:
+            # the predictions were imported into the database
+            db_file = self.dataset.db_file
+            results = LazyResults(
+                    self.dataset,
+                    {model_name: db_file for model_name in self.dataset.get_model_names()},
+                    self.dataset.load_predictions, "answer", {c.METRIC_NAME: exact_match},
+                    get_predictions_hash=self.dataset.get_predictions_hash)
+        else:
+            predictions_file = dataset_dir / f"preds_{split}.json"
+            dataset = self.dataset
+
+            def _load_predictions_file(file):
+                return load_json_labels(file, dataset.meta_index.leaf_key2num,
+                                        progress_fn=dataset.get_progress_fn(file))
+
+            results = LazyResults(
+                    self.dataset, {model_name: predictions_file for model_name in c.MODEL_NAMES},
+                    _load_predictions_file, "answer", {c.METRIC_NAME: exact_match})
 
         self.predictions, self.metrics_per_datapoint, self.subset_results = (
-                predictions, metrics_per_datapoint, subset_results)
+                results.predictions, results.metrics_per_datapoint, results.subset_results)
+
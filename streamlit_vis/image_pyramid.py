@@ -0,0 +1,141 @@
+"""
+Multi-resolution image pyramids for large images. Level 0 is the full resolution, each further
+level halves the size until the image fits into a single tile. Each level is stored as jpeg
+tiles, so a zoomed region only needs to decode the tiles it overlaps.
+
+Layout of the pyramid directory:
+    info.json: size of the image and of all levels, written last
+    display.jpg: the whole image resized to the display size
+    {level}_{col}_{row}.jpg: tiles
+"""
+import io
+import json
+import math
+import os
+import uuid
+from pathlib import Path
+from typing import List, Tuple
+
+from PIL import Image
+
+from streamlit_vis.st_utils import PathType, save_image_atomic
+
+INFO_FILE = "info.json"
+DISPLAY_FILE = "display.jpg"
+
+
+class ImagePyramid:
+    def __init__(self, pyramid_dir: PathType, tile_size: int, level_sizes: List[Tuple[int, int]]):
+        self.pyramid_dir = Path(pyramid_dir)
+        self.tile_size = tile_size
+        self.level_sizes = level_sizes
+
+    @classmethod
+    def load(cls, pyramid_dir: PathType) -> "ImagePyramid":
+        pyramid_dir = Path(pyramid_dir)
+        info = json.loads((pyramid_dir / INFO_FILE).read_text(encoding="utf-8"))
+        return cls(pyramid_dir, info["tile_size"], [tuple(size) for size in info["level_sizes"]])
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.level_sizes[0]
+
+    @property
+    def n_levels(self) -> int:
+        return len(self.level_sizes)
+
+    @property
+    def display_file(self) -> Path:
+        return self.pyramid_dir / DISPLAY_FILE
+
+    def get_tile_file(self, level: int, col: int, row: int) -> Path:
+        return self.pyramid_dir / f"{level}_{col}_{row}.jpg"
+
+    def get_level_for_region(self, region_width: float, region_height: float,
+                             max_size: int) -> int:
+        """Coarsest level that still shows the region with at least max_size pixels on its
+        longer side, or level 0 if no level is large enough."""
+        full_w, _full_h = self.size
+        for level in reversed(range(self.n_levels)):
+            scale = self.level_sizes[level][0] / full_w
+            if max(region_width, region_height) * scale >= max_size:
+                return level
+        return 0
+
+    def get_region(self, box: Tuple[float, float, float, float], max_size: int) -> Image.Image:
+        """
+        Assemble a region of the image from the tiles of the matching level.
+
+        Args:
+            box: left, top, right, bottom in full resolution pixels
+            max_size: longer side of the output image
+
+        Returns:
+            RGB image of the region, at most max_size pixels on the longer side
+        """
+        left, top, right, bottom = box
+        level = self.get_level_for_region(right - left, bottom - top, max_size)
+        level_w, level_h = self.level_sizes[level]
+        scale = level_w / self.size[0]
+        x0, y0 = max(0, math.floor(left * scale)), max(0, math.floor(top * scale))
+        x1, y1 = min(level_w, math.ceil(right * scale)), min(level_h, math.ceil(bottom * scale))
+
+        ts = self.tile_size
+        region = Image.new("RGB", (x1 - x0, y1 - y0))
+        for row in range(y0 // ts, (y1 - 1) // ts + 1):
+            for col in range(x0 // ts, (x1 - 1) // ts + 1):
+                tile = Image.open(self.get_tile_file(level, col, row))
+                region.paste(tile, (col * ts - x0, row * ts - y0))
+
+        if max(region.size) > max_size:
+            region.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        return region
+
+    def get_region_bytes(self, box: Tuple[float, float, float, float], max_size: int,
+                         quality: int = 90) -> bytes:
+        """Region encoded as jpeg."""
+        buffer = io.BytesIO()
+        self.get_region(box, max_size).save(buffer, format="JPEG", quality=quality)
+        return buffer.getvalue()
+
+
+def get_image_size(image_file: PathType) -> Tuple[int, int]:
+    """Reads only the header of the image."""
+    with Image.open(image_file) as img:
+        return img.size
+
+
+def create_pyramid(image_file: PathType, pyramid_dir: PathType, tile_size: int = 512,
+                   display_size: int = 1024, quality: int = 90) -> ImagePyramid:
+    """Decode the image once and write all levels, the display image and the info file."""
+    pyramid_dir = Path(pyramid_dir)
+    os.makedirs(pyramid_dir, exist_ok=True)
+    img = Image.open(image_file).convert("RGB")
+
+    display_img = img.copy()
+    display_img.thumbnail((display_size, display_size), Image.Resampling.LANCZOS)
+    save_image_atomic(display_img, pyramid_dir / DISPLAY_FILE, format="JPEG", quality=quality)
+
+    pyramid = ImagePyramid(pyramid_dir, tile_size, [])
+    level = 0
+    while True:
+        level_w, level_h = img.size
+        pyramid.level_sizes.append((level_w, level_h))
+        for row in range(math.ceil(level_h / tile_size)):
+            for col in range(math.ceil(level_w / tile_size)):
+                x, y = col * tile_size, row * tile_size
+                tile = img.crop((x, y, min(x + tile_size, level_w), min(y + tile_size, level_h)))
+                save_image_atomic(tile, pyramid.get_tile_file(level, col, row), format="JPEG",
+                                  quality=quality)
+        if max(level_w, level_h) <= tile_size:
+            break
+        img = img.reduce(2)
+        level += 1
+
+    # the info file marks the pyramid as complete
+    info = {"tile_size": tile_size, "level_sizes": pyramid.level_sizes}
+    info_file = pyramid_dir / INFO_FILE
+    temp_file = info_file.with_name(f".{info_file.stem}_{uuid.uuid4().hex}.json")
+    temp_file.write_text(json.dumps(info), encoding="utf-8")
+    os.replace(temp_file, info_file)
+    return pyramid
@@ -0,0 +1,95 @@
+"""
+Check the import time of the app modules with `python -X importtime`, so that the cold start
+and the first render of a page do not get slower unnoticed. Modules that the streamlit server
+has already loaded (--preload) are imported first and do not count.
+
+Usage:
+    python -m streamlit_vis.import_time streamlit_vis.example_website.main_multiapp \\
+        streamlit_vis.example_website.app_visualizer --budget-ms 250
+
+Exits with code 1 if the import time of a module is over the budget.
+"""
+import argparse
+import re
+import subprocess
+import sys
+from typing import Dict, List, Sequence, Tuple
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|( *)(\S+)\s*$")
+
+
+def measure_import_time(module: str, preload: Sequence[str] = ("streamlit",),
+                        python: str = sys.executable) -> List[Tuple[str, int, int, int]]:
+    """
+    Import the module in a fresh interpreter after the preloaded modules.
+
+    Returns:
+        (module_name, self_us, cumulative_us, depth) for each module imported by the module,
+        in the order of -X importtime, the module itself is the last entry
+    """
+    code = "; ".join(f"import {name}" for name in list(preload) + [module])
+    proc = subprocess.run([python, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, check=False)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr}")
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    # top level entries are the preloaded modules and the module itself
+    top_level = [i for i, entry in enumerate(entries) if entry[3] == 0]
+    start = top_level[-2] + 1 if len(top_level) > 1 else 0
+    return entries[start:]
+
+
+def get_import_report(module: str, repeat: int = 3, top: int = 10, **kwargs
+                      ) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Returns:
+        best total import time in ms over the repeats, and the modules with the highest
+        cumulative time of that run as (module_name, ms)
+    """
+    best_entries = None
+    for _ in range(repeat):
+        entries = measure_import_time(module, **kwargs)
+        if best_entries is None or entries[-1][2] < best_entries[-1][2]:
+            best_entries = entries
+    total_ms = best_entries[-1][2] / 1000
+    # direct and indirect imports, without the module itself
+    heaviest: Dict[str, float] = {name: cumulative_us / 1000
+                                  for name, _self_us, cumulative_us, _depth in best_entries[:-1]}
+    return total_ms, sorted(heaviest.items(), key=lambda item: -item[1])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="+", help="Modules to check.")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="Maximum import time per module, default no limit.")
+    parser.add_argument("--preload", nargs="*", default=["streamlit"],
+                        help="Modules imported before, e.g. those loaded by the server.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of measurements per module, the fastest counts.")
+    parser.add_argument("--top", type=int, default=10,
+                        help="Number of the slowest imports to show per module.")
+    args = parser.parse_args()
+
+    over_budget = []
+    for module in args.modules:
+        total_ms, heaviest = get_import_report(
+                module, repeat=args.repeat, top=args.top, preload=args.preload)
+        print(f"{module}: {total_ms:.1f}ms")
+        for name, ms in heaviest:
+            print(f"    {ms:8.1f}ms  {name}")
+        if args.budget_ms is not None and total_ms > args.budget_ms:
+            over_budget.append(module)
+    if over_budget:
+        print(f"Over the budget of {args.budget_ms:.0f}ms: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,238 @@
 import os
 import os.path
 import pickle
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from typing import Any, Dict, Optional
 
 import joblib
+import numpy as np
 from joblib import register_store_backend
 # noinspection PyProtectedMember
-from joblib._store_backends import FileSystemStoreBackend
+from joblib._store_backends import FileSystemStoreBackend, CacheWarning
+
+from streamlit_vis.st_utils import logger
+from streamlit_vis.timing import timed
+
+DEFAULT_MAX_MEMORY_BYTES = 512 * 1024 ** 2
+DEFAULT_MAX_DISK_BYTES = 8 * 1024 ** 3
+# when the disk budget is exceeded, evict down to this fraction of it, so that not every
+# following write has to evict again
+DISK_EVICT_TO = 0.9
+
+# out-of-band format, used if the store has an mmap_mode: output.pkl starts with OOB_MAGIC,
+# followed by the pickled buffer layout [(offset, nbytes), ...] and the pickle protocol 5 data.
+# The buffers (e.g. the data of numpy arrays) are stored in BUFFERS_FILE and memory-mapped
+# on load. Plain pickles start with the PROTO opcode b"\x80", so both formats can be read.
+OOB_MAGIC = b"SVOOB1\n"
+BUFFERS_FILE = "output.buffers"
+BUFFER_ALIGN = 64
+
+
+class CacheTiers:
+    """
+    State shared by all store backends of one cache location: the in-memory LRU tier with the
+    loaded items, the disk usage and the counters.
+
+    Sizes of the items are measured as their pickled size on disk.
+    """
+
+    def __init__(self, max_memory_bytes: Optional[int] = DEFAULT_MAX_MEMORY_BYTES,
+                 max_disk_bytes: Optional[int] = DEFAULT_MAX_DISK_BYTES):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.lock = threading.Lock()
+        # {call_id: [item, nbytes, metadata, last_access]}, last_access as time.time(), so that
+        # the disk eviction sees the hits of the memory tier without touching the files
+        self.entries: OrderedDict = OrderedDict()
+        self.memory_bytes = 0
+        # unknown until the disk tier is scanned on the first write
+        self.disk_bytes: Optional[int] = None
+        self.memory_hits, self.disk_hits, self.misses = 0, 0, 0
+        self.memory_evictions, self.disk_evictions = 0, 0
+        self.disk_load_seconds, self.dump_seconds = 0., 0.
+        # one thread scans and evicts the disk tier at a time
+        self.disk_evicting = False
+        # call_ids dumped in the out-of-band format, joblib loads them right after the dump
+        # to return the memory-mapped version, this load is not a disk hit
+        self.dumped: set = set()
+
+    def get(self, call_id):
+        with self.lock:
+            entry = self.entries.get(call_id)
+            if entry is not None:
+                self.entries.move_to_end(call_id)
+                entry[3] = time.time()
+            return entry
+
+    def put(self, call_id, item, nbytes: int, metadata=None):
+        with self.lock:
+            self._remove(call_id)
+            if self.max_memory_bytes is not None and nbytes > self.max_memory_bytes:
+                return
+            self.entries[call_id] = [item, nbytes, metadata, time.time()]
+            self.memory_bytes += nbytes
+            self._evict()
+
+    def set_metadata(self, call_id, metadata):
+        with self.lock:
+            entry = self.entries.get(call_id)
+            if entry is not None:
+                entry[2] = metadata
+
+    def remove_prefix(self, prefix):
+        """Remove all items whose call_id starts with the given path."""
+        prefix = tuple(prefix)
+        with self.lock:
+            for call_id in [call_id for call_id in self.entries
+                            if call_id[:len(prefix)] == prefix]:
+                self._remove(call_id)
+            self.dumped = {call_id for call_id in self.dumped
+                           if call_id[:len(prefix)] != prefix}
+
+    def _remove(self, call_id):
+        entry = self.entries.pop(call_id, None)
+        if entry is not None:
+            self.memory_bytes -= entry[1]
+
+    def _evict(self):
+        if self.max_memory_bytes is None:
+            return
+        while self.memory_bytes > self.max_memory_bytes and self.entries:
+            _call_id, (_item, nbytes, _metadata, _last_access) = self.entries.popitem(last=False)
+            self.memory_bytes -= nbytes
+            self.memory_evictions += 1
+
+    def get_last_access(self) -> Dict[tuple, float]:
+        """{call_id: time of the last access} of the items in the memory tier."""
+        with self.lock:
+            return {call_id: entry[3] for call_id, entry in self.entries.items()}
+
+    def set_limits(self, max_memory_bytes: Optional[int], max_disk_bytes: Optional[int]):
+        with self.lock:
+            self.max_memory_bytes = max_memory_bytes
+            self.max_disk_bytes = max_disk_bytes
+            self._evict()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            n_disk_loads = max(self.disk_hits, 1)
+            n_dumps = max(self.misses, 1)
+            return {
+                "memory_hits": self.memory_hits, "disk_hits": self.disk_hits,
+                "misses": self.misses, "memory_evictions": self.memory_evictions,
+                "disk_evictions": self.disk_evictions, "memory_items": len(self.entries),
+                "memory_bytes": self.memory_bytes, "disk_bytes": self.disk_bytes,
+                "max_memory_bytes": self.max_memory_bytes, "max_disk_bytes": self.max_disk_bytes,
+                "disk_load_ms": 1000 * self.disk_load_seconds / n_disk_loads,
+                "dump_ms": 1000 * self.dump_seconds / n_dumps}
+
+
+_cache_tiers: Dict[str, CacheTiers] = {}
+_cache_tiers_lock = threading.Lock()
+
+
+def get_cache_tiers(location: str) -> CacheTiers:
+    """Process-wide tiers of a cache location, created with the default limits."""
+    location = os.path.abspath(location)
+    with _cache_tiers_lock:
+        if location not in _cache_tiers:
+            _cache_tiers[location] = CacheTiers()
+        return _cache_tiers[location]
 
 
 class StoreNoNumpy(FileSystemStoreBackend):
     """
     Store backend with pickle instead of numpy_pickle.
     This is alot faster for non-numpy objects (e.g. dicts).
+
+    Loaded and dumped items are also kept in an in-memory LRU tier, so repeated hits do not read
+    and unpickle the file again. The disk tier is bounded as well, the least recently used items
+    are deleted when it grows over its budget. See CacheTiers for the limits and the counters.
+
+    With mmap_mode "r" (or "c", "r+"), items are written in the out-of-band format (see
+    OOB_MAGIC) and contiguous arrays are loaded as memory maps of the cache file, without copying
+    and shared by all processes via the page cache. The memory tier keeps the maps open, so the
+    buffers count towards its budget as well.
     """
     NAME = "no_numpy"
 
-    def load_item(self, path, verbose=1, msg=None):
+    def configure(self, location, verbose=1, backend_options=None):
+        backend_options = {} if backend_options is None else backend_options
+        super().configure(location, verbose=verbose, backend_options=backend_options)
+        self.tiers = get_cache_tiers(self.location)
+        if "max_memory_bytes" in backend_options or "max_disk_bytes" in backend_options:
+            self.tiers.set_limits(
+                    backend_options.get("max_memory_bytes", self.tiers.max_memory_bytes),
+                    backend_options.get("max_disk_bytes", self.tiers.max_disk_bytes))
+
+    def contains_item(self, call_id):
+        if self.tiers.get(tuple(call_id)) is not None:
+            return True
+        return super().contains_item(call_id)
+
+    def get_metadata(self, call_id):
+        entry = self.tiers.get(tuple(call_id))
+        if entry is not None and entry[2] is not None:
+            return entry[2]
+        metadata = super().get_metadata(call_id)
+        self.tiers.set_metadata(tuple(call_id), metadata)
+        return metadata
+
+    def store_metadata(self, call_id, metadata):
+        super().store_metadata(call_id, metadata)
+        self.tiers.set_metadata(tuple(call_id), metadata)
+
+    def clear_item(self, call_id):
+        self.tiers.remove_prefix(call_id)
+        super().clear_item(call_id)
+
+    def clear_path(self, call_id):
+        self.tiers.remove_prefix(call_id)
+        super().clear_path(call_id)
+
+    def clear(self):
+        self.tiers.remove_prefix(())
+        super().clear()
+
+    @timed("joblib_cache.load_item")
+    def load_item(self, path, verbose=1, msg=None, timestamp=None, metadata=None):
+        entry = self.tiers.get(tuple(path))
+        if entry is not None:
+            with self.tiers.lock:
+                self.tiers.memory_hits += 1
+            return entry[0]
+
+        start_time = time.perf_counter()
+        item = self._load_item_from_disk(path, verbose, msg)
+        filename = os.path.join(self.location, *path, 'output.pkl')
+        nbytes = os.path.getsize(filename)
+        try:
+            # the memory-mapped buffers of the out-of-band format
+            nbytes += os.path.getsize(os.path.join(self.location, *path, BUFFERS_FILE))
+        except OSError:
+            pass
+        try:
+            # the access time orders the eviction, it is not updated on all file systems
+            os.utime(filename, ns=(time.time_ns(), os.stat(filename).st_mtime_ns))
+        except OSError:
+            pass
+        with self.tiers.lock:
+            if tuple(path) in self.tiers.dumped:
+                self.tiers.dumped.discard(tuple(path))
+            else:
+                self.tiers.disk_hits += 1
+                self.tiers.disk_load_seconds += time.perf_counter() - start_time
+        self.tiers.put(tuple(path), item, nbytes, metadata)
+        return item
+
+    def _load_item_from_disk(self, path, verbose=1, msg=None):
+        # newer joblib versions call load_item with timestamp and metadata instead of msg
         full_path = os.path.join(self.location, *path)
+        if msg is None:
+            msg = f"[Memory] Loading {os.path.basename(path[0])}"
 
         if verbose > 1:
             if verbose < 10:
@@ -32,25 +248,194 @@ class StoreNoNumpy(FileSystemStoreBackend):
             raise KeyError(f"Non-existing item (may have been cleared).\n"
                            f"File {filename} does not exist")
 
-        assert mmap_mode is None, "Standard pickle does not support mmap_mode"
         with self._open_item(filename, "rb") as fh:
-            item = pickle.load(fh)
-        return item
+            if fh.read(len(OOB_MAGIC)) != OOB_MAGIC:
+                fh.seek(0)
+                return pickle.load(fh)
+            layout = pickle.load(fh)
+            buffers = self._map_buffers(os.path.join(full_path, BUFFERS_FILE), layout,
+                                        "r" if mmap_mode is None else mmap_mode)
+            return pickle.load(fh, buffers=buffers)
+
+    @staticmethod
+    def _map_buffers(buffers_file, layout, mmap_mode):
+        if sum(nbytes for _offset, nbytes in layout) == 0:
+            # empty files can not be memory-mapped
+            return [b"" for _layout in layout]
+        buffers_map = np.memmap(buffers_file, dtype=np.uint8, mode=mmap_mode)
+        return [memoryview(buffers_map[offset:offset + nbytes]) for offset, nbytes in layout]
+
+    def _dump_out_of_band(self, item, item_path, filename) -> int:
+        """Returns the number of bytes written."""
+        buffers = []
+        data = pickle.dumps(item, protocol=5, buffer_callback=buffers.append)
+        raw_buffers = [buffer.raw() for buffer in buffers]
+        layout, offset = [], 0
+        for raw in raw_buffers:
+            offset = -(-offset // BUFFER_ALIGN) * BUFFER_ALIGN
+            layout.append((offset, raw.nbytes))
+            offset += raw.nbytes
+
+        def write_buffers(to_write, dest_filename):
+            with self._open_item(dest_filename, "wb") as fh:
+                for (buffer_offset, _nbytes), raw in zip(layout, to_write):
+                    fh.write(b"\0" * (buffer_offset - fh.tell()))
+                    fh.write(raw)
+
+        def write_func(to_write, dest_filename):
+            with self._open_item(dest_filename, "wb") as fh:
+                fh.write(OOB_MAGIC)
+                pickle.dump(layout, fh, protocol=pickle.HIGHEST_PROTOCOL)
+                fh.write(to_write)
+
+        # the buffers first, output.pkl marks the item as complete
+        self._concurrency_safe_write(
+                raw_buffers, os.path.join(item_path, BUFFERS_FILE), write_buffers)
+        self._concurrency_safe_write(data, filename, write_func)
+        return offset
+
+    @timed("joblib_cache.dump_item")
+    def dump_item(self, path, item, verbose=1):
+        # numpy_pickle.dump wraps numpy arrays (e.g. in columnar metadata) in a format that
+        # the standard pickle.load above cannot restore, so dump with standard pickle as well.
+        start_time = time.perf_counter()
+        try:
+            item_path = os.path.join(self.location, *path)
+            if not self._item_exists(item_path):
+                self.create_location(item_path)
+            filename = os.path.join(item_path, 'output.pkl')
+            if verbose > 10:
+                print(f'Persisting in {item_path}')
+
+            def write_func(to_write, dest_filename):
+                with self._open_item(dest_filename, "wb") as fh:
+                    pickle.dump(to_write, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+            buffers_nbytes = 0
+            if self.mmap_mode is None:
+                self._concurrency_safe_write(item, filename, write_func)
+            else:
+                buffers_nbytes = self._dump_out_of_band(item, item_path, filename)
+        except Exception as e:  # pylint: disable=broad-except
+            warnings.warn(f"Unable to cache to disk: {e}", CacheWarning)
+            return
+        nbytes = os.path.getsize(filename)
+        with self.tiers.lock:
+            self.tiers.misses += 1
+            self.tiers.dump_seconds += time.perf_counter() - start_time
+            if self.mmap_mode is not None:
+                self.tiers.dumped.add(tuple(path))
+        if self.mmap_mode is None:
+            self.tiers.put(tuple(path), item, nbytes)
+        # otherwise the memory-mapped version is put into the memory tier when it is loaded
+        self._enforce_disk_limit(nbytes + buffers_nbytes)
+
+    def _get_item_path(self, call_id) -> str:
+        return os.path.normpath(os.path.join(self.location, *call_id))
+
+    def _enforce_disk_limit(self, new_bytes: int):
+        tiers = self.tiers
+        with tiers.lock:
+            if tiers.max_disk_bytes is None:
+                return
+            if tiers.disk_bytes is not None:
+                tiers.disk_bytes += new_bytes
+                if tiers.disk_bytes <= tiers.max_disk_bytes:
+                    return
+            if tiers.disk_evicting:
+                return
+            tiers.disk_evicting = True
+        try:
+            self._evict_disk()
+        finally:
+            with tiers.lock:
+                tiers.disk_evicting = False
+
+    def _evict_disk(self):
+        # the directory walk and the deletes run outside the lock, so they do not block the hits
+        tiers = self.tiers
+        items = self.get_items()
+        disk_bytes = sum(item.size for item in items)
+        with tiers.lock:
+            # the scan includes the new item, writes during the scan may be counted or not
+            tiers.disk_bytes = disk_bytes
+            if tiers.max_disk_bytes is None or disk_bytes <= tiers.max_disk_bytes:
+                return
+            to_delete_bytes = disk_bytes - int(tiers.max_disk_bytes * DISK_EVICT_TO)
+
+        # the file access times miss the hits of the memory tier
+        last_access = {self._get_item_path(call_id): access_time
+                       for call_id, access_time in tiers.get_last_access().items()}
+
+        def _get_last_access(item):
+            return max(item.last_access.timestamp(),
+                       last_access.get(os.path.normpath(item.path), 0.))
+
+        items_to_delete, deleted_bytes = [], 0
+        for item in sorted(items, key=_get_last_access):
+            if deleted_bytes >= to_delete_bytes:
+                break
+            items_to_delete.append(item)
+            deleted_bytes += item.size
+        for item in items_to_delete:
+            try:
+                self.clear_location(item.path)
+            except OSError:
+                # another process may have deleted it already
+                pass
+        # the memory tier would keep returning the deleted items and keep their buffers mapped,
+        # this includes the items loaded during the eviction
+        deleted_paths = {os.path.normpath(item.path) for item in items_to_delete}
+        for call_id in tiers.get_last_access():
+            if self._get_item_path(call_id) in deleted_paths:
+                tiers.remove_prefix(call_id)
+        with tiers.lock:
+            tiers.disk_bytes -= deleted_bytes
+            tiers.disk_evictions += len(items_to_delete)
+        logger.info(f"Cache {self.location} evicted {len(items_to_delete)} items from disk. "
+                    f"Stats: {tiers.get_stats()}")
 
 
 register_store_backend(StoreNoNumpy.NAME, StoreNoNumpy)
 
 
-def get_joblib_memory(location="cache_joblib", verbose=1, numpy_capable=False):
+def get_joblib_memory(location="cache_joblib", verbose=1, numpy_capable=False,
+                      max_memory_bytes: Optional[int] = DEFAULT_MAX_MEMORY_BYTES,
+                      max_disk_bytes: Optional[int] = DEFAULT_MAX_DISK_BYTES,
+                      mmap_mode: Optional[str] = None):
     """
 
     Args:
         location: cache dir
         verbose: higher = more verbose
         numpy_capable: keep False unless needed, it makes loading alot slower for e.g. dicts
+        max_memory_bytes: budget of the in-memory tier, None for unlimited. Items in memory are
+            returned to every caller without a copy, so they must not be modified.
+        max_disk_bytes: budget of the cache dir, None for unlimited
+        mmap_mode: None, "r", "c" or "r+", memory-map the arrays of the cached results.
+            With "r", the arrays are read-only.
 
     Returns:
         memory: use as @memory.cache decorator for functions
     """
-    backend = "local" if numpy_capable else StoreNoNumpy.NAME
-    return joblib.Memory(location=location, backend=backend, verbose=verbose)
+    assert mmap_mode in (None, "r", "c", "r+"), f"Unsupported mmap_mode {mmap_mode}"
+    if numpy_capable:
+        return joblib.Memory(location=location, backend="local", verbose=verbose,
+                             mmap_mode=mmap_mode)
+    return joblib.Memory(location=location, backend=StoreNoNumpy.NAME, verbose=verbose,
+                         mmap_mode=mmap_mode, backend_options={"max_memory_bytes": max_memory_bytes,
+                                          "max_disk_bytes": max_disk_bytes})
+
+
+def get_cache_stats(memory: joblib.Memory) -> Dict[str, Any]:
+    """Counters of the memory and disk tiers, empty for other backends."""
+    tiers = getattr(memory.store_backend, "tiers", None)
+    return {} if tiers is None else tiers.get_stats()
+
+
+def set_cache_limits(memory: joblib.Memory, max_memory_bytes: Optional[int],
+                     max_disk_bytes: Optional[int]):
+    """Change the budgets of an existing cache, e.g. from the website config."""
+    tiers = getattr(memory.store_backend, "tiers", None)
+    if tiers is not None:
+        tiers.set_limits(max_memory_bytes, max_disk_bytes)
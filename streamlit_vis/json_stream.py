@@ -0,0 +1,222 @@
+"""
+Incremental parsing of large json files whose top levels are objects, e.g.
+{leaf_id: {...}} for metadata or {model_name: {leaf_id: prediction}} for predictions.
+
+The file is decoded in chunks and only the values below the streamed levels are parsed as
+python objects, so the raw text is never held in memory as a whole and the items can be written
+straight into compact structures.
+"""
+import codecs
+import json
+import re
+import time
+from json.decoder import scanstring
+from json.scanner import make_scanner
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from streamlit_vis.columnar import LabelColumn
+from streamlit_vis.st_utils import logger, PathType
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+WHITESPACE_CHARS = " \t\n\r"
+
+# progress_fn(bytes_read, total_bytes, n_items)
+ProgressFn = Callable[[int, int, int], None]
+
+
+class JsonStreamReader:
+    """
+    Args:
+        file: json file
+        chunk_size: number of bytes to read at once
+        log_every: log progress every this many bytes, None to disable
+        progress_fn: called after every chunk
+    """
+
+    def __init__(self, file: PathType, chunk_size: int = 16 * 1024 ** 2,
+                 log_every: Optional[int] = 256 * 1024 ** 2,
+                 progress_fn: Optional[ProgressFn] = None):
+        self.file = Path(file)
+        self.chunk_size = chunk_size
+        self.log_every = log_every
+        self.progress_fn = progress_fn
+        self.total_bytes = self.file.stat().st_size
+        self.bytes_read, self.n_items = 0, 0
+        self.buf, self.pos, self.eof = "", 0, False
+        self._decoder = json.JSONDecoder()
+        self._scan_once = make_scanner(self._decoder)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._fh = None
+        self._start_time, self._next_log = 0., 0
+
+    def iter_items(self, depth: int = 1) -> Iterator[Tuple[Tuple[str, ...], Any]]:
+        """
+        Yields:
+            (keys, value) for each value at the given depth of nested objects, e.g.
+            ((model_name, leaf_id), prediction) for depth 2.
+        """
+        self._start_time = time.perf_counter()
+        self._next_log = self.log_every or 0
+        with self.file.open("rb") as self._fh:
+            # utf-8 files may start with a byte order mark
+            if self._peek() == "\ufeff":
+                self.pos += 1
+            yield from self._iter_object(depth, ())
+            if self._peek() != "":
+                raise self._error("Extra data")
+        self._log_progress(done=True)
+
+    def _iter_object(self, depth: int, keys: Tuple[str, ...]):
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        if depth == 1:
+            yield from self._iter_values(keys)
+            return
+        while True:
+            if self._peek() != "\"":
+                raise self._error("Expecting property name enclosed in double quotes")
+            key = self._decode()
+            self._expect(":")
+            yield from self._iter_object(depth - 1, keys + (key,))
+            char = self._peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise self._error("Expecting ',' delimiter")
+
+    def _iter_values(self, keys: Tuple[str, ...]):
+        """Items of a non-empty object, the hot loop of the parser."""
+        scan_once, match_ws = self._scan_once, WHITESPACE.match
+        while True:
+            buf, pos = self.buf, self.pos
+            try:
+                while True:
+                    # the regex is only needed if there is whitespace
+                    if buf[pos] in WHITESPACE_CHARS:
+                        pos = match_ws(buf, pos).end()
+                    if buf[pos] != "\"":
+                        raise self._error(
+                                "Expecting property name enclosed in double quotes", pos)
+                    key, pos = scanstring(buf, pos + 1)
+                    if buf[pos] in WHITESPACE_CHARS:
+                        pos = match_ws(buf, pos).end()
+                    if buf[pos] != ":":
+                        raise self._error("Expecting ':' delimiter", pos)
+                    pos += 1
+                    if buf[pos] in WHITESPACE_CHARS:
+                        pos = match_ws(buf, pos).end()
+                    value, pos = scan_once(buf, pos)
+                    if pos < len(buf) and buf[pos] in WHITESPACE_CHARS:
+                        pos = match_ws(buf, pos).end()
+                    # a number at the end of the buffer may continue in the next chunk
+                    char = buf[pos] if pos < len(buf) else ""
+                    if char == "}" or char == ",":
+                        # the item is complete, continue from here after reading more
+                        pos += 1
+                        self.pos = pos
+                        self.n_items += 1
+                        yield keys + (key,), value
+                        if char == "}":
+                            return
+                    elif char != "" or self.eof:
+                        raise self._error("Expecting ',' delimiter", pos)
+                    else:
+                        raise IndexError
+            except (IndexError, StopIteration, json.JSONDecodeError) as e:
+                # the item continues in the next chunk, parse it again
+                if not self._read_more():
+                    if isinstance(e, json.JSONDecodeError):
+                        raise
+                    raise self._error("Unexpected end of file") from None
+
+    def _read_more(self) -> bool:
+        if self.eof:
+            return False
+        data = self._fh.read(self.chunk_size)
+        self.bytes_read += len(data)
+        self.eof = len(data) == 0
+        # drop the parsed text, keep the rest
+        self.buf = self.buf[self.pos:] + self._utf8.decode(data, final=self.eof)
+        self.pos = 0
+        self._log_progress()
+        return not self.eof
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character, empty at the end of the file."""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._read_more():
+                return self.buf[self.pos:self.pos + 1]
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise self._error(f"Expecting '{char}'")
+        self.pos += 1
+
+    def _decode(self):
+        # raw_decode does not skip leading whitespace
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # the value may continue in the next chunk
+                if self._read_more():
+                    continue
+                raise
+            if end == len(self.buf) and self._read_more():
+                # a number at the end of the buffer may continue in the next chunk
+                continue
+            self.pos = end
+            return value
+
+    def _error(self, msg: str, pos: Optional[int] = None):
+        return json.JSONDecodeError(msg, self.buf, self.pos if pos is None else pos)
+
+    def _log_progress(self, done: bool = False):
+        if self.progress_fn is not None:
+            self.progress_fn(self.bytes_read, self.total_bytes, self.n_items)
+        if self.log_every is None or self.total_bytes < self.log_every:
+            return
+        if not (done or self.bytes_read >= self._next_log):
+            return
+        self._next_log += self.log_every
+        elapsed = max(time.perf_counter() - self._start_time, 1e-9)
+        mb_read = self.bytes_read / 1024 ** 2
+        logger.info(f"{'Loaded' if done else 'Loading'} {self.file.name}: "
+                    f"{mb_read:.0f}/{self.total_bytes / 1024 ** 2:.0f}MB "
+                    f"({self.bytes_read / max(self.total_bytes, 1):.0%}), "
+                    f"{self.n_items:,d} items, {mb_read / elapsed:.1f}MB/s")
+
+
+def iter_json_items(file: PathType, depth: int = 1, **kwargs
+                    ) -> Iterator[Tuple[Tuple[str, ...], Any]]:
+    """See JsonStreamReader.iter_items, kwargs are passed to JsonStreamReader."""
+    return JsonStreamReader(file, **kwargs).iter_items(depth)
+
+
+def load_json_dict(file: PathType, **kwargs) -> Dict[str, Any]:
+    """Same result as json.load for a file with an object at the top level,
+    without holding the whole text in memory."""
+    return {keys[0]: value for keys, value in iter_json_items(file, 1, **kwargs)}
+
+
+def load_json_labels(file: PathType, key2num: Dict[str, int], **kwargs
+                     ) -> Dict[str, LabelColumn]:
+    """
+    Load a file {model_name: {leaf_id: label}} into a compact LabelColumn per model,
+    aligned with the leaf positions given by key2num. Unknown leaf ids are ignored.
+    """
+    columns: Dict[str, LabelColumn] = {}
+    for (model_name, leaf_id), label in iter_json_items(file, 2, **kwargs):
+        column = columns.get(model_name)
+        if column is None:
+            column = columns[model_name] = LabelColumn.empty(key2num)
+        leaf_num = key2num.get(leaf_id)
+        if leaf_num is not None:
+            column.set(leaf_num, label)
+    return columns
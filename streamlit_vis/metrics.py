@@ -0,0 +1,251 @@
+"""
+Vectorized computation of per-datapoint metrics and subset aggregates.
+
+Predictions and ground truth are encoded as integer label arrays aligned with the leaf positions
+of a MetaIndex. Metrics are computed in one pass per model and metric, and the averages of all
+subsets are computed at once from a precomputed SubsetIndex.
+"""
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from streamlit_vis.columnar import LabelColumn
+from streamlit_vis.data_utils import MetaIndex
+
+# metric_fn(gt_codes, pred_codes) -> metric value per datapoint
+MetricFn = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+MISSING_CODE = -1
+
+
+def exact_match(gt_codes: np.ndarray, pred_codes: np.ndarray) -> np.ndarray:
+    """1.0 where the prediction equals the ground truth. Missing predictions count as wrong."""
+    return ((gt_codes == pred_codes) & (pred_codes != MISSING_CODE)).astype(np.float64)
+
+
+def encode_labels(label_lists: List[List[Any]]) -> List[np.ndarray]:
+    """
+    Encode lists of labels to integer codes with one shared vocabulary, so equal labels get
+    equal codes across the lists. Labels are compared by value and type as with ==.
+
+    Returns:
+        codes for each list, MISSING_CODE where the label is None
+    """
+    all_labels = np.empty(sum(len(labels) for labels in label_lists), dtype=object)
+    all_labels[:] = [label for labels in label_lists for label in labels]
+    try:
+        all_codes, _uniques = pd.factorize(all_labels)
+        all_codes = all_codes.astype(np.int64)
+        all_codes[all_codes < 0] = MISSING_CODE
+    except TypeError:
+        # unhashable labels, e.g. lists of accepted answers
+        all_codes = _factorize_by_equality(all_labels)
+    offsets = np.cumsum([0] + [len(labels) for labels in label_lists])
+    return [all_codes[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _factorize_by_equality(labels: np.ndarray) -> np.ndarray:
+    """Slow path of encode_labels, unhashable labels are compared with == to the previous
+    unhashable labels."""
+    codes = np.full(len(labels), MISSING_CODE, dtype=np.int64)
+    hashable_codes: Dict[Any, int] = {}
+    unhashable_uniques: List[Tuple[Any, int]] = []
+    n_codes = 0
+    for label_i, label in enumerate(labels.tolist()):
+        if label is None:
+            continue
+        try:
+            code = hashable_codes.get(label)
+            if code is None:
+                code = hashable_codes[label] = n_codes
+                n_codes += 1
+        except TypeError:
+            code = next((unique_code for unique, unique_code in unhashable_uniques
+                         if unique == label), None)
+            if code is None:
+                code = n_codes
+                n_codes += 1
+                unhashable_uniques.append((label, code))
+        codes[label_i] = code
+    return codes
+
+
+def get_aligned_labels(labels: Dict[str, Any], leaf_keys: Sequence[str],
+                       key2num: Optional[Dict[str, int]] = None) -> List[Any]:
+    """Labels in the order of leaf_keys, None where the label is missing.
+    key2num are the positions of leaf_keys, given to skip the lookups by id if the labels
+    are a LabelColumn aligned with the same positions."""
+    if isinstance(labels, LabelColumn) and key2num is not None and labels.key2num is key2num:
+        label_list = labels.labels
+        return [None if code < 0 else label_list[code] for code in labels.codes.tolist()]
+    get_label = labels.get
+    return [get_label(leaf_id) for leaf_id in leaf_keys]
+
+
+class ArrayMapping(Mapping):
+    """Read-only {leaf_id: value} on top of an array aligned with the leaf positions."""
+
+    def __init__(self, values: np.ndarray, keys, key2num: Dict[str, int]):
+        self.values_array = values
+        self.all_keys = keys
+        self.key2num = key2num
+
+    def __getitem__(self, key):
+        return self.values_array[self.key2num[key]].item()
+
+    def __len__(self):
+        return len(self.values_array)
+
+    def __iter__(self):
+        return iter(self.all_keys)
+
+    def __contains__(self, key):
+        return key in self.key2num
+
+
+class SubsetIndex:
+    """
+    Leaf positions of all subsets concatenated, with the subset boundaries.
+
+    Attributes:
+        names: (group_name, subset_name) for each subset
+        leaf_nums: leaf positions of all subsets concatenated
+        offsets: subset i has the leaf positions leaf_nums[offsets[i]:offsets[i + 1]]
+    """
+
+    def __init__(self, group_names: List[str], names: List[Tuple[str, str]],
+                 leaf_nums: np.ndarray, offsets: np.ndarray):
+        self.group_names = group_names
+        self.names = names
+        self.leaf_nums = leaf_nums
+        self.offsets = offsets
+
+    @classmethod
+    def from_leaf_nums(cls, subset_leaf_nums: Dict[str, Dict[str, np.ndarray]]) -> "SubsetIndex":
+        """
+        Args:
+            subset_leaf_nums: {group_name: {subset_name: leaf positions}}
+        """
+        names, leaf_nums_list = [], []
+        for group_name, group_leaf_nums in subset_leaf_nums.items():
+            for subset_name, leaf_nums in group_leaf_nums.items():
+                names.append((group_name, subset_name))
+                leaf_nums_list.append(np.asarray(leaf_nums, dtype=np.int64))
+        sizes = np.array([len(leaf_nums) for leaf_nums in leaf_nums_list], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        leaf_nums = np.concatenate(leaf_nums_list) if leaf_nums_list else np.zeros(0, np.int64)
+        return cls(list(subset_leaf_nums.keys()), names, leaf_nums, offsets)
+
+    @classmethod
+    def from_subsets(cls, subsets: Dict[str, Any], meta_index: MetaIndex) -> "SubsetIndex":
+        """
+        Args:
+            subsets: {group_name: {"subsets": {subset_name: [leaf_ids]}}}
+            meta_index: positional index of the metadata
+        """
+        return cls.from_leaf_nums({
+                group_name: {subset_name: meta_index.get_leaf_nums(subset_leaf_ids)
+                             for subset_name, subset_leaf_ids in group_info["subsets"].items()}
+                for group_name, group_info in subsets.items()})
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def aggregate_mean(self, values: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            values: shape (..., n_leaves)
+
+        Returns:
+            mean over each subset, shape (..., n_subsets). Empty subsets are nan.
+        """
+        sizes = self.sizes
+        sums = np.zeros(values.shape[:-1] + (len(sizes),), dtype=np.float64)
+        nonempty = sizes > 0
+        if nonempty.any():
+            # reduceat sums from each start to the next start, empty subsets have to be removed
+            gathered = values[..., self.leaf_nums]
+            sums[..., nonempty] = np.add.reduceat(gathered, self.offsets[:-1][nonempty], axis=-1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / sizes
+        means[..., ~nonempty] = np.nan
+        return means
+
+
+def compute_metric_arrays(
+        meta_index: MetaIndex, subset_index: SubsetIndex,
+        predictions: Dict[str, Dict[str, Any]], gt_field: str, metric_fns: Dict[str, MetricFn]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns:
+        values: metric per datapoint, shape (n_models, n_metrics, n_leaves)
+        means: metric per subset, shape (n_models, n_metrics, n_subsets)
+    """
+    leaf_keys = meta_index.leaf_keys
+    model_names = list(predictions.keys())
+    metric_names = list(metric_fns.keys())
+    gt_labels = [value for _num, value in meta_index.iter_leaf_field(gt_field)]
+    pred_labels = [get_aligned_labels(predictions[model_name], leaf_keys,
+                                      meta_index.leaf_key2num)
+                   for model_name in model_names]
+    gt_codes, *all_pred_codes = encode_labels([gt_labels] + pred_labels)
+
+    values = np.zeros((len(model_names), len(metric_names), len(leaf_keys)), dtype=np.float64)
+    means = np.zeros((len(model_names), len(metric_names), len(subset_index.names)))
+    for model_i, pred_codes in enumerate(all_pred_codes):
+        for metric_i, metric_name in enumerate(metric_names):
+            values[model_i, metric_i] = metric_fns[metric_name](gt_codes, pred_codes)
+        # aggregate per model to limit the memory used for gathering the subsets
+        means[model_i] = subset_index.aggregate_mean(values[model_i])
+    return values, means
+
+
+def get_model_result_dicts(
+        meta_index: MetaIndex, subset_index: SubsetIndex, metric_names: List[str],
+        values: np.ndarray, means: np.ndarray):
+    """
+    Args:
+        values: metric per datapoint of one model, shape (n_metrics, n_leaves)
+        means: metric per subset of one model, shape (n_metrics, n_subsets)
+
+    Returns:
+        metrics_per_datapoint: {metric_name: {leaf_id: metric_value}}
+        subset_results: {metric_name: {group_name: {subset_name: value}}}
+    """
+    metrics_per_datapoint, subset_results = {}, {}
+    for metric_i, metric_name in enumerate(metric_names):
+        metrics_per_datapoint[metric_name] = ArrayMapping(
+                values[metric_i], meta_index.leaf_keys, meta_index.leaf_key2num)
+        group_results = {group_name: {} for group_name in subset_index.group_names}
+        for (group_name, subset_name), mean in zip(subset_index.names, means[metric_i].tolist()):
+            group_results[group_name][subset_name] = mean
+        subset_results[metric_name] = group_results
+    return metrics_per_datapoint, subset_results
+
+
+def compute_metrics(
+        meta_index: MetaIndex, subset_index: SubsetIndex,
+        predictions: Dict[str, Dict[str, Any]], gt_field: str, metric_fns: Dict[str, MetricFn]):
+    """
+    Args:
+        meta_index: positional index of the metadata
+        subset_index: leaf positions of all subsets
+        predictions: {model_name: {leaf_id: prediction}}
+        gt_field: field of the leaf metadata with the ground truth
+        metric_fns: {metric_name: metric_fn}
+
+    Returns:
+        metrics_per_datapoint: {model_name: {metric_name: {leaf_id: metric_value}}}
+        subset_results: {model_name: {metric_name: {group_name: {subset_name: value}}}}
+    """
+    values, means = compute_metric_arrays(
+            meta_index, subset_index, predictions, gt_field, metric_fns)
+    metrics_per_datapoint, subset_results = {}, {}
+    for model_i, model_name in enumerate(predictions.keys()):
+        metrics_per_datapoint[model_name], subset_results[model_name] = get_model_result_dicts(
+                meta_index, subset_index, list(metric_fns.keys()), values[model_i],
+                means[model_i])
+    return metrics_per_datapoint, subset_results
@@ -7,7 +7,14 @@ from streamlit_vis.st_utils import logger
 
 
 class BrowserComponent:
-    """Handles the browser navigation with url get params."""
+    """
+    Handles the browser navigation with url get params.
+
+    Params changed while rendering (set_param, set_params) are written to the url after the
+    page is rendered, followed by a rerun, see on_complete. Navigation buttons can instead call
+    navigate as on_click callback: callbacks run before the rerun caused by the click, so the
+    url is up to date when the page renders and the click costs a single render.
+    """
 
     def on_reload(self):
         self.url_get_params = st.experimental_get_query_params()
@@ -38,5 +45,13 @@ class BrowserComponent:
     def set_params(self, **update_dict):
         self.url_get_params.update(update_dict)
 
+    @staticmethod
+    def navigate(**update_dict):
+        """Update the url get params, to be used as button callback."""
+        # read the current url, the params of the session are only read again in on_reload
+        params = st.experimental_get_query_params()
+        params.update(update_dict)
+        st.experimental_set_query_params(**params)
+
     def clear_params(self):
         self.url_get_params = {}
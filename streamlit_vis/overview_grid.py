@@ -0,0 +1,59 @@
+"""
+Overview grid as a single custom component instead of one streamlit element per image and
+question. The data of the page is sent in one message and the browser only creates the elements
+of the visible rows, so pages with hundreds of images stay fast.
+
+The frontend is plain javascript in static/overview_grid, there is no build step.
+"""
+import base64
+from typing import List, Optional, Sequence, Tuple, Union
+
+import streamlit as st
+from importlib_resources import files
+
+import streamlit_vis
+
+# (root_id, image_src, [(leaf_id, text, label)]) for each image
+GridItem = Tuple[str, str, Sequence[Tuple[str, str, str]]]
+
+_component_func = None
+
+
+def _get_component_func():
+    # declared on first use, so importing this module stays cheap
+    global _component_func  # pylint: disable=global-statement
+    if _component_func is None:
+        import streamlit.components.v1 as components
+        # noinspection PyTypeChecker
+        _component_func = components.declare_component(
+                "overview_grid", path=str(files(streamlit_vis) / "static" / "overview_grid"))
+    return _component_func
+
+
+def get_image_src(data: Union[bytes, memoryview], mime_type: str = "image/jpeg") -> str:
+    """Encoded image as a data url, to send it to the browser within the grid data."""
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def render_overview_grid(items: List[GridItem], thumbnail_size: int, height: int = 800,
+                         key: str = "overview_grid") -> Optional[str]:
+    """
+    Args:
+        items: images of the page, see GridItem
+        thumbnail_size: size of the image cells in pixels
+        height: maximum height of the grid, it scrolls if the page is larger
+        key: widget key, also used to remember the last click in the session state
+
+    Returns:
+        leaf_id of the question that was clicked, only in the run right after the click
+    """
+    value = _get_component_func()(
+            items=items, thumbnail_size=thumbnail_size, height=height, key=key, default=None)
+    if value is None:
+        return None
+    # the component keeps returning its last value, report each click only once
+    click_state_key = f"{key}_last_click"
+    if st.session_state.get(click_state_key) == value["click"]:
+        return None
+    st.session_state[click_state_key] = value["click"]
+    return value["leaf_id"]
@@ -0,0 +1,65 @@
+"""
+Concurrent loading of the current page and background prefetching of the pages the user is
+likely to visit next. The thread pools are shared by all sessions of the process.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, Iterable, List, Optional
+
+from streamlit_vis.st_utils import logger
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    """Process-wide bounded thread pool. max_workers is only used when the pool is created."""
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix=f"streamlit_vis_{name}")
+        return _executors[name]
+
+
+class Prefetcher:
+    """
+    Per-session scheduler. Call new_page whenever the page is rendered again: prefetch tasks of
+    the previous render that did not start yet are cancelled or skipped.
+    """
+
+    def __init__(self, load_workers: int = 8, prefetch_workers: int = 2):
+        self.load_workers = load_workers
+        self.prefetch_workers = prefetch_workers
+        self.generation = 0
+        self.futures: List[Future] = []
+
+    def new_page(self):
+        self.generation += 1
+        for future in self.futures:
+            future.cancel()
+        self.futures = []
+
+    def map(self, fn: Callable, items: Iterable) -> List:
+        """Run fn for all items concurrently and return the results in order."""
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        executor = get_executor("load", self.load_workers)
+        return list(executor.map(fn, items))
+
+    def prefetch(self, fn: Callable, items: Iterable, name: Optional[str] = None):
+        """Run fn for all items in the background, ignoring the results."""
+        generation = self.generation
+        name = getattr(fn, "__name__", "task") if name is None else name
+
+        def _task(item):
+            if self.generation != generation:
+                # the user navigated away, the result is not needed anymore
+                return
+            try:
+                fn(item)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.warning(f"Prefetch {name} failed for {item}: {e}")
+
+        executor = get_executor("prefetch", self.prefetch_workers)
+        self.futures.extend(executor.submit(_task, item) for item in items)
@@ -0,0 +1,166 @@
+"""
+Offline preprocessing of a dataset, so the server starts warm: thumbnails are created with a
+process pool, search indexes are saved to disk and the subset filters are written to the cache.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional, Sequence
+
+from streamlit_vis.dataset_base import VisionDatasetComponent
+from streamlit_vis.image_pyramid import INFO_FILE, create_pyramid, get_image_size
+from streamlit_vis.st_utils import (
+    logger, create_thumbnail, create_thumbnail_bytes, is_file_up_to_date)
+
+
+def _create_thumbnail_task(task):
+    image_file, thumbnail_file, thumb_size = task
+    create_thumbnail(image_file, thumbnail_file, longer_side=thumb_size)
+
+
+def _create_thumbnail_bytes_task(task):
+    image_file, thumb_size = task
+    return create_thumbnail_bytes(image_file, longer_side=thumb_size)
+
+
+def _log_progress(results: Iterable, total: int, log_every: int):
+    start_time = time.perf_counter()
+    for n_done, result in enumerate(results, start=1):
+        if n_done % log_every == 0 or n_done == total:
+            elapsed = time.perf_counter() - start_time
+            logger.info(f"Created {n_done}/{total} thumbnails ({n_done / elapsed:.1f}/s)")
+        yield result
+
+
+def create_thumbnails(
+        dataset: VisionDatasetComponent, thumb_sizes: Sequence[int],
+        num_workers: Optional[int] = None, force: bool = False, log_every: int = 1000):
+    """
+    Create all thumbnails of the dataset in parallel. Thumbnails that are newer than their
+    image are skipped, unless force is True.
+
+    Args:
+        dataset: dataset component
+        thumb_sizes: longer side of the thumbnails in pixels
+        num_workers: number of processes, default is the number of cpus
+        force: recreate all thumbnails
+        log_every: log progress every n thumbnails
+
+    Returns:
+        number of created thumbnails, number of skipped thumbnails
+    """
+    _leaf_meta, root_meta = dataset.get_metadata()
+    tasks, n_skipped = [], 0
+    for root_id in root_meta.keys():
+        image_file = dataset.get_image_file(root_id)
+        for thumb_size in thumb_sizes:
+            thumbnail_file = dataset.get_thumbnail_path(root_id, thumb_size)
+            if not force and is_file_up_to_date(thumbnail_file, [image_file]):
+                n_skipped += 1
+                continue
+            tasks.append((image_file, thumbnail_file, thumb_size))
+    logger.info(f"{dataset.name}/{dataset.split}: Creating {len(tasks)} thumbnails, "
+                f"{n_skipped} are up to date.")
+    if len(tasks) == 0:
+        return 0, n_skipped
+
+    with ProcessPoolExecutor(num_workers) as executor:
+        results = executor.map(_create_thumbnail_task, tasks, chunksize=16)
+        for _ in _log_progress(results, len(tasks), log_every):
+            pass
+    return len(tasks), n_skipped
+
+
+def create_thumbnail_pack(
+        dataset: VisionDatasetComponent, thumb_size: int, num_workers: Optional[int] = None,
+        force: bool = False, log_every: int = 1000):
+    """
+    Create the packed thumbnails of the dataset (see streamlit_vis.thumbnail_pack) in parallel.
+    The pack is rebuilt if the metadata changed, otherwise only missing thumbnails and those of
+    images that changed since the last run are appended.
+
+    Returns:
+        number of created thumbnails, number of skipped thumbnails
+    """
+    dataset.get_metadata()
+    root_keys = dataset.root_keys
+    n_roots = len(root_keys)
+    store = dataset.get_thumbnail_pack_store(thumb_size)
+    reset = force or not is_file_up_to_date(store.index_file, dataset.get_metadata_files())
+    if reset:
+        root_nums = list(range(n_roots))
+    else:
+        root_nums = set(store.get_missing(n_roots).tolist())
+        for root_num, root_id in enumerate(root_keys):
+            if not is_file_up_to_date(store.index_file, [dataset.get_image_file(root_id)]):
+                root_nums.add(root_num)
+        root_nums = sorted(root_nums)
+    n_skipped = n_roots - len(root_nums)
+    logger.info(f"{dataset.name}/{dataset.split}: Packing {len(root_nums)} thumbnails, "
+                f"{n_skipped} are up to date.")
+    if len(root_nums) == 0:
+        return 0, n_skipped
+
+    tasks = [(dataset.get_image_file(root_keys[root_num]), thumb_size) for root_num in root_nums]
+    with ProcessPoolExecutor(num_workers) as executor:
+        results = executor.map(_create_thumbnail_bytes_task, tasks, chunksize=16)
+        store.write(n_roots, zip(root_nums, _log_progress(results, len(tasks), log_every)),
+                    reset=reset)
+    return len(root_nums), n_skipped
+
+
+def _create_pyramid_task(task):
+    image_file, pyramid_dir, force, kwargs = task
+    if not force and is_file_up_to_date(pyramid_dir / INFO_FILE, [image_file]):
+        return False
+    if max(get_image_size(image_file)) <= kwargs["display_size"]:
+        return False
+    create_pyramid(image_file, pyramid_dir, **kwargs)
+    return True
+
+
+def create_pyramids(dataset: VisionDatasetComponent, num_workers: Optional[int] = None,
+                    force: bool = False, log_every: int = 1000):
+    """
+    Create the image pyramids (see streamlit_vis.image_pyramid) of all images larger than the
+    display size in parallel. Pyramids that are newer than their image are skipped.
+
+    Returns:
+        number of created pyramids, number of skipped images
+    """
+    _leaf_meta, root_meta = dataset.get_metadata()
+    kwargs = {"tile_size": dataset.pyramid_tile_size, "display_size": dataset.display_size,
+              "quality": dataset.transcode_quality}
+    tasks = [(dataset.get_image_file(root_id), dataset.get_pyramid_dir(root_id), force, kwargs)
+             for root_id in root_meta.keys()]
+    logger.info(f"{dataset.name}/{dataset.split}: Checking {len(tasks)} images for pyramids.")
+    with ProcessPoolExecutor(num_workers) as executor:
+        results = executor.map(_create_pyramid_task, tasks, chunksize=16)
+        n_created = sum(_log_progress(results, len(tasks), log_every))
+    return n_created, len(tasks) - n_created
+
+
+def build_indexes(dataset: VisionDatasetComponent, search_fields: Sequence[str],
+                  num_workers: Optional[int] = None):
+    """Save the search indexes and write the subset filters to the cache."""
+    dataset.preload_everything()
+    for field in search_fields:
+        index_file = dataset.save_search_index(field)
+        logger.info(f"Saved search index for field {field} to {index_file}")
+    dataset.warm_up_subsets(num_workers)
+    logger.info(f"{dataset.name}/{dataset.split}: Indexes complete.")
+
+
+def preprocess_dataset(
+        dataset: VisionDatasetComponent, thumb_sizes: Sequence[int],
+        search_fields: Sequence[str], num_workers: Optional[int] = None, force: bool = False,
+        packed: bool = False, pyramids: bool = False):
+    """If packed is True, create packed thumbnails instead of one file per thumbnail.
+    If pyramids is True, also create the image pyramids for the details page."""
+    build_indexes(dataset, search_fields, num_workers=num_workers)
+    if pyramids and dataset.pyramid_tile_size is not None:
+        create_pyramids(dataset, num_workers=num_workers, force=force)
+    if packed:
+        for thumb_size in thumb_sizes:
+            create_thumbnail_pack(dataset, thumb_size, num_workers=num_workers, force=force)
+    else:
+        create_thumbnails(dataset, thumb_sizes, num_workers=num_workers, force=force)
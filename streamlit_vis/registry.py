@@ -0,0 +1,254 @@
+"""
+Process-wide registry of loaded data, shared by all browser sessions.
+"""
+import sys
+import threading
+import types
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from streamlit_vis.prefetch import get_executor
+from streamlit_vis.st_utils import logger
+
+
+def estimate_nbytes(obj: Any) -> int:
+    """Estimate the memory used by an object and everything it references."""
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+            continue
+        if isinstance(item, np.ndarray):
+            total += item.nbytes if item.base is None else sys.getsizeof(item)
+            if item.dtype == object:
+                stack.extend(item.ravel().tolist())
+            continue
+        total += sys.getsizeof(item)
+        if isinstance(item, (str, bytes, int, float, bool)) or item is None:
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        if hasattr(item, "__dict__"):
+            stack.append(item.__dict__)
+    return total
+
+
+class LoadProgress:
+    """
+    Progress of a background load, written by the loading thread and read by the waiting
+    sessions. The current stage covers the fraction [start, end] of the whole load, files read
+    in the stage report their bytes via get_file_progress_fn.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage, self.start, self.end = "Waiting", 0., 0.
+        self.files: Dict[str, Tuple[int, int]] = {}
+
+    def set_stage(self, stage: str, start: float, end: float):
+        with self._lock:
+            self.stage, self.start, self.end = stage, start, end
+            self.files = {}
+
+    def get_file_progress_fn(self, name: str, total_bytes: int = 0
+                             ) -> Callable[[int, int, int], None]:
+        """Returns a progress_fn for streamlit_vis.json_stream readers. Give the total_bytes of
+        files that are read later in the stage, so the progress does not jump back."""
+        with self._lock:
+            self.files[name] = (0, total_bytes)
+
+        def _progress_fn(bytes_read: int, total_bytes: int, _n_items: int):
+            with self._lock:
+                self.files[name] = (bytes_read, total_bytes)
+
+        return _progress_fn
+
+    def get(self) -> Tuple[float, str]:
+        """
+        Returns:
+            fraction of the whole load between 0 and 1, and a message
+        """
+        with self._lock:
+            bytes_read = sum(file_read for file_read, _file_total in self.files.values())
+            total_bytes = sum(file_total for _file_read, file_total in self.files.values())
+            if total_bytes == 0:
+                return self.start, self.stage
+            fraction = self.start + (self.end - self.start) * min(bytes_read / total_bytes, 1.)
+            return fraction, (f"{self.stage} ({bytes_read / 1024 ** 2:.0f}/"
+                              f"{total_bytes / 1024 ** 2:.0f}MB)")
+
+
+class DatasetRegistry:
+    """
+    Thread-safe registry of loaded data with a byte budget and LRU eviction of whole entries.
+    Data is loaded in a background thread, concurrent requests for the same key share
+    a single in-flight load.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, load_workers: int = 2):
+        self.max_bytes = max_bytes
+        self.load_workers = load_workers
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        # {key: (future, progress)} of the loads in progress
+        self._loading: Dict[Hashable, Tuple[Future, LoadProgress]] = {}
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def get_or_load(self, key: Hashable, load_fn: Callable[[], Any],
+                    size_fn: Callable[[Any], int] = estimate_nbytes):
+        """
+        Args:
+            key: e.g. (dataset_name, split, data_fingerprint)
+            load_fn: called without arguments to load the data on a miss
+            size_fn: estimates the size of the loaded data in bytes
+
+        Returns:
+            the loaded data
+        """
+        future, _progress = self.get_or_load_async(key, lambda _progress: load_fn(), size_fn)
+        return future.result()
+
+    def get_or_load_async(self, key: Hashable, load_fn: Callable[[LoadProgress], Any],
+                          size_fn: Callable[[Any], int] = estimate_nbytes,
+                          executor: Optional[Executor] = None,
+                          on_loaded: Optional[Callable[[Any], None]] = None
+                          ) -> Tuple[Future, LoadProgress]:
+        """
+        Same as get_or_load without blocking.
+
+        Args:
+            load_fn: called with a LoadProgress to report the progress to
+            executor: runs the load, default is a process-wide pool with load_workers threads
+            on_loaded: called with the loaded data after it is registered and measured, e.g. to
+                start loading more data in the background, see update_nbytes
+
+        Returns:
+            future of the loaded data, already done on a hit, and the progress of the load
+        """
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                future = Future()
+                future.set_result(value)
+                progress = LoadProgress()
+                progress.set_stage("Done", 1., 1.)
+                return future, progress
+            if key in self._loading:
+                # another session started loading it already
+                return self._loading[key]
+            self.misses += 1
+            progress = LoadProgress()
+            if executor is None:
+                executor = get_executor("dataset_load", self.load_workers)
+            future = executor.submit(self._load, key, load_fn, size_fn, progress, on_loaded)
+            self._loading[key] = (future, progress)
+            return future, progress
+
+    def _load(self, key: Hashable, load_fn: Callable[[LoadProgress], Any],
+              size_fn: Callable[[Any], int], progress: LoadProgress,
+              on_loaded: Optional[Callable[[Any], None]] = None):
+        logger.info(f"Registry miss, loading {key}")
+        try:
+            value = load_fn(progress)
+            nbytes = size_fn(value)
+            with self._lock:
+                self._entries[key] = (value, nbytes)
+                self._evict(keep=key)
+                logger.info(f"Registry loaded {key} with {nbytes / 1024 ** 2:.1f}MB. "
+                            f"Stats: {self._get_stats()}")
+            if on_loaded is not None:
+                on_loaded(value)
+            return value
+        finally:
+            # on errors, the next request loads again
+            with self._lock:
+                self._loading.pop(key, None)
+
+    def update_nbytes(self, key: Hashable, size_fn: Callable[[Any], int] = estimate_nbytes):
+        """Measure an entry again after it changed, e.g. when data was added in the background.
+        The caller has to make sure that the data is not changed while it is measured."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        nbytes = size_fn(entry[0])
+        with self._lock:
+            # the entry may have been evicted or replaced while measuring
+            if self._entries.get(key) is entry:
+                self._entries[key] = (entry[0], nbytes)
+                self._evict(keep=key)
+                logger.info(f"Registry updated {key} to {nbytes / 1024 ** 2:.1f}MB. "
+                            f"Stats: {self._get_stats()}")
+
+    def remove(self, key: Hashable):
+        """Drop an entry, so the next request loads it again."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def _evict(self, keep: Optional[Hashable] = None):
+        if self.max_bytes is None:
+            return
+        for key in list(self._entries.keys()):
+            if self._get_nbytes() <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            del self._entries[key]
+            self.evictions += 1
+            logger.info(f"Registry evicted {key}")
+
+    def _get_nbytes(self):
+        return sum(nbytes for _value, nbytes in self._entries.values())
+
+    def _get_stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self._entries), "nbytes": self._get_nbytes(),
+                "max_bytes": self.max_bytes}
+
+    def get_stats(self) -> Dict[str, Optional[int]]:
+        with self._lock:
+            return self._get_stats()
+
+    def set_max_bytes(self, max_bytes: Optional[int]):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_registry: Optional[DatasetRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_dataset_registry(max_bytes: Optional[int] = None,
+                         load_workers: int = 2) -> DatasetRegistry:
+    """
+    Returns the process-wide registry. The arguments are only used when the registry is created.
+    """
+    global _registry  # pylint: disable=global-statement
+    with _registry_lock:
+        if _registry is None:
+            _registry = DatasetRegistry(max_bytes, load_workers)
+        return _registry
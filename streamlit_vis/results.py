@@ -0,0 +1,177 @@
+"""
+Lazy per-model results: predictions are loaded and metrics are computed for a model only when a
+page first asks for it. The metric arrays are persisted to the joblib cache, keyed by a content
+hash of the predictions file, the subset definitions and the metadata, so a restart or another
+session reuses them without recomputing.
+"""
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+
+from streamlit_vis.data_utils import get_file_hash, mem
+from streamlit_vis.dataset_base import VisionDatasetComponent
+from streamlit_vis.metrics import (
+    MetricFn, compute_metric_arrays, get_model_result_dicts, SubsetIndex)
+from streamlit_vis.st_utils import logger
+
+
+@mem.cache(ignore=["results"])
+def compute_metric_arrays_cached(_cache_key: str, results: "LazyResults", model_name: str
+                                 ) -> Tuple[np.ndarray, np.ndarray]:
+    """Metric arrays of a single model, only the arrays are written to the cache.
+    The predictions are only loaded if the arrays are not in the cache."""
+    values, means = compute_metric_arrays(
+            results.dataset.meta_index, results.subset_index,
+            {model_name: results.get_predictions(model_name)}, results.gt_field,
+            results.metric_fns)
+    return values[0], means[0]
+
+
+class ModelResults:
+    def __init__(self, predictions, metrics_per_datapoint, subset_results):
+        self.predictions = predictions
+        self.metrics_per_datapoint = metrics_per_datapoint
+        self.subset_results = subset_results
+
+
+class LazyResults:
+    """
+    Thread-safe per-model results, can be shared between sessions.
+
+    Args:
+        dataset: loaded dataset component
+        predictions_files: {model_name: file with the predictions of this model}.
+            Several models can share one file.
+        load_predictions_file: loads a file to {model_name: {leaf_id: prediction}}
+        gt_field: field of the leaf metadata with the ground truth
+        metric_fns: {metric_name: metric_fn}, see streamlit_vis.metrics
+        get_predictions_hash: returns the content hash of a predictions file for the cache
+            keys, by default the hash of the whole file
+    """
+
+    def __init__(self, dataset: VisionDatasetComponent, predictions_files: Dict[str, Path],
+                 load_predictions_file: Callable[[Path], Dict[str, Dict[str, Any]]],
+                 gt_field: str, metric_fns: Dict[str, MetricFn],
+                 get_predictions_hash: Callable[[Path], str] = get_file_hash):
+        self.dataset = dataset
+        self.predictions_files = {model_name: Path(file)
+                                  for model_name, file in predictions_files.items()}
+        self.load_predictions_file = load_predictions_file
+        self.gt_field = gt_field
+        self.metric_fns = metric_fns
+        self.get_predictions_hash = get_predictions_hash
+        self.model_names: List[str] = list(self.predictions_files.keys())
+        self.models: Dict[str, ModelResults] = {}
+        self.loaded_predictions: Dict[str, Dict[str, Any]] = {}
+        self.subset_index: Optional[SubsetIndex] = None
+        self.base_key: Optional[str] = None
+        # {(file, size, mtime_ns): content hash}, several models can share one file
+        self.predictions_hashes: Dict[Tuple[str, int, int], str] = {}
+        self._lock = threading.RLock()
+
+        self.predictions = LazyModelMapping(self, "predictions")
+        self.metrics_per_datapoint = LazyModelMapping(self, "metrics_per_datapoint")
+        self.subset_results = LazyModelMapping(self, "subset_results")
+
+    def get_model(self, model_name: str) -> ModelResults:
+        with self._lock:
+            if model_name not in self.models:
+                self.models[model_name] = self._load_model(model_name)
+            return self.models[model_name]
+
+    def get_predictions(self, model_name: str) -> Dict[str, Any]:
+        with self._lock:
+            if model_name not in self.loaded_predictions:
+                predictions_file = self.predictions_files[model_name]
+                logger.info(f"Loading predictions from {predictions_file}")
+                file_predictions = self.load_predictions_file(predictions_file)
+                file_model_names = [other_name for other_name, other_file
+                                    in self.predictions_files.items()
+                                    if other_file == predictions_file]
+                missing = [name for name in file_model_names if name not in file_predictions]
+                if missing:
+                    raise KeyError(f"Models {missing} not found in {predictions_file}, "
+                                   f"it has the models {list(file_predictions.keys())}")
+                unused = [name for name in file_predictions if name not in file_model_names]
+                if unused:
+                    logger.warning(f"Models {unused} of {predictions_file} are not shown")
+                # keep all models of the file, to parse each file only once
+                for other_name in file_model_names:
+                    self.loaded_predictions[other_name] = file_predictions[other_name]
+            return self.loaded_predictions[model_name]
+
+    def get_predictions_hash_cached(self, predictions_file: Path) -> str:
+        """Content hash of the predictions file, computed once per file version."""
+        stat = predictions_file.stat()
+        file_key = (str(predictions_file), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if file_key not in self.predictions_hashes:
+                self.predictions_hashes[file_key] = self.get_predictions_hash(predictions_file)
+            return self.predictions_hashes[file_key]
+
+    def _get_base_key(self) -> str:
+        if self.base_key is None:
+            self.subset_index = self.dataset.get_subset_index()
+            # the subset positions are hashed instead of the subset ids, which is much faster
+            subset_index = self.subset_index
+            self.base_key = joblib.hash((
+                    self.dataset.name, self.dataset.split,
+                    self.dataset.get_metadata_fingerprint(),
+                    subset_index.group_names, subset_index.names, subset_index.leaf_nums,
+                    subset_index.offsets, self.gt_field, list(self.metric_fns.keys())))
+        return self.base_key
+
+    def _load_model(self, model_name: str) -> ModelResults:
+        base_key = self._get_base_key()
+        predictions_hash = self.get_predictions_hash_cached(self.predictions_files[model_name])
+        cache_key = joblib.hash((base_key, model_name, predictions_hash))
+        metric_names = list(self.metric_fns.keys())
+        values, means = compute_metric_arrays_cached(cache_key, self, model_name)
+        metrics_per_datapoint, subset_results = get_model_result_dicts(
+                self.dataset.meta_index, self.subset_index, metric_names, values, means)
+        return ModelResults(
+                LazyPredictions(self, model_name), metrics_per_datapoint, subset_results)
+
+
+class LazyModelMapping(Mapping):
+    """{model_name: value} where the value is loaded on first access."""
+
+    def __init__(self, results: LazyResults, attr: str):
+        self.results = results
+        self.attr = attr
+
+    def __getitem__(self, model_name):
+        if model_name not in self.results.predictions_files:
+            raise KeyError(model_name)
+        return getattr(self.results.get_model(model_name), self.attr)
+
+    def __len__(self):
+        return len(self.results.model_names)
+
+    def __iter__(self):
+        return iter(self.results.model_names)
+
+
+class LazyPredictions(Mapping):
+    """{leaf_id: prediction} of a model, the predictions file is parsed on first access.
+    Metrics read from the cache do not need the predictions at all."""
+
+    def __init__(self, results: LazyResults, model_name: str):
+        self.results = results
+        self.model_name = model_name
+
+    def __getitem__(self, leaf_id):
+        return self.results.get_predictions(self.model_name)[leaf_id]
+
+    def __len__(self):
+        return len(self.results.get_predictions(self.model_name))
+
+    def __iter__(self):
+        return iter(self.results.get_predictions(self.model_name))
+
+    def get(self, leaf_id, default=None):
+        return self.results.get_predictions(self.model_name).get(leaf_id, default)
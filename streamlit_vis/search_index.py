@@ -0,0 +1,124 @@
+"""
+Inverted index for case-insensitive substring search over a text field of the leafs.
+"""
+from collections import defaultdict, OrderedDict
+from typing import Callable, Hashable, Iterable, Optional
+
+import numpy as np
+
+from streamlit_vis.columnar import StringColumn
+
+
+class TrigramIndex:
+    """
+    Maps every character trigram to the sorted positions of the leafs whose lowercased text
+    contains it. A query is answered by intersecting the posting lists of its trigrams and then
+    verifying the remaining candidates, which gives the same result as a linear scan with
+    `query in text.lower()`.
+    """
+    N = 3
+
+    def __init__(self, texts: Iterable[str]):
+        texts = [text.lower() for text in texts]
+        postings = defaultdict(list)
+        for num, text in enumerate(texts):
+            for gram in self._get_grams(text):
+                postings[gram].append(num)
+        self.postings = {gram: np.array(nums, dtype=np.int32) for gram, nums in postings.items()}
+        self.texts = StringColumn.from_values(texts)
+
+    @classmethod
+    def _get_grams(cls, text: str):
+        return {text[i:i + cls.N] for i in range(len(text) - cls.N + 1)}
+
+    def __len__(self):
+        return len(self.texts)
+
+    def search(self, query: str, leaf_nums: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Args:
+            query: substring to search for, case-insensitive
+            leaf_nums: sorted leaf positions to search in, None to search all leafs
+
+        Returns:
+            sorted leaf positions whose text contains the query
+        """
+        query = query.lower()
+        grams = self._get_grams(query)
+        if len(grams) == 0:
+            # query too short for the index, scan the candidates
+            candidates = np.arange(len(self.texts)) if leaf_nums is None else leaf_nums
+        else:
+            posting_lists = []
+            for gram in grams:
+                posting = self.postings.get(gram)
+                if posting is None:
+                    return np.zeros(0, dtype=np.int64)
+                posting_lists.append(posting)
+            posting_lists.sort(key=len)
+            candidates = posting_lists[0]
+            if leaf_nums is not None:
+                candidates = np.intersect1d(candidates, leaf_nums, assume_unique=True)
+            for posting in posting_lists[1:]:
+                candidates = np.intersect1d(candidates, posting, assume_unique=True)
+                if len(candidates) == 0:
+                    break
+            if len(grams) == 1 and len(query) == self.N:
+                # the trigram is the query, no need to verify
+                return candidates.astype(np.int64)
+
+        return self.verify(query, candidates)
+
+    def verify(self, query: str, leaf_nums: np.ndarray) -> np.ndarray:
+        """Rescan only the given leaf positions for the lowercased query."""
+        texts = self.texts
+        return np.array([num for num in leaf_nums.tolist() if query in texts[num]],
+                        dtype=np.int64)
+
+
+class SearchMemo:
+    """
+    Memo of recent search results for one browser session, keyed by
+    (dataset, split, group, subset, field) and the query.
+
+    A query that contains a memoized query can only match a subset of its hits, so only those
+    hits are rescanned. When a query is shortened, the exact result or a wider result of an even
+    shorter query is reused. Results are kept in memory only.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+
+    def search(self, key: Hashable, query: str, search_fn: Callable[[str], np.ndarray],
+               refine_fn: Callable[[str, np.ndarray], np.ndarray]) -> np.ndarray:
+        """
+        Args:
+            key: identifies the searched data, e.g. (dataset, split, group, subset, field)
+            query: normalized query
+            search_fn: search_fn(query) searches all data
+            refine_fn: refine_fn(query, leaf_nums) searches only the given leaf positions
+
+        Returns:
+            sorted leaf positions
+        """
+        entry_key = (key, query)
+        if entry_key in self.entries:
+            self.entries.move_to_end(entry_key)
+            return self.entries[entry_key]
+
+        # find the smallest memoized result of a query contained in this one
+        wider_nums = None
+        for (other_key, other_query), other_nums in self.entries.items():
+            if other_key == key and other_query in query:
+                if wider_nums is None or len(other_nums) < len(wider_nums):
+                    wider_nums = other_nums
+        if wider_nums is None:
+            leaf_nums = search_fn(query)
+        else:
+            leaf_nums = refine_fn(query, wider_nums)
+
+        self.entries[entry_key] = leaf_nums
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return leaf_nums
@@ -1,7 +1,12 @@
+import importlib
+import io
 import logging
 import os
+import threading
+import uuid
+from collections import OrderedDict
 from pathlib import Path
-from typing import Union
+from typing import Any, Callable, Hashable, Iterable, Optional, Union
 
 import numpy as np
 import streamlit as st
@@ -9,14 +14,80 @@ from PIL import Image
 from importlib_resources import files
 
 import streamlit_vis
+from streamlit_vis.timing import RunTimings, get_span_stats, timed
 from streamlit_vis.vis_config_default import default_config
 
 logger = logging.getLogger("streamlit_vis")
 PathType = Union[Path, str]
 
 
+def import_object(path: str):
+    """Import an object given as "module:name" on first use, to defer the imports of pages and
+    apps until they are shown."""
+    module_name, object_name = path.split(":")
+    return getattr(importlib.import_module(module_name), object_name)
+
+
+class FragmentCache:
+    """
+    Thread-safe LRU cache of rendered markup, shared by all sessions. The key has to contain
+    everything the markup depends on, e.g. data fingerprints, widget values and config values.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def get_or_render(self, key: Hashable, render_fn: Callable[[], Any]) -> Any:
+        """Returns the cached markup, render_fn is only called on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        # render outside the lock, two sessions may render the same fragment at the same time
+        markup = render_fn()
+        with self._lock:
+            self._entries[key] = markup
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return markup
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_fragment_cache: Optional[FragmentCache] = None
+_fragment_cache_lock = threading.Lock()
+
+
+def get_fragment_cache(max_entries: Optional[int] = None) -> FragmentCache:
+    """
+    Returns the process-wide fragment cache. max_entries is only used when the cache is created,
+    default is FRAGMENT_CACHE_ENTRIES of the default config.
+    """
+    global _fragment_cache  # pylint: disable=global-statement
+    with _fragment_cache_lock:
+        if _fragment_cache is None:
+            _fragment_cache = FragmentCache(
+                    default_config.FRAGMENT_CACHE_ENTRIES if max_entries is None else max_entries)
+        return _fragment_cache
+
+
 def modify_css(conf=default_config, button_columns=True, image_columns=False):
-    """See the respective CSS files for details."""
+    """See the respective CSS files for details. The style block is only built once."""
+    css_block = get_fragment_cache(conf.FRAGMENT_CACHE_ENTRIES).get_or_render(
+            ("css", conf.THUMBNAIL_SIZE, button_columns, image_columns),
+            lambda: _get_css_block(conf.THUMBNAIL_SIZE, button_columns, image_columns))
+    st.markdown(css_block, unsafe_allow_html=True)
+
+
+def _get_css_block(thumbnail_size: int, button_columns: bool, image_columns: bool) -> str:
     # noinspection PyTypeChecker
     package_files = files(streamlit_vis)
     css_dir = package_files / "static"
@@ -26,18 +97,40 @@ def modify_css(conf=default_config, button_columns=True, image_columns=False):
         css_appends.append((css_dir / "style_button_columns.css").read_text(encoding="utf-8"))
     if image_columns:
         css_appends.append((css_dir / "style_image_columns.css").read_text(encoding="utf-8"))
-    st.markdown("\n".join([
+    return "\n".join([
             "<style>",
             ":root {",
-            f"--imagesize: {conf.THUMBNAIL_SIZE:d}px;",
+            f"--imagesize: {thumbnail_size:d}px;",
             "}",
             css_main,
             *css_appends,
-            "</style>"]),
-            unsafe_allow_html=True)
+            "</style>"])
 
 
 def create_thumbnail(input_file, output_file, longer_side: int = 200):
+    img = _resize_for_thumbnail(input_file, longer_side)
+    save_image_atomic(img, output_file)
+
+
+def save_image_atomic(img, output_file, **kwargs):
+    # write to a temporary file first, so concurrent readers never see a partial file
+    output_file = Path(output_file)
+    os.makedirs(output_file.parent, exist_ok=True)
+    temp_file = output_file.with_name(
+            f".{output_file.stem}_{uuid.uuid4().hex}{output_file.suffix}")
+    img.save(temp_file, **kwargs)
+    os.replace(temp_file, output_file)
+
+
+def create_thumbnail_bytes(input_file, longer_side: int = 200) -> bytes:
+    """Same as create_thumbnail, but return the jpeg data instead of writing a file."""
+    img = _resize_for_thumbnail(input_file, longer_side)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _resize_for_thumbnail(input_file, longer_side: int):
     input_file = Path(input_file)
     img = Image.open(input_file)
     w, h = img.width, img.height
@@ -49,12 +142,19 @@ def create_thumbnail(input_file, output_file, longer_side: int = 200):
     else:
         h_new = longer_side
         w_new = round(w * longer_side / h)
+    # for jpeg, decode at a reduced scale that is still at least the target size
+    img.draft(img.mode, (w_new, h_new))
     # noinspection PyUnresolvedReferences
-    img = img.resize((w_new, h_new), Image.Resampling.LANCZOS)
+    return img.resize((w_new, h_new), Image.Resampling.LANCZOS)
 
+
+def is_file_up_to_date(output_file: PathType, input_files: Iterable[PathType]) -> bool:
+    """True if output_file exists and is not older than any of the input files."""
     output_file = Path(output_file)
-    os.makedirs(output_file.parent, exist_ok=True)
-    img.save(output_file)
+    if not output_file.is_file():
+        return False
+    output_mtime = output_file.stat().st_mtime_ns
+    return all(Path(input_file).stat().st_mtime_ns <= output_mtime for input_file in input_files)
 
 
 class ColumnGridGenerator:
@@ -78,9 +178,65 @@ class ColumnGridGenerator:
         return self.next_column()
 
 
+@timed("read_image_for_streamlit")
 def read_image_for_streamlit(file: Union[str, Path]):
     # inefficient to load from file to array, then let streamlit convert it back.
-    # it would be better to let the browser directly render given binary (e.g. jpeg) data
+    # prefer render_image, which passes the encoded bytes to the browser.
 
     # noinspection PyTypeChecker
     return np.asarray(Image.open(file).convert("RGB"))
+
+
+# formats that st.image passes through without re-encoding
+STREAMLIT_IMAGE_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG"}
+
+
+def render_image(file: Union[str, Path], parent=None, **kwargs):
+    """
+    Show the image with st.image, passing the stored bytes through without decoding them.
+    Other formats than jpeg and png are converted by streamlit.
+    """
+    file = Path(file)
+    output_format = STREAMLIT_IMAGE_FORMATS.get(file.suffix.lower(), "auto")
+    render_image_data(file.read_bytes(), output_format, parent=parent, **kwargs)
+
+
+@timed("render_image_data")
+def render_image_data(data: Union[bytes, memoryview], output_format: str = "auto", parent=None,
+                      **kwargs):
+    """Show encoded image data with st.image, output_format should match the encoding."""
+    parent = st if parent is None else parent
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    parent.image(data, output_format=output_format, **kwargs)
+
+
+def render_image_url(url: str, parent=None):
+    """Show an image from a url with html, st.image only passes through urls with a scheme."""
+    parent = st if parent is None else parent
+    parent.markdown(f'<img src="{url}" style="max-width: 100%;" alt="">', unsafe_allow_html=True)
+
+
+def transcode_image(input_file, output_file, quality: int = 90):
+    """Save a compact jpeg version of the image. The alpha channel is dropped."""
+    img = Image.open(input_file).convert("RGB")
+    save_image_atomic(img, output_file, format="JPEG", quality=quality)
+
+
+def render_timing_panel(run: Optional[RunTimings], parent=None):
+    """Debug panel with the spans of the current rerun and the p50/p99 of all spans since the
+    start of the process. Spans that ran in other threads, e.g. when loading the thumbnails of a
+    page concurrently, are only in the process-wide statistics."""
+    parent = st.sidebar if parent is None else parent
+    with parent.expander("Timings"):
+        if run is not None:
+            lines = [f"{'rerun':<40} {run.get_total_seconds() * 1000:9.1f}ms"]
+            for name, depth, seconds in run.spans:
+                duration = "running" if seconds is None else f"{seconds * 1000:9.1f}ms"
+                lines.append(f"{'  ' * (depth + 1) + name:<40} {duration:>11}")
+            st.code("\n".join(lines), language=None)
+        lines = [f"{'span':<30} {'count':>7} {'p50':>9} {'p99':>9}"]
+        for name, histogram in get_span_stats().snapshot().items():
+            lines.append(f"{name:<30} {histogram.count:7d} {histogram.quantile(.5) * 1000:7.1f}ms "
+                         f"{histogram.quantile(.99) * 1000:7.1f}ms")
+        st.code("\n".join(lines), language=None)
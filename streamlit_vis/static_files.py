@@ -0,0 +1,188 @@
+"""
+Show images from static urls instead of sending their bytes over the websocket on every rerun.
+
+Files are published under content-hashed names into the directory of streamlit's static file
+serving (server.enableStaticServing, the "static" directory next to the main script). The url
+contains the hash as ?v= argument, for which tornado sends a cache lifetime of 10 years. This is
+safe since the url changes with the content, so the browser loads each image only once across
+pages, reruns and sessions.
+
+Streamlit disables the static file serving at startup if the static directory is larger than
+1GB, so the published files are kept within a byte budget, the least recently used are removed.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+import streamlit as st
+
+from streamlit_vis.st_utils import PathType
+
+# streamlit serves other files as text/plain
+STATIC_SUFFIXES = (".jpg", ".jpeg", ".png", ".gif")
+# streamlit does not serve larger files
+MAX_STATIC_FILE_SIZE = 200 * 1024 * 1024
+# streamlit disables the static file serving for larger directories
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+
+
+class StaticFileStore:
+    """
+    Thread-safe, can be shared between sessions.
+
+    Args:
+        static_dir: directory served by streamlit
+        subdir: the files are put into this subdirectory of static_dir
+        url_path: url path of static_dir, without the server.baseUrlPath
+        max_bytes: budget of the published files, the least recently used files are removed
+            when it is exceeded. Urls of removed files are published again on the next request.
+    """
+
+    def __init__(self, static_dir: PathType, subdir: str = "streamlit_vis",
+                 url_path: str = "app/static", max_bytes: Optional[int] = DEFAULT_MAX_BYTES):
+        self.static_dir = Path(static_dir)
+        self.subdir = subdir
+        self.url_path = url_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # {(file, size, mtime_ns): published name}, to hash each file only once
+        self._file_names: Dict[Tuple[str, int, int], str] = {}
+        # {name: nbytes} of the published files, least recently used first,
+        # read from the directory on first use
+        self._published: Optional[OrderedDict] = None
+        self._nbytes = 0
+        self.evictions = 0
+
+    def get_url_for_data(self, data: Union[bytes, memoryview], suffix: str = ".jpg"
+                         ) -> Optional[str]:
+        """
+        Returns:
+            static url of the encoded image, None if it can not be served statically
+        """
+        if suffix.lower() not in STATIC_SUFFIXES or len(data) > MAX_STATIC_FILE_SIZE:
+            return None
+        name = f"{hashlib.blake2b(data, digest_size=16).hexdigest()}{suffix.lower()}"
+        self._publish(name, lambda temp_file: temp_file.write_bytes(data))
+        return self._get_url(name)
+
+    def get_url_for_file(self, file: PathType) -> Optional[str]:
+        """
+        Returns:
+            static url of the image file, None if it can not be served statically
+        """
+        file = Path(file)
+        stat = file.stat()
+        if file.suffix.lower() not in STATIC_SUFFIXES or stat.st_size > MAX_STATIC_FILE_SIZE:
+            return None
+        file_key = (str(file), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            name = self._file_names.get(file_key)
+        if name is None:
+            file_hash = hashlib.blake2b(digest_size=16)
+            with file.open("rb") as fh:
+                for chunk in iter(lambda: fh.read(1024 ** 2), b""):
+                    file_hash.update(chunk)
+            name = f"{file_hash.hexdigest()}{file.suffix.lower()}"
+            with self._lock:
+                self._file_names[file_key] = name
+        # publish again if the file was removed to stay within the budget
+        self._publish(name, lambda temp_file: _link_or_copy(file, temp_file))
+        return self._get_url(name)
+
+    def _is_published(self, name: str) -> bool:
+        """True if the file exists, marks it as recently used."""
+        with self._lock:
+            published = self._get_published()
+            if name not in published:
+                return False
+            published.move_to_end(name)
+            return True
+
+    def _publish(self, name: str, write_fn):
+        # files with the same name have the same content, so existing files are never replaced
+        if self._is_published(name):
+            return
+        target_file = self._get_file(name)
+        target_file.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first, so concurrent requests never see a partial file
+        temp_file = target_file.with_name(f".{uuid.uuid4().hex}{target_file.suffix}")
+        write_fn(temp_file)
+        nbytes = temp_file.stat().st_size
+        os.replace(temp_file, target_file)
+        with self._lock:
+            published = self._get_published()
+            if name not in published:
+                published[name] = nbytes
+                self._nbytes += nbytes
+            self._evict(keep=name)
+
+    def _get_file(self, name: str) -> Path:
+        return self.static_dir / self.subdir / name[:2] / name
+
+    def _get_published(self) -> OrderedDict:
+        # holding the lock
+        if self._published is None:
+            files = []
+            for file in (self.static_dir / self.subdir).glob("*/*"):
+                if file.name.startswith("."):
+                    # temporary file of an interrupted write
+                    continue
+                stat = file.stat()
+                # the ctime changes when a file is linked, the mtime is the one of the source
+                files.append((stat.st_ctime_ns, file.name, stat.st_size))
+            self._published = OrderedDict(
+                    (name, nbytes) for _ctime_ns, name, nbytes in sorted(files))
+            self._nbytes = sum(self._published.values())
+            self._evict()
+        return self._published
+
+    def _evict(self, keep: Optional[str] = None):
+        # holding the lock
+        if self.max_bytes is None:
+            return
+        for name in list(self._published.keys()):
+            if self._nbytes <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            self._nbytes -= self._published.pop(name)
+            self.evictions += 1
+            try:
+                os.remove(self._get_file(name))
+            except FileNotFoundError:
+                pass
+
+    def _get_url(self, name: str) -> str:
+        # the base path can be changed in the server config
+        base_path = st.get_option("server.baseUrlPath").strip("/")
+        prefix = f"/{base_path}" if base_path else ""
+        return f"{prefix}/{self.url_path}/{self.subdir}/{name[:2]}/{name}?v={name.split('.')[0]}"
+
+
+_stores: Dict[Path, StaticFileStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_static_file_store(static_dir: PathType,
+                          max_bytes: Optional[int] = DEFAULT_MAX_BYTES) -> StaticFileStore:
+    """Process-wide store per directory, so each file is only hashed once for all sessions.
+    max_bytes is only used when the store is created."""
+    static_dir = Path(static_dir)
+    with _stores_lock:
+        if static_dir not in _stores:
+            _stores[static_dir] = StaticFileStore(static_dir, max_bytes=max_bytes)
+        return _stores[static_dir]
+
+
+def _link_or_copy(source_file: Path, target_file: Path):
+    """Hard links cost no space, they are not possible across file systems. Symbolic links can
+    not be used, streamlit does not serve files outside the static directory."""
+    try:
+        os.link(source_file, target_file)
+    except OSError:
+        shutil.copyfile(source_file, target_file)
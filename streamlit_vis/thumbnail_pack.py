@@ -0,0 +1,135 @@
+"""
+Packed thumbnail storage: one append-only data file per dataset split and thumbnail size, plus
+an index with (offset, length) of the encoded thumbnail for each root position.
+The data file and the index are memory-mapped, so reading a thumbnail is a slice of the mapping.
+"""
+import mmap
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from streamlit_vis.st_utils import PathType
+
+
+class PackedThumbnailStore:
+    """
+    Thread-safe for reading, can be shared by the loading threads of all sessions.
+
+    Args:
+        data_file: concatenated encoded thumbnails
+        index_file: .npy file with shape (n_roots, 2) and columns offset, length.
+            Length -1 means the thumbnail is missing.
+    """
+
+    def __init__(self, data_file: PathType, index_file: PathType):
+        self.data_file = Path(data_file)
+        self.index_file = Path(index_file)
+        self.index: Optional[np.ndarray] = None
+        self.data: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return self.data_file.is_file() and self.index_file.is_file()
+
+    def get_signature(self) -> Optional[Tuple[int, int, int, int]]:
+        """(size, mtime_ns) of the index and the data file, None if they do not exist.
+        Changes whenever thumbnails are written."""
+        try:
+            index_stat, data_stat = self.index_file.stat(), self.data_file.stat()
+        except FileNotFoundError:
+            return None
+        return index_stat.st_size, index_stat.st_mtime_ns, data_stat.st_size, data_stat.st_mtime_ns
+
+    def open(self):
+        with self._lock:
+            self._open_index()
+            self._open_data()
+
+    def close(self):
+        """Drop the mappings. They are not closed explicitly, since returned thumbnails may still
+        be views into them, they are released when the last view is gone."""
+        with self._lock:
+            self.index, self.data = None, None
+
+    def _open_index(self):
+        # holding the lock
+        self.index = np.load(self.index_file, mmap_mode="r")
+
+    def _open_data(self):
+        # holding the lock. A new mapping is created instead of closing the old one, which
+        # may still be read by other threads or be referenced by returned views
+        self.data = None
+        if self.data_file.stat().st_size > 0:
+            with self.data_file.open("rb") as fh:
+                self.data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        with self._lock:
+            if self.index is None:
+                self._open_index()
+            return len(self.index)
+
+    def get(self, root_num: int) -> Optional[memoryview]:
+        """Returns the encoded thumbnail as a read-only view into the data file, or None."""
+        with self._lock:
+            if self.index is None:
+                self._open_index()
+                self._open_data()
+            if not 0 <= root_num < len(self.index):
+                return None
+            offset, length = (int(value) for value in self.index[root_num])
+            if length < 0:
+                return None
+            if self.data is None or offset + length > len(self.data):
+                # the data file was appended to since it was opened
+                self._open_data()
+            if self.data is None or offset + length > len(self.data):
+                return None
+            return memoryview(self.data)[offset:offset + length]
+
+    def write(self, n_roots: int, thumbnails: Iterable[Tuple[int, bytes]], reset: bool = False):
+        """
+        Append thumbnails to the data file and update the index.
+
+        Args:
+            n_roots: number of roots in the dataset
+            thumbnails: iterable of (root_num, encoded thumbnail)
+            reset: start a new data file instead of appending
+        """
+        self.close()
+        reset = reset or not self.exists() or len(
+                np.load(self.index_file, mmap_mode="r")) != n_roots
+        if reset:
+            # write a new file and replace the old one, since readers may have it mapped
+            index = np.full((n_roots, 2), -1, dtype=np.int64)
+            data_file = self.data_file.with_name(f"{self.data_file.name}.tmp")
+            mode = "wb"
+        else:
+            index = np.load(self.index_file).copy()
+            data_file = self.data_file
+            mode = "ab"
+        data_file.parent.mkdir(parents=True, exist_ok=True)
+        with data_file.open(mode) as fh:
+            offset = fh.tell()
+            for root_num, thumbnail in thumbnails:
+                fh.write(thumbnail)
+                index[root_num] = offset, len(thumbnail)
+                offset += len(thumbnail)
+        if reset:
+            os.replace(data_file, self.data_file)
+        # replace the index atomically, readers still see valid entries of the old index
+        temp_file = self.index_file.with_name(f"{self.index_file.stem}_tmp.npy")
+        np.save(temp_file, index)
+        os.replace(temp_file, self.index_file)
+
+    def get_missing(self, n_roots: int) -> np.ndarray:
+        """Root positions without a thumbnail"""
+        if not self.exists():
+            return np.arange(n_roots)
+        index = np.load(self.index_file, mmap_mode="r")
+        if len(index) != n_roots:
+            return np.arange(n_roots)
+        return np.flatnonzero(index[:, 1] < 0)
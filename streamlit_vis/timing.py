@@ -0,0 +1,255 @@
+"""
+Lightweight timing spans for the render path.
+
+Each span is added to a process-wide histogram per span name, from all threads and sessions.
+Spans in the script thread of a session are also recorded for the current rerun, so the rerun
+can be shown in a debug panel (see st_utils.render_timing_panel). The histograms can be exported
+in the Prometheus text format or as JSON lines, to track p50/p99 under real load.
+
+Usage:
+    with span("load_metadata_for_page"):
+        ...
+
+    @timed("get_thumbnail_file")
+    def get_thumbnail_file(...):
+        ...
+"""
+import bisect
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+# upper bounds of the histogram buckets in seconds, the last bucket is +Inf
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+METRIC_NAME = "streamlit_vis_span_seconds"
+
+
+class Histogram:
+    """Not thread-safe, SpanStats holds the lock."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    def observe(self, seconds: float):
+        # the bucket bounds are inclusive
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Estimate of the quantile, interpolated linearly within the bucket."""
+        if self.count == 0:
+            return 0.
+        rank = q * self.count
+        cumulative = 0
+        for bucket_i, count in enumerate(self.counts):
+            if count > 0 and cumulative + count >= rank:
+                lower = self.buckets[bucket_i - 1] if bucket_i > 0 else 0.
+                upper = self.buckets[bucket_i] if bucket_i < len(self.buckets) else self.max
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * max(rank - cumulative, 0) / count
+            cumulative += count
+        return self.max
+
+    def copy(self) -> "Histogram":
+        histogram = Histogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.count, histogram.sum, histogram.max = self.count, self.sum, self.max
+        return histogram
+
+
+class SpanStats:
+    """Thread-safe histograms of all spans, shared by all sessions."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def snapshot(self) -> Dict[str, Histogram]:
+        """Copy of the histograms, sorted by span name."""
+        with self._lock:
+            return {name: self._histograms[name].copy() for name in sorted(self._histograms)}
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def to_prometheus(self) -> str:
+        lines = [f"# HELP {METRIC_NAME} Duration of the timing spans of streamlit_vis.",
+                 f"# TYPE {METRIC_NAME} histogram"]
+        for name, histogram in self.snapshot().items():
+            label = f'span="{_escape_label(name)}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{METRIC_NAME}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{METRIC_NAME}_sum{{{label}}} {histogram.sum!r}")
+            lines.append(f"{METRIC_NAME}_count{{{label}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_json_lines(self) -> str:
+        """One json object per span with the counts per bucket and the estimated quantiles."""
+        timestamp = time.time()
+        lines = []
+        for name, histogram in self.snapshot().items():
+            lines.append(json.dumps({
+                    "time": timestamp, "span": name, "count": histogram.count,
+                    "sum": histogram.sum, "max": histogram.max,
+                    "p50": histogram.quantile(.5), "p99": histogram.quantile(.99),
+                    "buckets": list(histogram.buckets), "counts": histogram.counts}))
+        return "".join(f"{line}\n" for line in lines)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RunTimings:
+    """Spans of one rerun in the order they started, only used by the script thread."""
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        # [name, depth, seconds], seconds is None while the span is running
+        self.spans: List[list] = []
+
+    def get_total_seconds(self) -> float:
+        return time.perf_counter() - self.start_time
+
+
+_span_stats = SpanStats()
+_local = threading.local()
+
+
+def get_span_stats() -> SpanStats:
+    """Process-wide histograms of all spans."""
+    return _span_stats
+
+
+def start_run() -> RunTimings:
+    """Start recording the spans of the current thread for a new rerun."""
+    run = RunTimings()
+    _local.run = run
+    _local.depth = 0
+    return run
+
+
+def get_current_run() -> Optional[RunTimings]:
+    return getattr(_local, "run", None)
+
+
+@contextmanager
+def span(name: str):
+    """Time the block. Nested spans are shown indented in the debug panel."""
+    run = getattr(_local, "run", None)
+    entry = None
+    if run is not None:
+        entry = [name, _local.depth, None]
+        run.spans.append(entry)
+        _local.depth += 1
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start_time
+        _span_stats.observe(name, seconds)
+        if entry is not None:
+            entry[2] = seconds
+            _local.depth -= 1
+
+
+def timed(name: Optional[str] = None):
+    """Decorator version of span, by default the span is named after the function."""
+
+    def decorator(fn):
+        span_name = fn.__qualname__ if name is None else name
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+_exporters: Dict[Tuple[str, Union[int, str]], threading.Thread] = {}
+_exporters_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> None:
+    """Serve the histograms in the Prometheus text format at http://host:port/metrics,
+    in a daemon thread. Only the first call per port starts a server. Give host "" to serve
+    on all interfaces."""
+    # the http server is only imported if the metrics are served
+    from http.server import (  # pylint: disable=import-outside-toplevel
+        BaseHTTPRequestHandler, ThreadingHTTPServer)
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = _span_stats.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            # do not log every scrape
+            pass
+
+    with _exporters_lock:
+        if ("http", port) in _exporters:
+            return
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True,
+                                  name=f"streamlit_vis_metrics_{port}")
+        thread.start()
+        _exporters[("http", port)] = thread
+
+
+def start_json_lines_export(file: Union[Path, str], interval: float = 60.) -> None:
+    """Append a snapshot of the histograms to the file every interval seconds, in a daemon
+    thread. The counts are cumulative since the start of the process, the difference of two
+    snapshots gives the histogram of that period. Only the first call per file starts a thread.
+    """
+    file = Path(file)
+
+    def _export():
+        while True:
+            time.sleep(interval)
+            json_lines = _span_stats.to_json_lines()
+            if json_lines:
+                with file.open("a", encoding="utf-8") as fh:
+                    fh.write(json_lines)
+
+    with _exporters_lock:
+        if ("jsonl", str(file)) in _exporters:
+            return
+        file.parent.mkdir(parents=True, exist_ok=True)
+        thread = threading.Thread(target=_export, daemon=True,
+                                  name=f"streamlit_vis_metrics_{file.name}")
+        thread.start()
+        _exporters[("jsonl", str(file))] = thread
@@ -9,6 +9,60 @@ class WebsiteConfig:
     PAGES = ["overview", "details", "results"]
     BUTTON_COLUMNS = 6
     SEARCH_FIELD = "question"
+    # store metadata in numpy columns instead of dicts, see streamlit_vis.columnar
+    COLUMNAR_METADATA = False
+    # read metadata, subsets and predictions from a SQLite database instead of the json files,
+    # for datasets larger than memory, see streamlit_vis.dataset_sqlite
+    SQLITE_METADATA = False
+    # memory budget for the loaded datasets shared by all sessions, None for unlimited
+    REGISTRY_MAX_BYTES = 8 * 1024 ** 3
+    # budgets of the result cache (cache_joblib), items are kept in memory and on disk,
+    # None for unlimited
+    CACHE_MAX_MEMORY_BYTES = 512 * 1024 ** 2
+    CACHE_MAX_DISK_BYTES = 8 * 1024 ** 3
+    # show png images larger than this as a cached jpeg version, None to always show the original
+    TRANSCODE_MIN_BYTES = 1024 ** 2
+    TRANSCODE_QUALITY = 90
+    # show images larger than DISPLAY_SIZE from tiled pyramids and allow zooming in,
+    # None to always show the whole image
+    PYRAMID_TILE_SIZE = 512
+    DISPLAY_SIZE = 1024
+    # show the overview page as a single virtualized grid component instead of one element per
+    # image and question, for large PERPAGE values. The grid scrolls above OVERVIEW_GRID_HEIGHT
+    OVERVIEW_GRID = False
+    OVERVIEW_GRID_HEIGHT = 800
+    # show images and thumbnails from content-hashed static urls that the browser caches,
+    # instead of sending them on every rerun. Needs server.enableStaticServing, STATIC_DIR must be
+    # the "static" directory next to the main script. The least recently used files are removed
+    # above STATIC_MAX_BYTES, streamlit disables the static file serving at startup if the
+    # directory is larger than 1GB
+    STATIC_URLS = False
+    STATIC_DIR = Path("static")
+    STATIC_MAX_BYTES = 512 * 1024 ** 2
+    # threads shared by all sessions, to load the current page and to prefetch the next pages
+    LOAD_WORKERS = 8
+    PREFETCH_WORKERS = 2
+    # compute the filters of all subsets when a dataset is loaded, so the first visit of a subset
+    # is served from the cache, with WARM_UP_WORKERS threads
+    WARM_UP_SUBSETS = False
+    WARM_UP_WORKERS = 4
+    # threads shared by all sessions to load datasets and results in the background,
+    # sessions waiting for a load update the progress bar every LOAD_PROGRESS_INTERVAL seconds
+    DATASET_LOAD_WORKERS = 2
+    LOAD_PROGRESS_INTERVAL = 0.1
+    # number of rendered html fragments (results tables, style blocks) kept for all sessions
+    FRAGMENT_CACHE_ENTRIES = 256
+    # navigation buttons update the url in their callback, so a click renders the page once,
+    # instead of rendering it, setting the url and rendering it again
+    NAV_CALLBACKS = False
+    # show the timing spans of each rerun in the sidebar
+    TIMING_PANEL = False
+    # export the histograms of the timing spans for all sessions: in the Prometheus text format
+    # at http://127.0.0.1:TIMING_METRICS_PORT/metrics, and appended to TIMING_JSONL_FILE every
+    # TIMING_EXPORT_INTERVAL seconds. None to disable
+    TIMING_METRICS_PORT = None
+    TIMING_JSONL_FILE = None
+    TIMING_EXPORT_INTERVAL = 60
     # url get parameters, short parameter names to avoid getting too long urls
     G_PAGENUM = "pn"
     G_GROUP = "g"
@@ -6,6 +6,7 @@ import streamlit as st
 
 from streamlit_vis.navigation_base import BrowserComponent
 from streamlit_vis.st_utils import logger, ColumnGridGenerator
+from streamlit_vis.timing import timed
 from streamlit_vis.vis_config_default import WebsiteConfig
 
 
@@ -42,9 +43,15 @@ class BaseWebsite(metaclass=ABCMeta):
         """Create a button that updates the url get params using "state_update" when clicked."""
         parent = st if parent is None else parent
         debug_str = ""
+        if self.conf.NAV_CALLBACKS:
+            # the url is updated before the rerun of the click, see BrowserComponent
+            parent.button(f"{title} {debug_str}", disabled=not is_enabled, key=key,
+                          on_click=self.browser.navigate, kwargs=state_update)
+            return
         if parent.button(f"{title} {debug_str}", disabled=not is_enabled, key=key):
             self.set_params(**state_update)
 
+    @timed("widgets.nav_menu")
     def render_nav_menu(self, current_page):
         # instead of the left side select box, create a top bar with buttons
         c = self.conf
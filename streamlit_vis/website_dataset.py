@@ -1,13 +1,24 @@
+import copy
+import time
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import Future
 from dataclasses import dataclass
 from math import ceil
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 import streamlit as st
 
+from streamlit_vis.data_utils import NavigationIndex, get_files_fingerprint, mem
 from streamlit_vis.dataset_base import VisionDatasetComponent
-from streamlit_vis.st_utils import PathType
+from streamlit_vis.prefetch import Prefetcher, get_executor
+from streamlit_vis.registry import LoadProgress, get_dataset_registry
+from streamlit_vis.search_index import SearchMemo
+from streamlit_vis.static_files import StaticFileStore, get_static_file_store
+from streamlit_vis.joblib_ext import get_cache_stats, set_cache_limits
+from streamlit_vis.st_utils import (
+    logger, PathType, render_image, render_image_data, render_image_url)
+from streamlit_vis.timing import span, timed
 from streamlit_vis.website_base import BaseWebsite
 
 
@@ -15,6 +26,18 @@ class StopRunning(Exception):
     """Signals that the website is done rendering, e.g. there is no data to show."""
 
 
+@dataclass
+class SharedData:
+    """Loaded dataset and results that are shared by all sessions via the registry."""
+    dataset: VisionDatasetComponent
+    predictions: Optional[Dict[str, Any]]
+    metrics_per_datapoint: Optional[Dict[str, Any]]
+    subset_results: Optional[Dict[str, Any]]
+    # results of all models are loaded in the background after the dataset
+    results_future: Optional[Future] = None
+    load_progress: Optional[LoadProgress] = None
+
+
 @dataclass
 class DatasetWebsite(BaseWebsite, metaclass=ABCMeta):
     data_dir_base: Optional[PathType] = None
@@ -26,6 +49,27 @@ class DatasetWebsite(BaseWebsite, metaclass=ABCMeta):
         if self.data_dir_base is None:
             self.data_dir_base = self.conf.DATA_PATH
         self.data_dir_base = Path(self.data_dir_base)
+        self.search_memo = SearchMemo()
+        self.prefetcher = Prefetcher(self.conf.LOAD_WORKERS, self.conf.PREFETCH_WORKERS)
+        self.load_progress: Optional[LoadProgress] = None
+        self.results_future: Optional[Future] = None
+        # fingerprint of all files the shared data depends on, including the predictions
+        self.data_fingerprint: Optional[str] = None
+        self.static_files: Optional[StaticFileStore] = None
+        if self.conf.STATIC_URLS:
+            # streamlit also turns it off at startup if the static directory is too large
+            if st.get_option("server.enableStaticServing"):
+                self.static_files = get_static_file_store(
+                        self.conf.STATIC_DIR, self.conf.STATIC_MAX_BYTES)
+            else:
+                logger.warning("STATIC_URLS is set but server.enableStaticServing is off, "
+                               "sending the images over the websocket instead.")
+        set_cache_limits(mem, self.conf.CACHE_MAX_MEMORY_BYTES, self.conf.CACHE_MAX_DISK_BYTES)
+
+    def on_reload(self):
+        super().on_reload()
+        # stop prefetching for the previous page
+        self.prefetcher.new_page()
 
     @abstractmethod
     def setup_dataset(self, dataset_name: str, dataset_split: str):
@@ -43,29 +87,151 @@ class DatasetWebsite(BaseWebsite, metaclass=ABCMeta):
                 {model_name: {metric_name: {leaf_id: metric_value}}}
             self.subset_results:
                 {model_name: {metric_name: {group_name: {subset_name: metric_aggregated_value}}}}
+        The values can be mappings that load each model on first access,
+        see streamlit_vis.results.LazyResults.
+        """
+        self.predictions, self.metrics_per_datapoint, self.subset_results = None, None, None
+
+    def get_data_files(self, dataset_name: str, dataset_split: str) -> List[Path]:
+        """Files that the loaded data depends on, used to fingerprint the data.
+        By default, all files directly inside the dataset directory."""
+        dataset_dir = self.data_dir_base / dataset_name
+        return [file for file in dataset_dir.iterdir() if file.is_file()]
+
+    @timed("setup_shared")
+    def setup_shared(self, dataset_name: str, dataset_split: str):
+        """
+        Same as setup_dataset followed by setup_results, but the loaded data is shared between
+        all sessions of this process via the dataset registry. Call this on every rerun, so
+        sessions pick up evictions, and call release_shared when the page is rendered.
+
+        The data is loaded in the background, concurrent sessions wait for the same load and
+        show its progress. A rerun while waiting does not stop the load. The results of all
+        models are loaded afterwards, see get_results. Then the registry measures the entry
+        again, if loading the results failed, the entry is dropped so the next rerun retries.
         """
+        fingerprint = get_files_fingerprint(self.get_data_files(dataset_name, dataset_split))
+        key = (type(self).__name__, dataset_name, dataset_split, fingerprint)
+        self.data_fingerprint = fingerprint
+        registry = get_dataset_registry(
+                self.conf.REGISTRY_MAX_BYTES, self.conf.DATASET_LOAD_WORKERS)
+        executor = get_executor("dataset_load", self.conf.DATASET_LOAD_WORKERS)
+
+        def _load(progress: LoadProgress):
+            # load with a copy, so the loading thread does not change the state of the session
+            loader = copy.copy(self)
+            loader.load_progress = progress
+            progress.set_stage("Loading metadata", 0., .8)
+            loader.setup_dataset(dataset_name, dataset_split)
+            progress.set_stage("Preparing results", .8, .8)
+            loader.setup_results()
+            logger.info(f"Result cache stats: {get_cache_stats(mem)}")
+            # the results are loaded in _on_loaded, after the registry measured the entry
+            return SharedData(
+                    loader.dataset, loader.predictions, loader.metrics_per_datapoint,
+                    loader.subset_results, Future(), progress)
+
+        def _preload_results(shared: SharedData):
+            results_future = shared.results_future
+            if not results_future.set_running_or_notify_cancel():
+                return
+            loader = copy.copy(self)
+            loader.subset_results = shared.subset_results
+            try:
+                loader.preload_results(shared.load_progress)
+            except Exception as e:  # pylint: disable=broad-except
+                results_future.set_exception(e)
+            else:
+                results_future.set_result(None)
+
+        def _on_results_done(results_future: Future):
+            if results_future.exception() is not None:
+                registry.remove(key)
+            else:
+                registry.update_nbytes(key)
+
+        def _on_loaded(shared: SharedData):
+            shared.results_future.add_done_callback(_on_results_done)
+            executor.submit(_preload_results, shared)
+
+        future, progress = registry.get_or_load_async(key, _load, on_loaded=_on_loaded)
+        if not future.done():
+            self.render_load_progress(future, progress)
+        shared = future.result()
+        self.dataset = shared.dataset
+        self.predictions = shared.predictions
+        self.metrics_per_datapoint = shared.metrics_per_datapoint
+        self.subset_results = shared.subset_results
+        self.results_future, self.load_progress = shared.results_future, shared.load_progress
+
+    def preload_results(self, progress: Optional[LoadProgress] = None):
+        """Load the results of all models, so the pages that need them do not have to wait."""
+        if self.subset_results is None:
+            return
+        model_names = list(self.subset_results.keys())
+        for model_i, model_name in enumerate(model_names):
+            if progress is not None:
+                progress.set_stage(f"Loading results of {model_name}",
+                                   .8 + .2 * model_i / len(model_names),
+                                   .8 + .2 * (model_i + 1) / len(model_names))
+            # the values of LazyResults are loaded on access
+            _ = self.subset_results[model_name]
+        if progress is not None:
+            progress.set_stage("Done", 1., 1.)
+
+    def render_load_progress(self, future: Future, progress: LoadProgress):
+        """Show the progress until the future is done, then remove the progress bar."""
+        placeholder = st.empty()
+        while not future.done():
+            fraction, message = progress.get()
+            placeholder.progress(fraction, text=message)
+            time.sleep(self.conf.LOAD_PROGRESS_INTERVAL)
+        placeholder.empty()
+
+    def release_shared(self):
+        """Drop the references to the shared data, so the session only keeps its own state."""
+        self.dataset = None
         self.predictions, self.metrics_per_datapoint, self.subset_results = None, None, None
+        self.results_future, self.load_progress = None, None
 
     def get_metadata_given_url_params(self, write_message=True):
         c = self.conf
         group = self.get_param(c.G_GROUP, "", str)
         subset = self.get_param(c.G_SUBSET, "", str)
         search = self.get_param(c.G_SEARCH, "", str)
-        metadata_object, info_text = self.dataset.load_metadata_for_page(
-                group, subset, {c.SEARCH_FIELD: search})
+        with span("load_metadata_for_page"):
+            metadata_object, info_text = self.dataset.load_metadata_for_page(
+                    group, subset, {c.SEARCH_FIELD: search}, search_memo=self.search_memo)
         if write_message:
             st.markdown(info_text)
         return metadata_object
 
+    def get_navigation_index_given_url_params(self) -> NavigationIndex:
+        c = self.conf
+        group = self.get_param(c.G_GROUP, "", str)
+        subset = self.get_param(c.G_SUBSET, "", str)
+        search = self.get_param(c.G_SEARCH, "", str)
+        with span("get_navigation_index"):
+            return self.dataset.get_navigation_index(
+                    group, subset, {c.SEARCH_FIELD: search}, search_memo=self.search_memo)
+
     def get_current_leaf_id(self):
         return self.get_param(self.conf.G_LEAF_ID, "", str)
 
+    @timed("get_results")
     def get_results(self):
+        """Waits until the results are loaded, pages that do not need them can render before."""
+        if self.results_future is not None:
+            if not self.results_future.done():
+                self.render_load_progress(self.results_future, self.load_progress)
+            # raise errors of the loading thread
+            self.results_future.result()
         return self.predictions, self.metrics_per_datapoint, self.subset_results
 
     def get_subsets(self):
         return self.dataset.get_subsets()
 
+    @timed("widgets.pagination_for_leaf")
     def render_pagination_for_leaf(self, metadata_object):
         """
         Returns:
@@ -75,7 +241,10 @@ class DatasetWebsite(BaseWebsite, metaclass=ABCMeta):
         website = self
         c = self.conf
         text_leaf, text_root = self.text_leaf, self.text_root
-        leaf_meta, root_meta, leaf_ids, root_ids, leaf_id2num, root_id2num = metadata_object
+        _leaf_meta, _root_meta, leaf_ids, root_ids, _leaf_id2num, _root_id2num = metadata_object
+        # positions and neighbours are looked up in the index of the current view,
+        # which is built once per view instead of on every click
+        navigation = website.get_navigation_index_given_url_params()
 
         # determine current leaf id
         if len(leaf_ids) == 0:
@@ -83,26 +252,23 @@ class DatasetWebsite(BaseWebsite, metaclass=ABCMeta):
             raise StopRunning
 
         current_leaf_id = website.get_current_leaf_id()
+        leaf_num = navigation.get_leaf_num(current_leaf_id)
         if current_leaf_id == "":
             st.markdown(f"No question id given. Showing the first question.")
-            current_leaf_id = leaf_ids[0]
-        elif current_leaf_id not in leaf_meta:
+            current_leaf_id, leaf_num = leaf_ids[0], 0
+        elif leaf_num is None:
             st.markdown(f"Question {current_leaf_id} not found. Showing the first question.")
-            current_leaf_id = leaf_ids[0]
+            current_leaf_id, leaf_num = leaf_ids[0], 0
 
-        leaf_num = leaf_id2num[current_leaf_id]
-        leaf_item = leaf_meta[current_leaf_id]
-        current_root_id = leaf_item["root_id"]
-        root_num = root_id2num[current_root_id]
+        root_num = navigation.get_root_num(leaf_num)
+        current_root_id = root_ids[root_num]
 
         # create navigation for questions
-        nav_targets = []
-        nav_targets.append(("First", leaf_num > 0, {c.G_LEAF_ID: leaf_ids[0]}))
-        prev_id = leaf_ids[leaf_num - 1] if leaf_num > 0 else None
-        nav_targets.append(("Prev", leaf_num > 0, {c.G_LEAF_ID: prev_id}))
-        next_id = leaf_ids[leaf_num + 1] if leaf_num < len(leaf_ids) - 1 else None
-        nav_targets.append(("Next", leaf_num < len(leaf_ids) - 1, {c.G_LEAF_ID: next_id}))
-        nav_targets.append(("Last", leaf_num < len(leaf_ids) - 1, {c.G_LEAF_ID: leaf_ids[-1]}))
+        first_id, prev_id, next_id, last_id = navigation.get_leaf_targets(leaf_num)
+        nav_targets = [("First", first_id is not None, {c.G_LEAF_ID: first_id}),
+                       ("Prev", prev_id is not None, {c.G_LEAF_ID: prev_id}),
+                       ("Next", next_id is not None, {c.G_LEAF_ID: next_id}),
+                       ("Last", last_id is not None, {c.G_LEAF_ID: last_id})]
         cont = st.container()
         cols = cont.columns([2] + [1] * len(nav_targets), gap="small")
         cols[0].markdown(f"**{text_leaf}** {leaf_num + 1} of {len(leaf_ids)}<br />"
@@ -112,30 +278,12 @@ class DatasetWebsite(BaseWebsite, metaclass=ABCMeta):
             n_text, n_enabled, n_params = nav_target
             website.render_nav_button(n_text, n_enabled, n_params, parent=col)
 
-        # create navigation for images
-        nav_targets = []
-        first_image_qid, prev_image_qid = None, None
-        if root_num > 0:
-            first_image_qid = root_ids[0]
-            first_image_qid = root_meta[first_image_qid]["leaf_ids"][0]
-            prev_image_id = root_ids[root_num - 1]
-            prev_image_qid = root_meta[prev_image_id]["leaf_ids"][0]
-        nav_targets.append((f"First {text_root}", first_image_qid is not None,
-                            {c.G_LEAF_ID: first_image_qid}))
-        nav_targets.append((f"Prev {text_root}", prev_image_qid is not None,
-                            {c.G_LEAF_ID: prev_image_qid}))
-
-        next_leaf_id, last_leaf_id = None, None
-        if root_num < len(root_ids) - 1:
-            next_root_id = root_ids[root_num + 1]
-            next_root_item = root_meta[next_root_id]
-            next_leaf_id = next_root_item["leaf_ids"][0]
-            last_root_id = root_ids[-1]
-            last_leaf_id = root_meta[last_root_id]["leaf_ids"][0]
-        nav_targets.append((
-                f"Next {text_root}", next_leaf_id is not None, {c.G_LEAF_ID: next_leaf_id}))
-        nav_targets.append((
-                f"Last {text_root}", last_leaf_id is not None, {c.G_LEAF_ID: last_leaf_id}))
+        # create navigation for images, to the first question of the image
+        first_id, prev_id, next_id, last_id = navigation.get_root_targets(root_num)
+        nav_targets = [(f"First {text_root}", first_id is not None, {c.G_LEAF_ID: first_id}),
+                       (f"Prev {text_root}", prev_id is not None, {c.G_LEAF_ID: prev_id}),
+                       (f"Next {text_root}", next_id is not None, {c.G_LEAF_ID: next_id}),
+                       (f"Last {text_root}", last_id is not None, {c.G_LEAF_ID: last_id})]
 
         cont = st.container()
         cols = cont.columns([2] + [1] * len(nav_targets), gap="small")
@@ -149,6 +297,68 @@ class DatasetWebsite(BaseWebsite, metaclass=ABCMeta):
 
         return current_leaf_id, current_root_id
 
+    def get_thumbnail_url(self, data) -> Optional[str]:
+        """Static url of an encoded jpeg thumbnail, None if static urls are not used."""
+        if self.static_files is None:
+            return None
+        return self.static_files.get_url_for_data(data, ".jpg")
+
+    def render_thumbnail(self, data, parent=None):
+        """Show an encoded jpeg thumbnail, from a static url if STATIC_URLS is set."""
+        url = self.get_thumbnail_url(data)
+        if url is None:
+            render_image_data(data, "JPEG", parent=parent, use_column_width=False)
+        else:
+            render_image_url(url, parent=parent)
+
+    def render_image_file(self, file: PathType, parent=None):
+        """Show an image file, from a static url if STATIC_URLS is set."""
+        url = None if self.static_files is None else self.static_files.get_url_for_file(file)
+        if url is None:
+            render_image(file, parent=parent, use_column_width=False)
+        else:
+            render_image_url(url, parent=parent)
+
+    @timed("load_thumbnails")
+    def load_thumbnails(self, root_ids: List[str]) -> Dict[str, Any]:
+        """Load the thumbnails of the current page concurrently.
+
+        Returns:
+            {root_id: encoded thumbnail}
+        """
+        dataset = self.dataset
+        return dict(zip(root_ids, self.prefetcher.map(dataset.get_thumbnail_data, root_ids)))
+
+    def prefetch_overview_pages(self, metadata_object, current_root_ids: List[str]):
+        """Warm the thumbnails of the previous and next overview page in the background."""
+        _leaf_meta, _root_meta, _leaf_ids, root_ids, _leaf_id2num, root_id2num = metadata_object
+        perpage = self.conf.PERPAGE
+        start = root_id2num[current_root_ids[0]]
+        end = start + len(current_root_ids)
+        adjacent_root_ids = list(root_ids[end:end + perpage]) + list(
+                root_ids[max(0, start - perpage):start])
+        self.prefetcher.prefetch(self.dataset.get_thumbnail_data, adjacent_root_ids)
+
+    def prefetch_next_leaf(self, metadata_object, current_leaf_id: str):
+        """Warm the image of the next leaf in the background."""
+        leaf_meta, _root_meta, leaf_ids, _root_ids, leaf_id2num, _root_id2num = metadata_object
+        leaf_num = leaf_id2num[current_leaf_id]
+        if leaf_num >= len(leaf_ids) - 1:
+            return
+        next_root_id = leaf_meta[leaf_ids[leaf_num + 1]]["root_id"]
+        if next_root_id == leaf_meta[current_leaf_id]["root_id"]:
+            return
+        dataset = self.dataset
+
+        def _warm_image(root_id):
+            pyramid = dataset.get_image_pyramid(root_id)
+            image_file = dataset.get_display_image_file(root_id) if pyramid is None \
+                else pyramid.display_file
+            image_file.read_bytes()
+
+        self.prefetcher.prefetch(_warm_image, [next_root_id])
+
+    @timed("widgets.pagination_for_overview")
     def render_pagination_for_overview(self, metadata_object) -> List[str]:
         """
         Returns:
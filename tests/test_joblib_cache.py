@@ -0,0 +1,38 @@
+import numpy as np
+
+from streamlit_vis.joblib_ext import get_cache_stats, get_joblib_memory
+
+
+def _make_array(seed: int) -> np.ndarray:
+    return np.full(100_000, seed, dtype=np.int64)
+
+
+def test_mmap_first_call_is_not_a_disk_hit(tmp_path):
+    memory = get_joblib_memory(tmp_path / "cache", verbose=0, mmap_mode="r")
+    make_array = memory.cache(_make_array)
+    for seed in range(6):
+        assert make_array(seed)[0] == seed
+    stats = get_cache_stats(memory)
+    assert stats["misses"] == 6
+    assert stats["disk_hits"] == 0
+    # the buffers are memory-mapped and count towards the memory budget
+    assert stats["memory_bytes"] >= 6 * _make_array(0).nbytes
+    for seed in range(6):
+        assert make_array(seed)[0] == seed
+    assert get_cache_stats(memory)["memory_hits"] == 6
+
+
+def test_disk_eviction_removes_from_memory(tmp_path):
+    max_disk_bytes = 3 * _make_array(0).nbytes
+    memory = get_joblib_memory(tmp_path / "cache", verbose=0, mmap_mode="r",
+                               max_disk_bytes=max_disk_bytes)
+    make_array = memory.cache(_make_array)
+    for seed in range(6):
+        make_array(seed)
+    stats = get_cache_stats(memory)
+    assert stats["disk_evictions"] > 0
+    assert stats["disk_bytes"] <= max_disk_bytes
+    # only the items still on disk are in the memory tier
+    assert stats["memory_items"] == 6 - stats["disk_evictions"]
+    for seed in range(6):
+        assert make_array(seed)[0] == seed
@@ -0,0 +1,36 @@
+import json
+
+from streamlit_vis.columnar import LabelColumn
+from streamlit_vis.json_stream import load_json_labels
+
+
+def test_unhashable_labels():
+    key2num = {"a": 0, "b": 1, "c": 2, "d": 3}
+    column = LabelColumn.empty(key2num)
+    column.set(0, [1, 2])
+    column.set(1, {"x": 1, "y": [2]})
+    column.set(2, [1, 2])
+    column.set(3, {"y": [2], "x": 1})
+    assert column["a"] == [1, 2]
+    assert column["b"] == {"x": 1, "y": [2]}
+    # equal labels share one code
+    assert len(column.labels) == 2
+    assert column.codes[0] == column.codes[2] and column.codes[1] == column.codes[3]
+
+
+def test_labels_keep_their_type():
+    column = LabelColumn.empty({"a": 0, "b": 1, "c": 2})
+    column.set(0, 1)
+    column.set(1, True)
+    column.set(2, [True])
+    column.set(2, [1])
+    assert column["a"] == 1 and column["b"] is True
+    assert len(column.labels) == 4
+
+
+def test_load_json_labels_with_list_predictions(tmp_path):
+    predictions = {"m1": {"a": [1, 2], "b": "yes"}, "m2": {"a": {"k": [1]}, "b": [1, 2]}}
+    file = tmp_path / "preds.json"
+    file.write_text(json.dumps(predictions), encoding="utf-8")
+    columns = load_json_labels(file, {"a": 0, "b": 1})
+    assert {model: dict(column) for model, column in columns.items()} == predictions
@@ -0,0 +1,52 @@
+import threading
+
+from streamlit_vis.thumbnail_pack import PackedThumbnailStore
+
+
+def _thumbnail(root_num: int) -> bytes:
+    return bytes([root_num % 256]) * (100 + root_num)
+
+
+def test_get_from_threads_while_appending(tmp_path):
+    n_roots = 200
+    store = PackedThumbnailStore(tmp_path / "pack.bin", tmp_path / "pack.npy")
+    store.write(n_roots, ((root_num, _thumbnail(root_num)) for root_num in range(0, n_roots, 2)))
+    reader = PackedThumbnailStore(store.data_file, store.index_file)
+    errors = []
+    # views returned earlier are kept, the mappings they point into must stay valid
+    views = []
+
+    def _read():
+        try:
+            for _ in range(20):
+                for root_num in range(n_roots):
+                    view = reader.get(root_num)
+                    if view is not None:
+                        assert bytes(view) == _thumbnail(root_num)
+                        views.append(view)
+                # the data file grew, the reader maps it again
+                reader.open()
+        except Exception as e:  # pylint: disable=broad-except
+            errors.append(e)
+
+    threads = [threading.Thread(target=_read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for root_num in range(1, n_roots, 2):
+        store.write(n_roots, [(root_num, _thumbnail(root_num))])
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+    reader.close()
+    assert all(bytes(reader.get(root_num)) == _thumbnail(root_num) for root_num in range(n_roots))
+
+
+def test_get_with_empty_data_file(tmp_path):
+    store = PackedThumbnailStore(tmp_path / "pack.bin", tmp_path / "pack.npy")
+    store.write(3, [(1, b"")])
+    assert store.data_file.stat().st_size == 0
+    assert len(store) == 3
+    assert store.get(0) is None
+    # nothing can be mapped for an empty data file
+    assert store.get(1) is None
+    assert store.get(5) is None